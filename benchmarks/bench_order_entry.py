@@ -0,0 +1,61 @@
+"""Compare the order-entry round trip of the REST and WebSocket API transports against the local mock exchange.
+
+The mock verifies the request signatures and runs its matching engine but publishes no market data, so the figures
+measure the client, transport and a minimal server.
+
+Usage: python -m benchmarks.bench_order_entry [n_orders]
+"""
+import asyncio
+import statistics
+import sys
+import time
+
+from tradingbot.binancefutures import BinanceFutures
+from tradingbot.mockexchange import MockExchange
+from tradingbot.ratelimit import RateLimiter
+
+API_KEY = 'key'
+API_SECRET = 'secret'
+
+
+async def measure(transport, exchange, n):
+    # Lift the order count limits so the governor does not pace the benchmark.
+    rate_limiter = RateLimiter(order_limit_1m=10 ** 9, order_limit_10s=10 ** 9)
+    bf = BinanceFutures(API_KEY, API_SECRET, 'btcusdt', order_transport=transport, rate_limiter=rate_limiter,
+                        base_url=exchange.base_url, ws_api_url=exchange.ws_api_url)
+    await bf.warm_up(1)
+    latencies = []
+    for i in range(n):
+        start = time.perf_counter()
+        await bf.create_orders({'side': 'Buy', 'price': '%.1f' % (50000 + i % 100), 'quantity': '0.001'})
+        latencies.append(time.perf_counter() - start)
+    if bf.ws_api is not None:
+        await bf.ws_api.close()
+    await bf.client.close()
+    return latencies
+
+
+async def run(n):
+    exchange = MockExchange(api_key=API_KEY, api_secret=API_SECRET, message_rate=0)
+    await exchange.start()
+    try:
+        results = {}
+        for transport in ('rest', 'ws'):
+            results[transport] = await measure(transport, exchange, n)
+    finally:
+        await exchange.stop()
+    return results
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    results = asyncio.run(run(n))
+    for transport, latencies in results.items():
+        latencies = sorted(latencies)
+        print('%-4s n=%d mean=%.0fus p50=%.0fus p99=%.0fus' % (
+            transport, n, statistics.mean(latencies) * 1e6, latencies[len(latencies) // 2] * 1e6,
+            latencies[int(len(latencies) * 0.99)] * 1e6))
+
+
+if __name__ == '__main__':
+    main()
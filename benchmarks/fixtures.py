@@ -0,0 +1,102 @@
+"""Synthetic but realistic fixtures for the benchmarks.
+
+Market data comes from the mock exchange's random-walk book, used offline: a coherent book with Binance u/pu
+sequencing, depth updates touching a handful of levels near the touch and trades at the touch.
+"""
+import random
+
+from tradingbot.binancefutures import LIVE, BinanceFutures
+from tradingbot.codec import json_dumps
+from tradingbot.mockexchange import MockExchange
+
+SYMBOL = 'btcusdt'
+TICK_SIZE = 0.1
+
+
+def market(levels=1000, seed=1):
+    return MockExchange(SYMBOL, tick_size=TICK_SIZE, levels=levels + 1, seed=seed)
+
+
+def depth_frames(market, n, symbol=SYMBOL):
+    """`n` consecutive depthUpdate frames; no update is dropped."""
+    frames = []
+    while len(frames) < n:
+        data = market.depth_update()
+        frames.append(json_dumps({'stream': '%s@depth@0ms' % symbol, 'data': data}))
+    return frames
+
+
+def trade_frames(market, n):
+    return [json_dumps({'stream': '%s@trade' % SYMBOL, 'data': market.trade()}) for _ in range(n)]
+
+
+def order_update_frames(n, seed=1):
+    """ORDER_TRADE_UPDATE frames taking one order after the other through NEW, PARTIALLY_FILLED and FILLED."""
+    rng = random.Random(seed)
+    frames = []
+    time = 1700000000000
+    for i in range(n):
+        time += 1
+        client_order_id = 'bot_bf_%d' % (i // 3)
+        status = ('NEW', 'PARTIALLY_FILLED', 'FILLED')[i % 3]
+        data = {'e': 'ORDER_TRADE_UPDATE', 'E': time, 'T': time,
+                'o': {'s': SYMBOL.upper(), 'c': client_order_id, 'S': rng.choice(('BUY', 'SELL')), 'o': 'LIMIT',
+                      'f': 'GTX', 'q': '0.010', 'p': '%.1f' % (60000 + rng.randint(-50, 50) * TICK_SIZE), 'X': status,
+                      'x': 'TRADE' if i % 3 else 'NEW', 'i': i, 'l': '0.005' if i % 3 else '0',
+                      'z': ('0', '0.005', '0.010')[i % 3], 'T': time}}
+        frames.append(json_dumps({'stream': 'listenkey', 'data': data}))
+    return frames
+
+
+class StubBinanceFutures(BinanceFutures):
+    """BinanceFutures whose order requests are acknowledged locally, so a strategy reaches a steady state."""
+
+    def __init__(self):
+        super().__init__('', '', SYMBOL)
+        self.set_tick_size(TICK_SIZE)
+        self.time = 1700000000000
+        self.order_id = 0
+
+    def __ack(self, order):
+        self.time += 1
+        self.order_id += 1
+        client_order_id = 'bot_bf_%d' % self.order_id
+        return self.open_orders_ws.update({
+            'symbol': SYMBOL.upper(), 'clientOrderId': client_order_id, 'orderId': self.order_id,
+            'side': order['side'].upper(), 'price': self.instrument.format_price(order['tick']),
+            'origQty': self.instrument.format_qty(order['lots']), 'tick': order['tick'],
+            'executedQty': '0', 'cumQty': '0', 'status': 'NEW', 'updateTime': self.time})
+
+    async def create_orders(self, order):
+        return self.__ack(order)
+
+    async def create_bulk_orders(self, orders):
+        return [self.__ack(order) for order in orders]
+
+    async def amend_orders(self, order):
+        self.time += 1
+        return self.open_orders_ws.update({'clientOrderId': order['clientOrderId'],
+                                           'price': self.instrument.format_price(order['tick']),
+                                           'origQty': self.instrument.format_qty(order['lots']), 'tick': order['tick'],
+                                           'status': 'NEW', 'updateTime': self.time})
+
+    async def amend_bulk_orders(self, orders):
+        return [await self.amend_orders(order) for order in orders]
+
+    async def cancel_bulk_orders(self, origClientOrderIdList):
+        self.time += 1
+        return [self.open_orders_ws.update({'clientOrderId': client_order_id, 'status': 'CANCELED',
+                                            'updateTime': self.time})
+                for client_order_id in origClientOrderIdList]
+
+
+def live_bot(market, bot=None):
+    """A bot whose book holds the market's current 1000-level snapshot and is LIVE."""
+    bot = bot if bot is not None else BinanceFutures('', '', SYMBOL)
+    bot.set_tick_size(TICK_SIZE)
+    snapshot = market.snapshot(1000)
+    bot.depth.apply(bot.depth.decode(snapshot['bids']), bot.depth.decode(snapshot['asks']))
+    bot.prev_u = snapshot['lastUpdateId']
+    bot.book_state = LIVE
+    bot.last_price = snapshot['bids'][0][0]
+    return bot
@@ -0,0 +1,424 @@
+"""Microbenchmarks for the hot paths, with JSON output and comparison against a stored baseline.
+
+Usage:
+    python -m benchmarks.suite                          # run, compare with benchmarks/baseline.json
+    python -m benchmarks.suite --output results.json    # also write the results
+    python -m benchmarks.suite --save-baseline          # store the results as the new baseline
+    python -m benchmarks.suite --filter converge --check  # exit with 1 on a change beyond the noise
+
+Every benchmark reports the time per operation; each is run `--repeat` times and the fastest run is compared, as the
+one least disturbed by the rest of the machine. The spread between the runs, (median - fastest) / fastest, is stored
+with the results, and a change only counts as a regression or an improvement if it exceeds both `--threshold` and
+twice the spread of the baseline and of the current run.
+
+This is an aid for comparing changes on one machine, not a regression gate. On a shared or single core machine even
+the fastest run drifts by tens of percent between sessions, more than the spread within a session shows; there,
+compare before and after a change in the same session and re-run anything flagged. --check is only meaningful against a
+baseline stored on the same quiet machine.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from collections import deque
+from multiprocessing import resource_tracker
+
+from benchmarks import fixtures
+from tradingbot import custom_strategy, gridtrading
+from tradingbot.binancefutures import BinanceFutures
+from tradingbot.multisymbol import MultiSymbolBinanceFutures
+from tradingbot.sharedfeed import SharedBookReader, SharedBookWriter, tracker_name
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# name -> async function returning the seconds per operation of one run
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+
+###
+# BinanceFutures.__on_message
+###
+
+async def on_message(frames, bot):
+    handle = bot._BinanceFutures__on_message
+    start = time.perf_counter()
+    for frame in frames:
+        await handle(frame)
+    elapsed = time.perf_counter() - start
+    await bot.client.close()
+    return elapsed / len(frames)
+
+
+@benchmark('on_message.depthUpdate')
+async def bench_on_message_depth():
+    market = fixtures.market()
+    bot = fixtures.live_bot(market)
+    return await on_message(fixtures.depth_frames(market, 20000), bot)
+
+
+@benchmark('on_message.trade')
+async def bench_on_message_trade():
+    market = fixtures.market()
+    bot = fixtures.live_bot(market)
+    return await on_message(fixtures.trade_frames(market, 20000), bot)
+
+
+@benchmark('on_message.ORDER_TRADE_UPDATE')
+async def bench_on_message_order_update():
+    bot = fixtures.live_bot(fixtures.market())
+    return await on_message(fixtures.order_update_frames(20000), bot)
+
+
+@benchmark('on_message.multi_symbol.30_symbols')
+async def bench_on_message_multi_symbol():
+    """depthUpdate frames of 30 symbols interleaved on one connection and routed to their books."""
+    symbols = ['sym%dusdt' % i for i in range(30)]
+    connection = MultiSymbolBinanceFutures('', '', symbols)
+    streams = []
+    for i, symbol in enumerate(symbols):
+        market = fixtures.market(levels=200, seed=i)
+        fixtures.live_bot(market, connection.bots[symbol])
+        streams.append(fixtures.depth_frames(market, 700, symbol))
+    frames = [frame for frames in zip(*streams) for frame in frames]
+    handle = connection._MultiSymbolBinanceFutures__on_message
+    start = time.perf_counter()
+    for frame in frames:
+        await handle(frame)
+    elapsed = time.perf_counter() - start
+    await connection.client.close()
+    return elapsed / len(frames)
+
+
+@benchmark('on_message.redundant.2_links')
+async def bench_on_message_redundant():
+    """Every depthUpdate received over two links, the copy on the second one dropped as a duplicate; per frame."""
+    market = fixtures.market()
+    bot = fixtures.live_bot(market, BinanceFutures('', '', fixtures.SYMBOL, market_data_connections=2))
+    handle = bot._BinanceFutures__on_link_message
+    first, second = bot.links
+    frames = fixtures.depth_frames(market, 10000)
+    start = time.perf_counter()
+    for frame in frames:
+        await handle(frame, first)
+        await handle(frame, second)
+    elapsed = time.perf_counter() - start
+    await bot.client.close()
+    return elapsed / (2 * len(frames))
+
+
+async def message_queue(frames, bot):
+    """Queue the frames, then drain the queue; per frame."""
+    queue = bot.message_queue
+    start = time.perf_counter()
+    for frame in frames:
+        queue.put(frame)
+    while queue.frames:
+        queue.drain()
+    elapsed = time.perf_counter() - start
+    await bot.client.close()
+    return elapsed / len(frames)
+
+
+@benchmark('message_queue.depthUpdate')
+async def bench_message_queue_depth():
+    """depthUpdate frames through the message queue, in batches of 100."""
+    market = fixtures.market()
+    bot = fixtures.live_bot(market, BinanceFutures('', '', fixtures.SYMBOL, message_batch=100))
+    return await message_queue(fixtures.depth_frames(market, 20000), bot)
+
+
+@benchmark('message_queue.conflated.depthUpdate')
+async def bench_message_queue_conflated():
+    """A backlog of depthUpdate frames conflated into one update."""
+    market = fixtures.market()
+    bot = fixtures.live_bot(market, BinanceFutures('', '', fixtures.SYMBOL, message_batch=100, conflate_lag=0.0))
+    return await message_queue(fixtures.depth_frames(market, 20000), bot)
+
+
+###
+# Shared memory feed
+###
+
+@benchmark('shared_feed.publish_depthUpdate')
+async def bench_shared_feed_publish():
+    """on_message of a depthUpdate including its publication into shared memory."""
+    market = fixtures.market()
+    bot = fixtures.live_bot(market)
+    writer = SharedBookWriter(fixtures.SYMBOL, fixtures.TICK_SIZE, name='tradingbot-bench-%d' % os.getpid())
+    writer.attach(bot)
+    try:
+        return await on_message(fixtures.depth_frames(market, 20000), bot)
+    finally:
+        writer.close()
+
+
+@benchmark('shared_feed.read_top_5')
+async def bench_shared_feed_read():
+    """A consistent read of the 5 best levels per side by a strategy process."""
+    market = fixtures.market()
+    bot = fixtures.live_bot(market)
+    name = 'tradingbot-bench-%d' % os.getpid()
+    writer = SharedBookWriter(fixtures.SYMBOL, fixtures.TICK_SIZE, name=name)
+    writer.attach(bot)
+    await on_message(fixtures.depth_frames(market, 10), bot)
+    reader = SharedBookReader(name)
+    # The reader and the writer are in the same process here: hand the block back to the resource tracker.
+    resource_tracker.register(tracker_name(reader.shm), 'shared_memory')
+
+    def top(book):
+        return book.bids(5), book.asks(5)
+
+    n = 20000
+    try:
+        start = time.perf_counter()
+        for _ in range(n):
+            reader.read(top)
+        return (time.perf_counter() - start) / n
+    finally:
+        reader.close()
+        writer.close()
+
+
+###
+# Snapshot merge
+###
+
+@benchmark('snapshot.merge_1000')
+async def bench_snapshot_merge():
+    """Merge a 1000-level snapshot into a populated book and bridge it with 10 buffered updates."""
+    market = fixtures.market()
+    bot = fixtures.live_bot(market)
+    snapshot = market.snapshot(1000)
+    updates = []
+    for frame in fixtures.depth_frames(market, 10):
+        data = json.loads(frame)['data']
+        data['b'] = bot.depth.decode(data['b'])
+        data['a'] = bot.depth.decode(data['a'])
+        updates.append(data)
+    # The snapshot predates the buffered updates by one update id, so the first one bridges it.
+    snapshot['lastUpdateId'] = updates[0]['u']
+
+    async def get_depth_snapshot(limit=1000):
+        return snapshot
+
+    bot.get_depth_snapshot = get_depth_snapshot
+    merge = bot._BinanceFutures__get_marketdepth_snapshot
+    n = 200
+    elapsed = 0.0
+    for _ in range(n):
+        bot.pending_messages = deque(updates)
+        bot.resync_started = time.time()
+        start = time.perf_counter()
+        await merge()
+        elapsed += time.perf_counter() - start
+    await bot.client.close()
+    return elapsed / n
+
+
+###
+# OrderManager.converge_orders
+###
+
+def converge_setup(levels, overlap):
+    """A bot with `levels` resting orders per side and desired orders of which a fraction `overlap` is unchanged."""
+    bot = fixtures.StubBinanceFutures()
+    manager = custom_strategy.CustomOrderManager()
+    manager.binance_futures = bot
+    manager.tick_size = fixtures.TICK_SIZE
+    existing_buys = [{'tick': 599999 - i * 5, 'lots': 1, 'side': 'Buy'} for i in range(levels)]
+    existing_sells = [{'tick': 600001 + i * 5, 'lots': 1, 'side': 'Sell'} for i in range(levels)]
+    kept = int(levels * overlap)
+
+    def desired():
+        # The first `kept` levels stay, the rest move by one tick.
+        buys = [{'tick': 599999 - i * 5 - (0 if i < kept else 1), 'lots': 1, 'side': 'Buy'} for i in range(levels)]
+        sells = [{'tick': 600001 + i * 5 + (0 if i < kept else 1), 'lots': 1, 'side': 'Sell'} for i in range(levels)]
+        return buys, sells
+
+    return bot, manager, existing_buys, existing_sells, desired
+
+
+def make_converge_benchmark(levels, overlap):
+    async def run():
+        bot, manager, existing_buys, existing_sells, desired = converge_setup(levels, overlap)
+        n = 300
+        elapsed = 0.0
+        for _ in range(n):
+            # Reset to the existing orders, then time one converge towards the desired ones.
+            bot.open_orders_ws.clear()
+            await bot.create_bulk_orders([dict(order) for order in existing_buys])
+            await bot.create_bulk_orders([dict(order) for order in existing_sells])
+            buys, sells = desired()
+            start = time.perf_counter()
+            await manager.converge_orders(buys, sells)
+            elapsed += time.perf_counter() - start
+        await bot.client.close()
+        return elapsed / n
+    return run
+
+
+for _levels in (5, 20, 60):
+    for _overlap in (0.0, 0.5, 1.0):
+        BENCHMARKS['converge_orders.%d_levels.%d%%_overlap' % (_levels, _overlap * 100)] = \
+            make_converge_benchmark(_levels, _overlap)
+
+
+###
+# place_orders cycles
+###
+
+async def place_orders_cycle(manager_class, market):
+    bot = fixtures.live_bot(market, fixtures.StubBinanceFutures())
+    manager = manager_class()
+    manager.binance_futures = bot
+    manager.tick_size = fixtures.TICK_SIZE
+    frames = fixtures.depth_frames(market, 2000)
+    handle = bot._BinanceFutures__on_message
+    # Reach the steady state first: the strategy's orders are resting.
+    await manager.place_orders()
+    n = len(frames)
+    elapsed = 0.0
+    for frame in frames:
+        await handle(frame)
+        start = time.perf_counter()
+        await manager.place_orders()
+        elapsed += time.perf_counter() - start
+    await bot.client.close()
+    return elapsed / n
+
+
+@benchmark('place_orders.custom_strategy')
+async def bench_place_orders_custom():
+    market = fixtures.market()
+    return await place_orders_cycle(custom_strategy.CustomOrderManager, market)
+
+
+@benchmark('place_orders.gridtrading')
+async def bench_place_orders_grid():
+    market = fixtures.market()
+    return await place_orders_cycle(gridtrading.CustomOrderManager, market)
+
+
+###
+# Runner
+###
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except OSError:
+        return None
+
+
+async def run_once(name):
+    # Like timeit, keep the garbage collector from adding noise.
+    gc.collect()
+    gc.disable()
+    try:
+        return await BENCHMARKS[name]()
+    finally:
+        gc.enable()
+
+
+async def run(names, repeat):
+    results = {}
+    for name in names:
+        times = [await run_once(name) for _ in range(repeat)]
+        results[name] = {'median_us': statistics.median(times) * 1e6, 'best_us': min(times) * 1e6,
+                         'spread': statistics.median(times) / min(times) - 1}
+        print('%-45s %10.2f us/op  spread %5.1f%%' % (name, results[name]['best_us'], results[name]['spread'] * 100),
+              file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print the fastest runs, current vs baseline; returns the names that regressed by more than `threshold` and twice
+       the spread between runs."""
+    regressions = []
+    print('%-45s %12s %12s %9s %10s' % ('benchmark', 'baseline us', 'current us', 'change', 'threshold'))
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print('%-45s %12s %12.2f %9s' % (name, '-', result['best_us'], 'new'))
+            continue
+        # Baselines stored before the spread was recorded count as noise-free.
+        limit = max(threshold, 2 * base.get('spread', 0.0), 2 * result['spread'])
+        change = result['best_us'] / base['best_us'] - 1
+        flag = ''
+        if change > limit:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        elif change < -limit:
+            flag = '  improved'
+        print('%-45s %12.2f %12.2f %+8.1f%% %9.1f%%%s' % (name, base['best_us'], result['best_us'], change * 100,
+                                                          limit * 100, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filter', default='', help='only run benchmarks whose name contains this')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative slowdown reported as a regression')
+    parser.add_argument('--check', action='store_true',
+                        help='exit with status 1 if anything regressed beyond the noise (advisory, see above)')
+    args = parser.parse_args()
+
+    # The strategies log every cycle and a resync logs a warning.
+    logging.basicConfig(level=logging.ERROR)
+    names = [name for name in BENCHMARKS if args.filter in name]
+    results = asyncio.run(run(names, args.repeat))
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'commit': git_commit(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline['results'], args.threshold)
+    if args.save_baseline:
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                stored = json.load(f)
+            # Keep the entries of benchmarks that were filtered out.
+            stored['results'].update(results)
+            stored['meta'] = report['meta']
+            report = stored
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if args.check and regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
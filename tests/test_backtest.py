@@ -0,0 +1,138 @@
+import asyncio
+import json
+
+from benchmarks import fixtures
+from tradingbot.backtest import (Backtest, ConstantLatency, ProbQueueModel, RiskAverseQueueModel, SimulatedExchange,
+                                 SimulatedOrder)
+from tradingbot.binancefutures import RESYNC_BACKOFF
+from tradingbot.codec import json_dumps
+from tradingbot.gridtrading import CustomOrderManager
+from tradingbot.orderbook import OrderBook
+from tradingbot.ordermanager import OrderManager
+from tradingbot.recorder import FRAME, SNAPSHOT, Recorder, recorded_files, write_records
+
+T0 = 1700000000000000000
+MS = 1000000
+
+
+class Bot:
+    """Collects the events a SimulatedExchange sends to the bot."""
+
+    def __init__(self):
+        self.events = []
+        self.handlers = {'ORDER_TRADE_UPDATE': self.events.append, 'ACCOUNT_UPDATE': self.events.append}
+
+
+def exchange_with_book(queue_model=None):
+    book = OrderBook(0.1)
+    book.apply([(1000, 2.0), (999, 1.0)], [(1001, 1.0)])
+    exchange = SimulatedExchange('btcusdt', book, ConstantLatency(0.005, 0.005), queue_model)
+    exchange.bot = Bot()
+    exchange.now = T0
+    return exchange
+
+
+def place(exchange, client_order_id, price, qty='0.5', side='BUY', time_in_force='GTC'):
+    return exchange.submit('order.place', {'newClientOrderId': client_order_id, 'side': side, 'price': price,
+                                           'quantity': qty, 'timeInForce': time_in_force})
+
+
+def test_queue_models():
+    order = SimulatedOrder('a', 1, 'BUY', 100.0, 1000, 1.0, 'GTC')
+    order.queue_ahead = order.level_qty = 4.0
+    # Risk averse: cancels come from behind us until the level is smaller than the quantity ahead.
+    RiskAverseQueueModel().on_level(order, 3.0)
+    assert order.queue_ahead == 3.0
+    order.queue_ahead = order.level_qty = 4.0
+    RiskAverseQueueModel().on_level(order, 5.0)
+    assert (order.queue_ahead, order.level_qty) == (4.0, 5.0)
+    RiskAverseQueueModel().on_level(order, 2.0)
+    assert order.queue_ahead == 2.0
+    # Probabilistic: 1 of 4 ahead, 3 behind; f = x ** 2 puts 1/10 of a decrease ahead of us.
+    order.queue_ahead, order.level_qty = 1.0, 4.0
+    ProbQueueModel(power=2).on_level(order, 2.0)
+    assert abs(order.queue_ahead - (1.0 - 2.0 * 1 / 10)) < 1e-12
+    assert order.level_qty == 2.0
+
+
+def test_orders_rest_in_the_queue_and_fill_after_the_latency():
+    exchange = exchange_with_book()
+    result = place(exchange, 'a', '100.0')
+    assert result['status'] == 'NEW'
+    # Crossing post-only orders expire, crossing GTC orders take liquidity.
+    place(exchange, 'gtx', '100.1', time_in_force='GTX')
+    place(exchange, 'taker', '100.2', qty='0.1')
+    assert exchange.resting['BUY'] == {}
+    exchange.advance(T0 + 5 * MS)
+    order = exchange.orders['a']
+    assert order.resting and order.queue_ahead == 2.0
+    assert exchange.orders['gtx'].status == 'EXPIRED'
+    assert exchange.orders['taker'].status == 'FILLED'
+    _, side, price, qty, fee, maker = exchange.fills[-1]
+    assert (side, round(price, 1), qty, maker) == ('BUY', 100.1, 0.1, False)
+    assert abs(fee - price * qty * 0.0004) < 1e-12
+    # A sell of 2.3 at our price uses up the 2.0 ahead of us and fills 0.3.
+    exchange.on_trade(100.0, 2.3, True)
+    assert order.status == 'PARTIALLY_FILLED' and abs(order.executed - 0.3) < 1e-12
+    # A trade through our price fills the rest.
+    exchange.on_trade(99.9, 0.01, True)
+    assert order.status == 'FILLED'
+    assert abs(exchange.position - 0.6) < 1e-12
+    # The events reach the bot after the response latency.
+    events = exchange.bot.events
+    assert events == []
+    exchange.advance(T0 + 10 * MS)
+    statuses = [event['o']['X'] for event in events if event['e'] == 'ORDER_TRADE_UPDATE' and event['o']['c'] == 'a']
+    assert statuses == ['NEW', 'PARTIALLY_FILLED', 'FILLED']
+    assert events[-1]['a']['P'][0]['pa'] == '0.6'
+
+
+class BidAtTheTouch(OrderManager):
+    async def place_orders(self):
+        await self.converge_orders([{'price': self.binance_futures.depth.best_bid, 'quantity': 0.001}], [])
+
+
+def depth_update(U, u, pu, bids=(), asks=()):
+    return json.dumps({'stream': 'btcusdt@depth@0ms', 'data': {'e': 'depthUpdate', 'U': U, 'u': u, 'pu': pu,
+                                                               'b': list(bids), 'a': list(asks)}})
+
+
+def test_replay_through_a_strategy(tmp_path):
+    recorder = Recorder(str(tmp_path))
+    recorder.record(FRAME, depth_update(99, 101, 98, [['100.0', '1']], [['100.1', '1']]), T0)
+    # Older than the buffered update: retried with the next snapshot in the recording.
+    recorder.record(SNAPSHOT, json.dumps({'lastUpdateId': 50, 'bids': [['100.0', '2']], 'asks': [['100.1', '2']]}),
+                    T0 + 1 * MS)
+    recorder.record(SNAPSHOT, json.dumps({'lastUpdateId': 100, 'bids': [['100.0', '2']], 'asks': [['100.1', '2']]}),
+                    T0 + 2 * MS)
+    recorder.record(FRAME, depth_update(102, 102, 101, [['99.9', '1']]), T0 + 10 * MS)
+    recorder.record(FRAME, depth_update(103, 103, 102), T0 + 20 * MS)
+    recorder.record(FRAME, json.dumps({'stream': 'btcusdt@trade',
+                                       'data': {'e': 'trade', 'p': '100.0', 'q': '3', 'm': True}}), T0 + 30 * MS)
+    recorder.record(FRAME, depth_update(104, 104, 103), T0 + 40 * MS)
+    recorder.close()
+    backtest = Backtest(BidAtTheTouch, recorded_files(str(tmp_path)), symbol='btcusdt', tick_size=0.1,
+                        event_driven=False, loop_interval=10, sample_interval=0.001, post_only=True)
+    result = asyncio.run(backtest.run())
+    summary = result.summary()
+    assert summary['messages'] == 5
+    assert summary['fills'] == summary['maker_fills'] == 1
+    assert summary['final_position'] == 0.001
+    assert result.fills[0][:4] == (T0 + 30 * MS, 'BUY', 100.0, 0.001)
+    # The stale snapshot did not hold the replay up in real time.
+    assert result.elapsed < RESYNC_BACKOFF
+
+
+def test_snapshot_recorded_before_the_updates(tmp_path):
+    """The live bot requests the snapshot once subscribed, so it can be recorded ahead of every update; the replay
+       still syncs the book from it."""
+    market = fixtures.market()
+    records = [(SNAPSHOT, T0, json_dumps(market.snapshot(1000)))]
+    for i, frame in enumerate(fixtures.depth_frames(market, 200)):
+        records.append((FRAME, T0 + (i + 1) * MS, frame))
+    path = str(tmp_path / 'btcusdt.bfr')
+    write_records(records, path)
+    backtest = Backtest(CustomOrderManager, [path], symbol=fixtures.SYMBOL, tick_size=fixtures.TICK_SIZE)
+    result = asyncio.run(backtest.run())
+    assert result.messages == 200
+    assert len(result.mids) > 0
@@ -0,0 +1,69 @@
+import asyncio
+import json
+import sys
+
+from benchmarks import suite
+
+
+def result(best_us, spread=0.0):
+    return {'best_us': best_us, 'median_us': best_us * (1 + spread), 'spread': spread}
+
+
+def test_compare_flags_changes_beyond_the_noise(capsys):
+    baseline = {
+        'steady': result(100.0, 0.02),
+        'noisy': result(100.0, 0.3),
+        'faster': result(100.0, 0.02),
+        # Stored before the spread was recorded.
+        'old': {'best_us': 100.0, 'median_us': 110.0},
+    }
+    results = {
+        'steady': result(115.0, 0.02),
+        'noisy': result(150.0, 0.02),
+        'faster': result(80.0, 0.02),
+        'old': result(105.0, 0.01),
+        'added': result(10.0),
+    }
+    assert suite.compare(results, baseline, threshold=0.1) == ['steady']
+    lines = {line.split()[0]: line for line in capsys.readouterr().out.splitlines()[1:]}
+    # 50% slower, but within twice the 30% spread of the baseline.
+    assert 'REGRESSION' not in lines['noisy'] and '60.0%' in lines['noisy']
+    assert lines['faster'].endswith('improved')
+    assert lines['added'].split()[-1] == 'new'
+    assert not lines['old'].endswith(('REGRESSION', 'improved'))
+
+
+def test_run_reports_the_fastest_run_and_the_spread(monkeypatch):
+    times = iter([0.003, 0.001, 0.002, 0.004, 0.002])
+
+    async def fake():
+        return next(times)
+    monkeypatch.setitem(suite.BENCHMARKS, 'fake', fake)
+    results = asyncio.run(suite.run(['fake'], 5))
+    assert results['fake']['best_us'] == 1000.0
+    assert results['fake']['median_us'] == 2000.0
+    assert results['fake']['spread'] == 1.0
+
+
+def test_save_baseline_keeps_the_benchmarks_filtered_out(monkeypatch, tmp_path):
+    async def fake():
+        return 0.001
+    monkeypatch.setitem(suite.BENCHMARKS, 'fake.op', fake)
+    path = tmp_path / 'baseline.json'
+    path.write_text(json.dumps({'meta': {}, 'results': {'other': result(5.0), 'fake.op': result(9999.0)}}))
+    monkeypatch.setattr(sys, 'argv', ['suite', '--filter', 'fake.op', '--repeat', '2', '--baseline', str(path),
+                                      '--save-baseline'])
+    suite.main()
+    stored = json.loads(path.read_text())
+    assert stored['results']['other'] == result(5.0)
+    assert stored['results']['fake.op'] == result(1000.0)
+    assert stored['meta']['repeat'] == 2
+    # A regression against the stored baseline fails --check.
+    monkeypatch.setitem(suite.BENCHMARKS, 'fake.op', lambda: asyncio.sleep(0, 0.002))
+    monkeypatch.setattr(sys, 'argv', ['suite', '--filter', 'fake.op', '--repeat', '2', '--baseline', str(path),
+                                      '--check'])
+    try:
+        suite.main()
+        assert False, 'no exit'
+    except SystemExit as e:
+        assert e.code == 1
@@ -0,0 +1,93 @@
+import asyncio
+
+from tradingbot import settings
+from tradingbot.orderbook import OrderBook
+from tradingbot.ordermanager import OrderManager
+
+
+class Market:
+    """The parts of BinanceFutures an event-driven strategy reads."""
+
+    def __init__(self):
+        self.depth = OrderBook(0.1)
+        self.depth.apply([(1000, 1.0)], [(1001, 1.0)])
+        self.running_qty = '0'
+        self.update_event = asyncio.Event()
+        self.last_update_time = None
+
+
+class CountingManager(OrderManager):
+    def __init__(self, binance_futures):
+        self.binance_futures = binance_futures
+        self.run = True
+        self.quote_state = None
+        self.calls = 0
+
+    async def place_orders(self):
+        self.calls += 1
+
+
+def test_burst_is_coalesced(monkeypatch):
+    """Updates arriving faster than MIN_ORDER_INTERVAL make one place_orders call per interval."""
+    monkeypatch.setattr(settings, 'LOOP_INTERVAL', 10)
+    monkeypatch.setattr(settings, 'MIN_ORDER_INTERVAL', 0.05)
+
+    async def run():
+        market = Market()
+        manager = CountingManager(market)
+        task = asyncio.create_task(manager.run_event_driven())
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for i in range(50):
+            market.depth.update_bid(1000 + i % 2, 1.0 + i)
+            market.depth.update_bid(1001, 0.0 if i % 2 else 1.0)
+            market.update_event.set()
+            await asyncio.sleep(0.002)
+        await asyncio.sleep(0.06)
+        elapsed = loop.time() - start
+        manager.run = False
+        market.update_event.set()
+        await task
+        # The first call at once, then at most one per interval, and one more as the loop stops.
+        assert 2 <= manager.calls <= elapsed / 0.05 + 2
+    asyncio.run(run())
+
+
+def test_no_call_without_a_material_change(monkeypatch):
+    monkeypatch.setattr(settings, 'LOOP_INTERVAL', 0.05)
+    monkeypatch.setattr(settings, 'MIN_ORDER_INTERVAL', 0)
+
+    async def run():
+        market = Market()
+        manager = CountingManager(market)
+        task = asyncio.create_task(manager.run_event_driven())
+        await asyncio.sleep(0)
+        market.update_event.set()
+        await asyncio.sleep(0.01)
+        assert manager.calls == 1
+        # Quantity changes behind the touch are not material.
+        for _ in range(5):
+            market.depth.update_bid(990, 2.0)
+            market.update_event.set()
+            await asyncio.sleep(0.005)
+        assert manager.calls == 1
+        # LOOP_INTERVAL is still a heartbeat.
+        await asyncio.sleep(0.06)
+        assert manager.calls == 2
+        manager.run = False
+        await task
+    asyncio.run(run())
+
+
+def test_default_material_change():
+    market = Market()
+    manager = CountingManager(market)
+    assert manager.material_change()
+    assert not manager.material_change()
+    market.depth.update_ask(1005, 1.0)
+    assert not manager.material_change()
+    market.depth.update_bid(1000, 0.0)
+    assert manager.material_change()
+    market.running_qty = '0.001'
+    assert manager.material_change()
+    assert not manager.material_change()
@@ -0,0 +1,67 @@
+import math
+import random
+
+from tradingbot.features import BookFeatures
+from tradingbot.orderbook import OrderBook
+
+
+def band_volume(book, depth):
+    """Band volumes summed over the whole book."""
+    mid = book.mid
+    bid_prices, bid_qtys = book.bids()
+    ask_prices, ask_qtys = book.asks()
+    return (float(bid_qtys[bid_prices > mid * (1 - depth)].sum()),
+            float(ask_qtys[ask_prices < mid * (1 + depth)].sum()))
+
+
+def random_update(rng, book):
+    """A depth update around the touch, moving the mid now and then."""
+    mid = round(book.mid / book.tick_size) if book.best_bid_tick is not None else 10000
+    bids = [(mid - rng.randint(1, 60), rng.choice((0.0, rng.uniform(0.1, 5)))) for _ in range(rng.randint(1, 6))]
+    asks = [(mid + rng.randint(1, 60), rng.choice((0.0, rng.uniform(0.1, 5)))) for _ in range(rng.randint(1, 6))]
+    return bids, asks
+
+
+def test_band_volumes_match_a_full_recompute():
+    rng = random.Random(1)
+    book = OrderBook(0.1)
+    features = BookFeatures(book, bands=(0.001, 0.003))
+    book.apply([(10000 - i, 1.0) for i in range(1, 100)], [(10000 + i, 1.0) for i in range(100)])
+    for _ in range(2000):
+        book.apply(*random_update(rng, book))
+        for depth in (0.001, 0.003):
+            expected = band_volume(book, depth)
+            actual = features.band_volume(depth)
+            assert math.isclose(actual[0], expected[0], abs_tol=1e-6)
+            assert math.isclose(actual[1], expected[1], abs_tol=1e-6)
+
+
+def test_band_registered_on_first_use_and_after_a_snapshot():
+    book = OrderBook(0.1)
+    features = BookFeatures(book)
+    book.apply([(9999, 1.0), (9990, 2.0), (9900, 3.0)], [(10001, 4.0), (10010, 5.0)])
+    assert features.band_volume(0.002) == band_volume(book, 0.002) == (3.0, 9.0)
+    # A snapshot merge clears inside its range and rebuilds the bands.
+    book.clear_inside(9990, 10010)
+    book.apply([(9995, 7.0)], [(10005, 8.0)])
+    assert features.band_volume(0.002) == band_volume(book, 0.002) == (7.0, 8.0)
+
+
+def test_imbalance_and_microprice():
+    book = OrderBook(0.1)
+    features = BookFeatures(book)
+    assert features.imbalance == 0.0
+    assert math.isnan(features.microprice)
+    book.apply([(1000, 3.0)], [(1002, 1.0)])
+    assert features.imbalance == 0.5
+    # Weighted towards the lighter side.
+    assert math.isclose(features.microprice, 100.15)
+
+
+def test_bands_follow_levels_dropped_by_the_book():
+    """Levels the book drops as the mid moves beyond its span leave the bands consistent."""
+    book = OrderBook(0.1, capacity=64, max_span=1024)
+    features = BookFeatures(book, bands=(0.5,))
+    for tick in range(1000, 5000, 10):
+        book.apply([(tick, 1.0)], [(tick + 1, 1.0), (tick - 9, 0.0)])
+        assert features.band_volume(0.5) == band_volume(book, 0.5)
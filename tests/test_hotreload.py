@@ -0,0 +1,90 @@
+import asyncio
+import os
+import sys
+
+from tradingbot import hotreload
+from tradingbot.hotreload import FileWatcher
+from tradingbot.ordermanager import OrderManager
+
+STRATEGY = '''from tradingbot.ordermanager import OrderManager
+
+
+class Strategy(OrderManager):
+    version = %d
+
+    async def place_orders(self):
+        pass
+'''
+
+
+async def watch(paths, changes, **kwargs):
+    """Start a FileWatcher on `paths`, apply each change function, and return the sets of paths reported."""
+    reported = []
+    watcher = FileWatcher(paths, reported.append, **kwargs)
+    watcher.start()
+    for change in changes:
+        change()
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(watcher.debounce + 2 * watcher.poll_interval + 0.1)
+    watcher.close()
+    return reported
+
+
+def test_changes_are_reported_together_after_the_debounce(tmp_path):
+    watched, other = str(tmp_path / 'settings.py'), str(tmp_path / 'other.py')
+    for path in (watched, other):
+        open(path, 'w').close()
+
+    def write():
+        with open(watched, 'a') as f:
+            f.write('A = 1\n')
+
+    def replace():
+        # Written to a new file and renamed over the old one, as many editors save.
+        with open(watched + '.tmp', 'w') as f:
+            f.write('A = 2\n')
+        os.replace(watched + '.tmp', watched)
+
+    def touch_other():
+        with open(other, 'a') as f:
+            f.write('B = 1\n')
+    reported = asyncio.run(watch([watched], [write, replace, touch_other], debounce=0.1, poll_interval=0.05))
+    assert reported == [{watched}]
+
+
+def test_modification_times_are_polled_without_inotify(tmp_path, monkeypatch):
+    monkeypatch.setattr(hotreload, 'load_inotify', lambda: None)
+    path = str(tmp_path / 'custom_strategy.py')
+    open(path, 'w').close()
+    mtime = os.stat(path).st_mtime_ns
+    reported = asyncio.run(watch([path], [lambda: os.utime(path, ns=(mtime + 10 ** 9, mtime + 10 ** 9))],
+                                 debounce=0.05, poll_interval=0.05))
+    assert reported == [{path}]
+
+
+def test_reload_switches_the_managers_to_the_new_class(tmp_path, monkeypatch):
+    path = str(tmp_path / 'reloaded_strategy.py')
+    with open(path, 'w') as f:
+        f.write(STRATEGY % 1)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, 'reloaded_strategy', raising=False)
+    import reloaded_strategy
+    managers = [reloaded_strategy.Strategy.__new__(reloaded_strategy.Strategy) for _ in range(2)]
+    for manager in managers:
+        manager.managers = managers
+    # Code that fails to load is logged and the running code kept.
+    with open(path, 'w') as f:
+        f.write('class Strategy(:\n')
+    managers[0].reload({path})
+    assert managers[0].next_class is None
+    assert sys.modules['reloaded_strategy'] is reloaded_strategy
+    with open(path, 'w') as f:
+        f.write(STRATEGY % 2)
+    managers[0].reload({path})
+    new_class = sys.modules['reloaded_strategy'].Strategy
+    assert new_class.version == 2 and issubclass(new_class, OrderManager)
+    assert [manager.next_class for manager in managers] == [new_class, new_class]
+    # A change to a file of no loaded module is ignored.
+    managers[1].next_class = None
+    managers[1].reload({str(tmp_path / 'notes.txt')})
+    assert managers[1].next_class is None
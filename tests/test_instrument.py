@@ -0,0 +1,58 @@
+import asyncio
+
+import aiohttp
+
+from tradingbot.binancefutures import BinanceFutures
+from tradingbot.instrument import Instrument, decimals, format_fixed
+from tradingbot.mockexchange import MockExchange
+
+
+def test_prices_and_quantities_are_formatted_exactly():
+    assert (decimals('0.10'), decimals(0.001), decimals('1'), decimals(1e-8)) == (1, 3, 0, 8)
+    assert (format_fixed(6000010, 2), format_fixed(-5, 3), format_fixed(42, 0)) == ('60000.10', '-0.005', '42')
+    instrument = Instrument('BTCUSDT', '0.10', '0.001')
+    # 600001 * 0.1 is 60000.100000000006 as a float.
+    assert instrument.format_price(600001) == '60000.1'
+    assert instrument.price_to_tick(600001 * 0.1) == 600001
+    assert instrument.format_qty(instrument.qty_to_lots(0.0019)) == '0.001'
+    # A quantity a hair below a lot boundary is the boundary.
+    assert instrument.qty_to_lots(0.3) == instrument.qty_to_lots(0.1 + 0.2) == 300
+    assert instrument.qty_to_lots(0.0016, nearest=True) == 2
+    assert Instrument('SHIBUSDT', '0.000001', '1').format_price(12345) == '0.012345'
+
+
+def test_from_symbol_info_reads_the_price_and_lot_filters():
+    instrument = Instrument.from_symbol_info({'symbol': 'ETHUSDT', 'filters': [
+        {'filterType': 'PRICE_FILTER', 'tickSize': '0.01'},
+        {'filterType': 'MARKET_LOT_SIZE', 'stepSize': '1'},
+        {'filterType': 'LOT_SIZE', 'stepSize': '0.010'}]})
+    assert (instrument.tick_size, instrument.step_size) == (0.01, 0.01)
+    assert (instrument.format_price(123456), instrument.format_qty(7)) == ('1234.56', '0.07')
+    # Without a LOT_SIZE filter the quantity keeps three decimals.
+    assert Instrument.from_symbol_info({'symbol': 'X', 'filters': [{'tickSize': '0.5'}]}).step_size == 0.001
+    try:
+        Instrument.from_symbol_info({'symbol': 'X', 'filters': []})
+        assert False, 'no error'
+    except Exception as e:
+        assert 'No tick size' in str(e)
+
+
+def test_orders_in_ticks_and_lots_go_out_on_the_grid():
+    async def run():
+        mock = await MockExchange(api_key='key', api_secret='secret', message_rate=0).start()
+        bot = BinanceFutures('key', 'secret', 'btcusdt', base_url=mock.base_url, stream_url=mock.stream_url)
+        bot.set_tick_size(mock.tick_size, mock.step_size)
+        tick = mock.mid - 50
+        resp = await bot.create_orders({'tick': tick, 'lots': 3, 'side': 'Buy'})
+        assert (resp['price'], resp['origQty']) == (bot.instrument.format_price(tick), '0.003')
+        assert list(bot.open_orders_ws.orders_at('BUY', tick)) == [resp['clientOrderId']]
+        # The mock rejects what Binance would: a price with more decimals than the tick size.
+        try:
+            await bot.create_orders({'price': '%.2f' % (tick * 0.1 + 0.01), 'quantity': '0.003', 'side': 'Buy'})
+            assert False, 'no error'
+        except aiohttp.ClientResponseError as e:
+            assert e.status == 400
+        assert list(bot.open_orders_active()) == [resp['clientOrderId']]
+        await bot.client.close()
+        await mock.stop()
+    asyncio.run(run())
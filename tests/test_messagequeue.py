@@ -0,0 +1,29 @@
+import asyncio
+
+from tradingbot.codec import json_dumps
+from tradingbot.messagequeue import MessageQueue
+
+
+def test_failed_message_drops_the_connection():
+    """A frame failing to be handled drops the queued ones and calls on_error; the queue then keeps handling."""
+    async def run():
+        handled = []
+        errors = []
+
+        def handle(received, message):
+            if message['data']['i'] == 2:
+                raise ValueError('bad frame')
+            handled.append(message['data']['i'])
+
+        queue = MessageQueue('test', handle, max_batch=2, on_error=lambda: errors.append(len(queue.frames)))
+        for i in range(6):
+            queue.put(json_dumps({'stream': 'test', 'data': {'e': 'test', 'i': i}}))
+        queue.start()
+        await asyncio.sleep(0.01)
+        assert handled == [0, 1]
+        assert errors == [0]
+        queue.put(json_dumps({'stream': 'test', 'data': {'e': 'test', 'i': 6}}))
+        await asyncio.sleep(0.01)
+        assert handled == [0, 1, 6]
+        await queue.close()
+    asyncio.run(run())
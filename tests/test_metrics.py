@@ -0,0 +1,63 @@
+import asyncio
+import json
+import logging
+import random
+
+import aiohttp
+
+from tradingbot.metrics import Histogram, Metrics
+
+
+def test_percentiles_within_the_bucket_resolution():
+    rng = random.Random(1)
+    samples = sorted(rng.lognormvariate(-7, 1.5) for _ in range(20000))
+    histogram = Histogram()
+    for sample in samples:
+        histogram.record(sample)
+    for q in (0.5, 0.9, 0.99, 0.999):
+        exact = samples[int(q * len(samples)) - 1]
+        # Buckets are ~19% wide and a percentile reports its bucket's upper bound.
+        assert exact <= histogram.percentile(q) <= exact * 1.25 + 1e-6
+    summary = histogram.summary()
+    assert summary['count'] == 20000
+    assert summary['max'] == samples[-1]
+    assert abs(summary['mean'] - sum(samples) / len(samples)) < 1e-9
+    # Sub-microsecond and very slow samples land in the first and in a valid bucket.
+    histogram.record(0)
+    histogram.record(100)
+    assert histogram.percentile(1.0) == 100
+
+
+def test_snapshot_reads_the_gauges_and_reset_starts_a_new_window():
+    registry = Metrics()
+    state = {'orders': 3}
+    registry.gauge('orders.active', lambda: state['orders'])
+    registry.record('rest.GET /v1/depth', 0.002)
+    registry.record('rest.GET /v1/depth', 0.004)
+    assert registry.histogram('rest.GET /v1/depth').count == 2
+    state['orders'] = 5
+    snapshot = registry.snapshot()
+    assert snapshot['gauges'] == {'orders.active': 5}
+    assert snapshot['histograms']['rest.GET /v1/depth']['count'] == 2
+    registry.reset()
+    assert registry.snapshot() == {'histograms': {}, 'gauges': {'orders.active': 5}}
+
+
+def test_served_as_json_and_dumped_to_the_log(caplog):
+    async def run():
+        registry = Metrics()
+        registry.record('md.on_message', 0.00005)
+        runner = await registry.serve(port=0)
+        port = runner.addresses[0][1]
+        async with aiohttp.ClientSession() as session:
+            async with session.get('http://127.0.0.1:%d/metrics' % port) as response:
+                snapshot = json.loads(await response.text())
+        assert snapshot['histograms']['md.on_message']['count'] == 1
+        await runner.cleanup()
+        with caplog.at_level(logging.INFO):
+            task = asyncio.create_task(registry.dump_periodically(0.01, reset=True))
+            await asyncio.sleep(0.025)
+            task.cancel()
+        assert 'metrics: {"histograms":{"md.on_message"' in caplog.text
+        assert registry.histograms == {}
+    asyncio.run(run())
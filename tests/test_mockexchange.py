@@ -0,0 +1,99 @@
+import asyncio
+
+import aiohttp
+import numpy as np
+
+from tradingbot.binancefutures import LIVE, BinanceFutures
+from tradingbot.mockexchange import MockExchange
+
+
+async def wait_for(condition, timeout=5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, 'timed out'
+        await asyncio.sleep(0.01)
+
+
+async def connected_bot(mock, **kwargs):
+    bot = BinanceFutures('key', 'secret', 'btcusdt', base_url=mock.base_url, stream_url=mock.stream_url,
+                         ws_api_url=mock.ws_api_url, **kwargs)
+    bot.set_tick_size(mock.tick_size)
+    task = asyncio.create_task(bot.connect())
+    await wait_for(lambda: bot.book_state == LIVE)
+    return bot, task
+
+
+async def disconnect(bot, task):
+    bot.closed = True
+    await bot.ws.close()
+    await task
+    await bot.client.close()
+
+
+def test_book_follows_the_mock_through_gaps():
+    async def run():
+        # No trades: a trade's level change goes out with the next depth update, which stopping the market would lose.
+        mock = await MockExchange(api_key='key', api_secret='secret', message_rate=2000, trade_ratio=0,
+                                  gap_rate=0.02, seed=1).start()
+        bot, task = await connected_bot(mock)
+        await wait_for(lambda: mock.gaps >= 2 and bot.gap_count >= 1 and bot.book_state == LIVE)
+        # Stop the market and let the last updates arrive, resyncing once more if the last one was a gap.
+        mock.generator.cancel()
+        await asyncio.sleep(0.1)
+        await wait_for(lambda: bot.book_state == LIVE)
+        # Levels beyond the last snapshot are kept, as they are live; the book matches the mock within it.
+        low, high = min(mock.bids), max(mock.asks)
+        prices, qtys = bot.depth.bids()
+        assert [(tick, qty) for tick, qty in zip(np.rint(prices / 0.1).astype(int), qtys) if tick >= low] == \
+               sorted(mock.bids.items(), reverse=True)
+        prices, qtys = bot.depth.asks()
+        assert [(tick, qty) for tick, qty in zip(np.rint(prices / 0.1).astype(int), qtys) if tick <= high] == \
+               sorted(mock.asks.items())
+        await disconnect(bot, task)
+        await mock.stop()
+    asyncio.run(run())
+
+
+def test_orders_are_matched_and_reported_on_the_user_stream():
+    async def run():
+        # Depth updates only, so that no random trade fills the resting order.
+        mock = await MockExchange(api_key='key', api_secret='secret', message_rate=100, trade_ratio=0, seed=1).start()
+        for order_transport in ('rest', 'ws'):
+            bot, task = await connected_bot(mock, order_transport=order_transport)
+            book = bot.depth
+            # Resting below the touch; crossing the spread fills at once.
+            resting = {'price': '%.1f' % book.tick_to_price(book.best_bid_tick - 20), 'quantity': '0.010',
+                       'side': 'Buy'}
+            await bot.create_orders(resting)
+            taker = {'price': '%.1f' % book.tick_to_price(book.best_ask_tick + 20), 'quantity': '0.002', 'side': 'Buy'}
+            await bot.create_orders(taker)
+            await wait_for(lambda: bot.open_orders_ws.get(taker['newClientOrderId'], {}).get('status') == 'FILLED')
+            assert float(bot.running_qty) == mock.position
+            assert list(bot.open_orders_active()) == [resting['newClientOrderId']]
+            await bot.cancel_bulk_orders([resting['newClientOrderId']])
+            await wait_for(lambda: not bot.open_orders_active())
+            assert mock.resting == {'BUY': {}, 'SELL': {}}
+            await disconnect(bot, task)
+        assert mock.position == 0.004
+        await mock.stop()
+    asyncio.run(run())
+
+
+def test_signatures_injected_errors_and_usage_headers():
+    async def run():
+        mock = await MockExchange(api_key='key', api_secret='secret', message_rate=0).start()
+        async with aiohttp.ClientSession() as session:
+            async with session.get(mock.base_url + '/v1/depth?symbol=BTCUSDT&limit=5') as response:
+                depth = await response.json()
+                assert len(depth['bids']) == len(depth['asks']) == 5
+                assert response.headers['X-MBX-USED-WEIGHT-1M'] == '1'
+            async with session.get(mock.base_url + '/v1/openOrders?symbol=BTCUSDT&timestamp=1&signature=00',
+                                   headers={'X-MBX-APIKEY': 'key'}) as response:
+                assert response.status == 400 and (await response.json())['code'] == -1022
+            mock.error_rate = 1.0
+            mock.errors = (429,)
+            async with session.get(mock.base_url + '/v1/ping') as response:
+                assert response.status == 429 and response.headers['Retry-After'] == '1'
+            assert mock.errors_injected == 1
+        await mock.stop()
+    asyncio.run(run())
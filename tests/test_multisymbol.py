@@ -0,0 +1,103 @@
+import asyncio
+import json
+
+from aiohttp import web
+
+from tradingbot.multisymbol import MultiSymbolBinanceFutures
+
+
+def recording_handlers(bots):
+    """Replace the handlers of every instance with ones recording (symbol, event type)."""
+    received = []
+    for symbol, bot in bots.items():
+        bot.handlers = {event: lambda data, symbol=symbol: received.append((symbol, data['e']))
+                        for event in ('depthUpdate', 'trade', 'ORDER_TRADE_UPDATE', 'ACCOUNT_UPDATE')}
+    return received
+
+
+def test_instances_share_the_session_limiter_and_ws_api():
+    async def run():
+        for symbols in ([], ['s%d' % i for i in range(100)]):
+            try:
+                MultiSymbolBinanceFutures('key', 'secret', symbols)
+                assert False, 'no error'
+            except ValueError:
+                pass
+        multi = MultiSymbolBinanceFutures('key', 'secret', ['BTCUSDT', 'ethusdt'], order_transport='ws',
+                                          ws_api_url='ws://127.0.0.1:1/ws-fapi/v1')
+        btc, eth = multi.bots['btcusdt'], multi.bots['ethusdt']
+        assert btc.client is eth.client is multi.client
+        assert btc.rate_limiter is eth.rate_limiter is multi.rate_limiter
+        assert btc.ws_api is eth.ws_api is multi.ws_api is not None
+        assert not btc.owns_session and not eth.owns_session
+        assert multi.rest is btc
+        await multi.client.close()
+    asyncio.run(run())
+
+
+def test_messages_are_routed_by_stream_and_symbol():
+    async def run():
+        multi = MultiSymbolBinanceFutures('key', 'secret', ['btcusdt', 'ethusdt'])
+        received = recording_handlers(multi.bots)
+        on_message = multi._MultiSymbolBinanceFutures__on_message
+        await on_message(json.dumps({'stream': 'ethusdt@depth@0ms', 'data': {'e': 'depthUpdate'}}))
+        await on_message(json.dumps({'stream': 'btcusdt@trade', 'data': {'e': 'trade'}}))
+        # User data events come on the listen key's stream and are routed by their symbol.
+        await on_message(json.dumps({'stream': 'key', 'data': {'e': 'ORDER_TRADE_UPDATE', 'o': {'s': 'ETHUSDT'}}}))
+        await on_message(json.dumps({'stream': 'key', 'data': {'e': 'ORDER_TRADE_UPDATE', 'o': {'s': 'XRPUSDT'}}}))
+        await on_message(json.dumps({'stream': 'key', 'data': {'e': 'ACCOUNT_UPDATE',
+                                                               'a': {'P': [{'s': 'BTCUSDT'}, {'s': 'ETHUSDT'}]}}}))
+        assert received == [('ethusdt', 'depthUpdate'), ('btcusdt', 'trade'), ('ethusdt', 'ORDER_TRADE_UPDATE'),
+                            ('btcusdt', 'ACCOUNT_UPDATE'), ('ethusdt', 'ACCOUNT_UPDATE')]
+        await multi.client.close()
+    asyncio.run(run())
+
+
+def test_connect_subscribes_every_symbol_on_one_stream():
+    async def run():
+        subscriptions = []
+
+        async def stream(request):
+            subscriptions.append(request.query['streams'].split('/'))
+            ws = web.WebSocketResponse()
+            await ws.prepare(request)
+            await ws.send_str(json.dumps({'stream': 'ethusdt@trade', 'data': {'e': 'trade'}}))
+            await ws.close()
+            return ws
+
+        app = web.Application()
+        app.router.add_get('/stream', stream)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', 0).start()
+        port = runner.addresses[0][1]
+        multi = MultiSymbolBinanceFutures('key', 'secret', ['btcusdt', 'ethusdt'],
+                                          stream_url='ws://127.0.0.1:%d/stream' % port)
+        requests = []
+
+        def fake(bot):
+            async def curl(path, query=None, verb=None, **kwargs):
+                requests.append((bot.symbol, verb, path))
+                if path == '/v2/positionRisk':
+                    return [{'symbol': 'ETHUSDT', 'positionSide': 'BOTH', 'positionAmt': '0.5'},
+                            {'symbol': 'BTCUSDT', 'positionSide': 'LONG', 'positionAmt': '1'}]
+                if path == '/v1/listenKey':
+                    return {'listenKey': 'listen'}
+                return {}
+            return curl
+        for bot in multi.bots.values():
+            bot._BinanceFutures__curl_binancefutures = fake(bot)
+        received = recording_handlers(multi.bots)
+        # Closed, so that the stream is not reopened after the server closes it.
+        multi.closed = True
+        await multi.connect()
+        assert subscriptions == [['listen', 'btcusdt@depth@0ms', 'btcusdt@trade', 'ethusdt@depth@0ms',
+                                  'ethusdt@trade']]
+        assert received == [('ethusdt', 'trade')]
+        # Orders are canceled for every symbol, the positions and listen key are fetched once.
+        assert sorted(requests) == [('btcusdt', 'DELETE', '/v1/allOpenOrders'), ('btcusdt', 'GET', '/v2/positionRisk'),
+                                    ('btcusdt', 'POST', '/v1/listenKey'), ('ethusdt', 'DELETE', '/v1/allOpenOrders')]
+        assert (multi.bots['btcusdt'].running_qty, multi.bots['ethusdt'].running_qty) == ('0', '0.5')
+        await multi.client.close()
+        await runner.cleanup()
+    asyncio.run(run())
@@ -0,0 +1,72 @@
+import asyncio
+import json
+
+from tradingbot.binancefutures import LIVE, BinanceFutures
+
+
+def frame(stream, data):
+    return json.dumps({'stream': stream, 'data': data})
+
+
+async def live_bot():
+    bot = BinanceFutures('', '', 'btcusdt')
+    bot.depth.set_tick_size(0.1)
+    bot.prev_u = 10
+    bot.book_state = LIVE
+    return bot
+
+
+def test_depth_update_is_decoded_and_applied():
+    async def run():
+        bot = await live_bot()
+        on_message = bot._BinanceFutures__on_message
+        await on_message(frame('btcusdt@depth@0ms', {'e': 'depthUpdate', 'U': 11, 'u': 12, 'pu': 10,
+                                                     'b': [['100.0', '1.5'], ['99.9', '2']],
+                                                     'a': [['100.1', '3']]}))
+        assert bot.prev_u == 12
+        assert (bot.depth.best_bid_tick, bot.depth.best_ask_tick) == (1000, 1001)
+        assert bot.depth.best_bid_qty == 1.5
+        assert bot.update_event.is_set()
+        bot.update_event.clear()
+        await on_message(frame('btcusdt@depth@0ms', {'e': 'depthUpdate', 'U': 13, 'u': 13, 'pu': 12,
+                                                     'b': [['100.0', '0']], 'a': []}))
+        assert bot.depth.best_bid_tick == 999
+        assert bot.update_event.is_set()
+        await bot.client.close()
+    asyncio.run(run())
+
+
+def test_trades_and_account_updates():
+    async def run():
+        bot = await live_bot()
+        on_message = bot._BinanceFutures__on_message
+        await on_message(frame('btcusdt@trade', {'e': 'trade', 'p': '100.2', 'q': '0.5'}))
+        assert (bot.last_price, bot.last_qty) == ('100.2', '0.5')
+        await on_message(frame('key', {'e': 'ACCOUNT_UPDATE',
+                                       'a': {'P': [{'s': 'BTCUSDT', 'ps': 'BOTH', 'pa': '0.003'},
+                                                   {'s': 'ETHUSDT', 'ps': 'BOTH', 'pa': '1'}]}}))
+        assert bot.running_qty == '0.003'
+        # Events without a handler are ignored.
+        await on_message(frame('key', {'e': 'MARGIN_CALL'}))
+        await bot.client.close()
+    asyncio.run(run())
+
+
+def test_order_updates_keep_the_latest_state():
+    async def run():
+        bot = await live_bot()
+        on_message = bot._BinanceFutures__on_message
+
+        def update(status, time_):
+            return frame('key', {'e': 'ORDER_TRADE_UPDATE',
+                                 'o': {'s': 'BTCUSDT', 'c': 'bot_bf_1', 'S': 'BUY', 'q': '0.010', 'p': '100.0',
+                                       'X': status, 'i': 1, 'l': '0', 'z': '0', 'T': time_}})
+        now = 1700000000000
+        await on_message(update('NEW', now))
+        await on_message(update('PARTIALLY_FILLED', now + 2))
+        # Late and out of order; the newer state stays.
+        await on_message(update('NEW', now + 1))
+        assert bot.open_orders_ws['bot_bf_1']['status'] == 'PARTIALLY_FILLED'
+        assert list(bot.open_orders_active()) == ['bot_bf_1']
+        await bot.client.close()
+    asyncio.run(run())
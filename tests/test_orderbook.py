@@ -0,0 +1,89 @@
+import logging
+import math
+
+import numpy as np
+
+from tradingbot.orderbook import OrderBook
+
+
+def book_with_levels(capacity=1 << 16, max_span=1 << 20):
+    book = OrderBook(0.1, capacity=capacity, max_span=max_span)
+    book.apply(book.decode([['100.0', '1'], ['99.9', '2'], ['99.5', '3']]), book.decode([['100.1', '4'], ['100.3', '5']]))
+    return book
+
+
+def test_top_of_book_follows_the_updates():
+    book = book_with_levels()
+    assert (book.best_bid_tick, book.best_ask_tick) == (1000, 1001)
+    assert (book.best_bid_qty, book.best_ask_qty) == (1.0, 4.0)
+    assert math.isclose(book.mid, 100.05)
+    assert len(book) == 5
+    # Removing the best level falls back to the next one, however far.
+    book.update_bid(1000, 0)
+    book.update_ask(1001, 0)
+    assert (book.best_bid_tick, book.best_ask_tick) == (999, 1003)
+    book.update_bid(999, 0)
+    assert book.best_bid_tick == 995
+    book.update_bid(995, 0)
+    assert book.best_bid_tick is None and math.isnan(book.best_bid)
+    assert book.best_bid_qty == 0.0
+    assert len(book) == 1
+
+
+def test_depth_views():
+    book = book_with_levels()
+    prices, qtys = book.bids(2)
+    assert np.allclose(prices, [100.0, 99.9]) and list(qtys) == [1.0, 2.0]
+    prices, qtys = book.asks()
+    assert np.allclose(prices, [100.1, 100.3]) and list(qtys) == [4.0, 5.0]
+    # Dense views, one entry per tick from the touch.
+    assert list(book.bid_depth(3)) == [1.0, 2.0, 0.0]
+    assert list(book.ask_depth(3)) == [4.0, 0.0, 5.0]
+
+
+def test_clear_inside_keeps_levels_beyond_the_snapshot():
+    book = book_with_levels()
+    book.clear_inside(999, 1001)
+    assert book.best_bid_tick == 995
+    assert book.best_ask_tick == 1003
+    assert len(book) == 2
+
+
+def test_window_grows_and_recentres():
+    book = OrderBook(0.1, capacity=64)
+    book.update_bid(1000, 1.0)
+    book.update_ask(1001, 2.0)
+    book.update_bid(700, 3.0)
+    book.update_ask(1500, 4.0)
+    assert len(book.bid_qty) >= 800
+    assert (book.best_bid_tick, book.best_ask_tick) == (1000, 1001)
+    assert list(book.bids()[1]) == [1.0, 3.0]
+    assert list(book.asks()[1]) == [2.0, 4.0]
+
+
+def test_stray_level_is_dropped(caplog):
+    book = OrderBook(0.1, capacity=64, max_span=1024)
+    book.update_bid(1000, 1.0)
+    book.update_ask(1001, 2.0)
+    with caplog.at_level(logging.WARNING):
+        assert book.update_ask(10 ** 9, 5.0) == 0.0
+    assert 'too far from the mid' in caplog.text
+    assert len(book.ask_qty) == 64
+    assert len(book) == 2
+    assert book.best_ask_tick == 1001
+
+
+def test_span_stays_bounded_as_the_price_moves():
+    """The mid walks far beyond max_span; the levels left behind are dropped instead of the arrays growing."""
+    book = OrderBook(0.1, capacity=64, max_span=1024)
+    book.update_bid(1000, 1.0)
+    book.update_ask(1001, 1.0)
+    for tick in range(1010, 5000, 10):
+        book.update_bid(tick, 1.0)
+        book.update_ask(tick + 1, 1.0)
+        book.update_ask(tick - 9, 0)
+    assert len(book.bid_qty) <= 1024
+    assert (book.best_bid_tick, book.best_ask_tick) == (4990, 4991)
+    prices, _ = book.bids()
+    assert len(prices) <= 1024 // 10 + 1
+    assert round(prices[-1] / 0.1) > 4990 - 1024
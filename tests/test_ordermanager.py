@@ -0,0 +1,131 @@
+import asyncio
+
+from tradingbot import settings
+from tradingbot.binancefutures import BinanceFutures
+from tradingbot.instrument import Instrument
+from tradingbot.ordermanager import OrderManager
+from tradingbot.orderstore import OrderStore
+
+
+class Exchange:
+    """The order store and the order calls of BinanceFutures converge_orders uses, recording the calls."""
+
+    def __init__(self, tick_size=0.1):
+        self.instrument = Instrument('BTCUSDT', tick_size)
+        self.open_orders_ws = OrderStore(tick_size)
+        self.created = []
+        self.canceled = []
+        self.amended = []
+
+    def add(self, client_order_id, price, side='BUY', quantity='0.001', status='NEW'):
+        self.open_orders_ws.update({'clientOrderId': client_order_id, 'side': side, 'price': price,
+                                    'origQty': quantity, 'status': status, 'updateTime': 1})
+
+    async def create_orders(self, order):
+        self.created.append(order)
+
+    async def create_bulk_orders(self, orders):
+        self.created += orders
+
+    async def cancel_bulk_orders(self, client_order_ids):
+        self.canceled += client_order_ids
+
+    async def amend_orders(self, order):
+        self.amended.append(order)
+
+    async def amend_bulk_orders(self, orders):
+        self.amended += orders
+
+
+def manager(exchange):
+    manager = OrderManager.__new__(OrderManager)
+    manager.binance_futures = exchange
+    return manager
+
+
+def converge(exchange, buy_orders, sell_orders=()):
+    asyncio.run(manager(exchange).converge_orders(list(buy_orders), list(sell_orders)))
+
+
+def test_exact_ticks_are_kept_and_the_rest_replaced():
+    exchange = Exchange()
+    exchange.add('a', '100.0')
+    exchange.add('b', '99.9')
+    exchange.add('c', '100.5', side='SELL')
+    converge(exchange, [{'price': 100.0, 'quantity': 0.001}, {'price': 99.8, 'quantity': 0.0019}],
+             [{'price': 100.5, 'quantity': 0.001}])
+    assert exchange.canceled == ['b']
+    # Desired orders are converted to ticks and whole lots.
+    assert exchange.created == [{'tick': 998, 'lots': 1, 'side': 'BUY'}]
+
+
+def test_relist_keeps_the_nearest_order_within_the_interval(monkeypatch):
+    monkeypatch.setattr(settings, 'RELIST_INTERVAL', 0.01)
+    exchange = Exchange()
+    exchange.add('near', '100.3')
+    exchange.add('far', '90.0')
+    exchange.add('sell', '101.0', side='SELL')
+    converge(exchange, [{'price': 100.0, 'quantity': 0.001}], [{'price': 101.5, 'quantity': 0.001},
+                                                                 {'price': 101.2, 'quantity': 0.001}])
+    # 'near' stands in for 100.0 and 'sell' for the closer of the two asks; 90.0 is more than 1% off.
+    assert exchange.canceled == ['far']
+    assert exchange.created == [{'tick': 1015, 'lots': 1, 'side': 'SELL'}]
+    # At the default of 0 only exact ticks match.
+    monkeypatch.setattr(settings, 'RELIST_INTERVAL', 0.0)
+    exchange = Exchange()
+    exchange.add('near', '100.3')
+    converge(exchange, [{'price': 100.0, 'quantity': 0.001}])
+    assert exchange.canceled == ['near']
+    assert exchange.created == [{'tick': 1000, 'lots': 1, 'side': 'BUY'}]
+
+
+def test_exact_match_is_not_taken_by_a_neighbour(monkeypatch):
+    """A@100 sorts before B@101, but B is at the desired tick: B is kept and A cancelled."""
+    monkeypatch.setattr(settings, 'RELIST_INTERVAL', 0.05)
+    exchange = Exchange(tick_size=1)
+    exchange.add('A', '100')
+    exchange.add('B', '101')
+    converge(exchange, [{'price': 101, 'quantity': 0.001}])
+    assert exchange.canceled == ['A']
+    assert exchange.created == []
+
+
+def test_amend_pairs_the_nearest_orders():
+    exchange = Exchange()
+    exchange.add('a', '99.0')
+    exchange.add('b', '100.0')
+    exchange.add('c', '98.0')
+    exchange.add('pending', '100.2', status='PARTIALLY_FILLED')
+    converge_amend = manager(exchange).converge_orders([{'price': 100.1, 'quantity': 0.001},
+                                                        {'price': 99.1, 'quantity': 0.002}], [], amend=True)
+    asyncio.run(converge_amend)
+    # Each new price moves the closest NEW order; the rest are cancelled.
+    assert [(order['clientOrderId'], order['tick'], order['lots']) for order in exchange.amended] == \
+           [('b', 1001, 1), ('a', 991, 2)]
+    assert sorted(exchange.canceled) == ['c', 'pending']
+    assert exchange.created == []
+
+
+def test_amend_bulk_orders_merges_the_responses():
+    async def run():
+        bot = BinanceFutures('', '', 'btcusdt')
+        bot.set_tick_size(0.1)
+        bot.open_orders_ws.update({'clientOrderId': 'a', 'side': 'BUY', 'price': '99.0', 'status': 'NEW',
+                                   'updateTime': 1})
+        queries = []
+
+        async def batch_orders(path, query=None, verb=None, **kwargs):
+            queries.append((verb, path, query))
+            return [{'clientOrderId': 'a', 'side': 'BUY', 'price': '99.5', 'status': 'NEW', 'updateTime': 2},
+                    {'code': -2013, 'msg': 'Order does not exist.'}]
+
+        bot._BinanceFutures__curl_binancefutures = batch_orders
+        await bot.amend_bulk_orders([{'clientOrderId': 'a', 'side': 'BUY', 'price': '99.5', 'quantity': '0.001'},
+                                     {'clientOrderId': 'gone', 'side': 'BUY', 'price': '99.6', 'quantity': '0.001'}])
+        (verb, path, query), = queries
+        assert (verb, path) == ('PUT', '/v1/batchOrders')
+        assert [order['origClientOrderId'] for order in query['batchOrders']] == ['a', 'gone']
+        assert list(bot.open_orders_ws.orders_at('BUY', 995)) == ['a']
+        assert 'gone' not in bot.open_orders_ws
+        await bot.client.close()
+    asyncio.run(run())
@@ -0,0 +1,86 @@
+import asyncio
+
+from tradingbot.binancefutures import BinanceFutures
+from tradingbot.orderstore import OrderStore
+
+
+def order(client_order_id, status, update_time, side='BUY', price='100.0'):
+    return {'clientOrderId': client_order_id, 'side': side, 'price': price, 'status': status,
+            'updateTime': update_time}
+
+
+def test_indexes_follow_the_order_states():
+    store = OrderStore(tick_size=0.1)
+    store.update(order('a', 'NEW', 1))
+    store.update(order('b', 'NEW', 1, price='100.0'))
+    store.update(order('c', 'NEW', 1, side='SELL', price='100.5'))
+    assert set(store.active) == {'a', 'b', 'c'}
+    assert set(store.orders_at('BUY', 1000)) == {'a', 'b'}
+    assert set(store.active_by_side['SELL']) == {'c'}
+    store.update(order('a', 'FILLED', 3))
+    # An older update does not overwrite a newer one.
+    store.update(order('a', 'PARTIALLY_FILLED', 2))
+    assert store['a']['status'] == 'FILLED'
+    assert set(store.active) == {'b', 'c'}
+    assert set(store.orders_at('BUY', 1000)) == {'b'}
+    store.update(order('b', 'CANCELED', 2))
+    assert store.orders_at('BUY', 1000) == {}
+    assert 1000 not in store.by_tick['BUY']
+    assert len(store) == 3
+    store.remove('c')
+    assert 'c' not in store and not store.active
+
+
+def test_same_time_update_taken_only_further_along():
+    """A fill in the same millisecond as the acknowledgement is taken; a late acknowledgement is not."""
+    store = OrderStore(tick_size=0.1)
+    store.update(order('a', 'PENDING_NEW', 5))
+    store.update(order('a', 'NEW', 5))
+    store.update(order('a', 'FILLED', 5))
+    store.update(order('a', 'NEW', 5))
+    assert store['a']['status'] == 'FILLED'
+    assert not store.active
+
+
+def test_purge_removes_expired_terminal_orders_only():
+    store = OrderStore(tick_size=0.1, expiry=300)
+    store.update(order('old', 'FILLED', 1000))
+    store.update(order('recent', 'CANCELED', 250000))
+    store.update(order('live', 'NEW', 1000))
+    # Terminal, then updated again: only its latest update time counts.
+    store.update(order('updated', 'CANCELED', 1000))
+    store.update(order('updated', 'EXPIRED', 290000))
+    store.purge(1000 + 300 * 1000 + 1)
+    assert set(store) == {'recent', 'live', 'updated'}
+    store.purge(290000 + 300 * 1000 + 1)
+    assert set(store) == {'live'}
+
+
+def test_set_tick_size_reindexes():
+    store = OrderStore()
+    store.update(order('a', 'NEW', 1, price='100.0'))
+    assert store.by_tick['BUY'] == {}
+    store.set_tick_size(0.5)
+    assert set(store.orders_at('BUY', 200)) == {'a'}
+
+
+def test_rejected_batch_orders_are_dropped():
+    async def run():
+        bot = BinanceFutures('', '', 'btcusdt')
+        bot.set_tick_size(0.1)
+
+        async def batch_orders(path, query=None, **kwargs):
+            first, second = query['batchOrders']
+            return [{'clientOrderId': first['newClientOrderId'], 'side': 'BUY', 'price': '100.0', 'status': 'NEW',
+                     'updateTime': 1},
+                    {'code': -5022, 'msg': 'Due to the order could not be executed as maker, the Post Only order '
+                                           'will be rejected.'}]
+
+        bot._BinanceFutures__curl_binancefutures = batch_orders
+        orders = [{'price': '100.0', 'quantity': '0.001', 'side': 'Buy'},
+                  {'price': '100.1', 'quantity': '0.001', 'side': 'Buy'}]
+        await bot.create_bulk_orders(orders)
+        assert list(bot.open_orders_active()) == [orders[0]['newClientOrderId']]
+        assert orders[1]['newClientOrderId'] not in bot.open_orders_ws
+        await bot.client.close()
+    asyncio.run(run())
@@ -0,0 +1,60 @@
+import asyncio
+import math
+import time
+
+from tradingbot.ratelimit import RateLimiter, TokenBucket
+
+
+def test_token_bucket_refills_continuously():
+    bucket = TokenBucket(10, 10)
+    now = bucket.stamp
+    assert bucket.delay(10, now) == 0
+    bucket.consume(10)
+    # One token per second.
+    assert math.isclose(bucket.delay(3, now), 3)
+    assert math.isclose(bucket.delay(3, now + 1), 2)
+    assert bucket.delay(3, now + 3) == 0
+    # Never above the limit, however long it was idle.
+    bucket.refill(now + 100)
+    assert bucket.tokens == 10
+    # The exchange reports more usage than we counted.
+    bucket.sync(8, now + 100)
+    assert bucket.tokens == 2
+    bucket.sync(1, now + 100)
+    assert bucket.tokens == 2
+
+
+def test_acquire_waits_for_the_short_bucket():
+    async def run():
+        limiter = RateLimiter(weight_limit=1000, order_limit_1m=1000, order_limit_10s=2, safety=1.0)
+        limiter.buckets['ORDERS_10S'].interval = 0.1
+        limiter.buckets['ORDERS_10S'].rate = 2 / 0.1
+        start = time.monotonic()
+        await limiter.acquire(weight=5, orders=2)
+        assert limiter.waits == 0
+        # The 10s order bucket is empty; a request without orders still goes through.
+        await limiter.acquire(weight=5)
+        assert limiter.waits == 0
+        await limiter.acquire(weight=5, orders=1)
+        assert limiter.waits >= 1
+        assert time.monotonic() - start >= 0.04
+        headroom = limiter.headroom()
+        assert 0.98 < headroom['REQUEST_WEIGHT_1M'] < 0.99
+        assert headroom['ORDERS_1M'] < 1
+    asyncio.run(run())
+
+
+def test_headers_and_retry_after_hold_requests():
+    async def run():
+        limiter = RateLimiter(weight_limit=100, safety=0.9)
+        limiter.update({'X-MBX-USED-WEIGHT-1M': '85', 'X-MBX-ORDER-COUNT-10S': '3'})
+        # 90 with the safety margin, 85 of them used.
+        assert math.isclose(limiter.buckets['REQUEST_WEIGHT_1M'].tokens, 5, abs_tol=0.1)
+        assert math.isclose(limiter.buckets['ORDERS_10S'].tokens, 267, abs_tol=0.1)
+        limiter = RateLimiter()
+        limiter.block(0.05)
+        start = time.monotonic()
+        await limiter.acquire()
+        assert time.monotonic() - start >= 0.04
+        assert limiter.waits == 1
+    asyncio.run(run())
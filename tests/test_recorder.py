@@ -0,0 +1,57 @@
+import os
+import time
+
+from tradingbot.recorder import FRAME, SNAPSHOT, Recorder, read_records, recorded_files
+
+
+def records(n):
+    return [(SNAPSHOT if i % 100 == 0 else FRAME, 1700000000000000000 + i, '{"u":%d,"b":[["100.0","1"]]}' % i)
+            for i in range(n)]
+
+
+def read(directory):
+    return [(kind, timestamp, bytes(payload).decode('utf-8'))
+            for kind, timestamp, payload in read_records(recorded_files(directory))]
+
+
+def test_round_trip_with_rotation(tmp_path):
+    expected = records(5000)
+    for compress in (True, False):
+        directory = str(tmp_path / ('z' if compress else 'raw'))
+        recorder = Recorder(directory, compress=compress, block_size=4096, max_file_size=2048, batch_size=64)
+        for kind, timestamp, payload in expected:
+            recorder.record(kind, payload if kind == FRAME else payload.encode('utf-8'), timestamp)
+        recorder.close()
+        assert len(recorded_files(directory)) > 1
+        assert read(directory) == expected
+
+
+def test_quiet_stream_is_written_without_new_records(tmp_path):
+    """A few records followed by silence reach the disk within the flush interval, without a record or close()."""
+    directory = str(tmp_path)
+    recorder = Recorder(directory, flush_interval=0.05)
+    recorder.record(FRAME, '{"e":"depthUpdate"}')
+    recorder.record(FRAME, '{"e":"trade"}')
+    deadline = time.monotonic() + 2
+    while time.monotonic() < deadline:
+        if len(read(directory)) == 2:
+            break
+        time.sleep(0.01)
+    assert [payload for _, _, payload in read(directory)] == ['{"e":"depthUpdate"}', '{"e":"trade"}']
+    recorder.close()
+
+
+def test_truncated_trailing_block_is_ignored(tmp_path):
+    directory = str(tmp_path)
+    recorder = Recorder(directory, compress=False, block_size=256, batch_size=1)
+    for kind, timestamp, payload in records(50):
+        recorder.record(kind, payload, timestamp)
+    recorder.close()
+    path, = recorded_files(directory)
+    complete = read(directory)
+    size = os.path.getsize(path)
+    with open(path, 'r+b') as f:
+        f.truncate(size - 10)
+    truncated = read(directory)
+    assert 0 < len(truncated) < len(complete)
+    assert truncated == complete[:len(truncated)]
@@ -0,0 +1,104 @@
+import asyncio
+
+import numpy as np
+
+from benchmarks import fixtures
+from tradingbot import binancefutures
+from tradingbot.binancefutures import LIVE, BinanceFutures
+
+# Stands in for an open websocket: a link counts as up while its ws is not None.
+UP = object()
+
+
+def same_book(a, b):
+    for x, y in ((a.depth.bids(), b.depth.bids()), (a.depth.asks(), b.depth.asks())):
+        if not all(np.array_equal(p, q) for p, q in zip(x, y)):
+            return False
+    return True
+
+
+async def reference(n):
+    """A bot that got the n depth updates once, in order, over a single connection."""
+    market = fixtures.market()
+    bot = fixtures.live_bot(market)
+    for frame in fixtures.depth_frames(market, n):
+        await bot._BinanceFutures__on_message(frame)
+    return bot
+
+
+def test_lagging_link_fills_the_gap():
+    """Link 1 reconnects ahead of link 0, which still has the updates in between; they are taken from link 0 and the
+       book never resyncs."""
+    async def run():
+        expected = await reference(100)
+        market = fixtures.market()
+        bot = fixtures.live_bot(market, BinanceFutures('', '', fixtures.SYMBOL, market_data_connections=2))
+        frames = fixtures.depth_frames(market, 100)
+        handle = bot._BinanceFutures__on_link_message
+        lagging, ahead = bot.links
+        lagging.ws = ahead.ws = UP
+        for frame in frames[:40]:
+            await handle(frame, lagging)
+        # Link 1 comes back 20 updates ahead, then both links interleave, link 0 catching up.
+        for frame in frames[60:70]:
+            await handle(frame, ahead)
+        for i in range(40, 100):
+            await handle(frames[i], lagging)
+            if i + 30 < 100:
+                await handle(frames[i + 30], ahead)
+        assert bot.gap_count == 0
+        assert bot.resync_task is None
+        assert bot.book_state == LIVE
+        assert bot.prev_u == expected.prev_u
+        assert not bot.held
+        assert same_book(bot, expected)
+        await bot.client.close()
+        await expected.client.close()
+    asyncio.run(run())
+
+
+def test_duplicates_are_dropped():
+    async def run():
+        expected = await reference(50)
+        market = fixtures.market()
+        bot = fixtures.live_bot(market, BinanceFutures('', '', fixtures.SYMBOL, market_data_connections=2))
+        handle = bot._BinanceFutures__on_link_message
+        first, second = bot.links
+        first.ws = second.ws = UP
+        for frame in fixtures.depth_frames(market, 50):
+            await handle(frame, first)
+            await handle(frame, second)
+        assert (first.leads, second.leads) == (50, 0)
+        assert second.lag_histogram.count == 50
+        assert bot.gap_count == 0
+        assert same_book(bot, expected)
+        await bot.client.close()
+        await expected.client.close()
+    asyncio.run(run())
+
+
+def test_gap_on_every_link_is_released():
+    """Held updates are passed on after LINK_HOLD if no link fills the gap, and the book sees it."""
+    async def run():
+        market = fixtures.market()
+        # Nothing listens there; the resync this starts fails quietly.
+        bot = fixtures.live_bot(market, BinanceFutures('', '', fixtures.SYMBOL, market_data_connections=2,
+                                                       base_url='http://127.0.0.1:9/fapi'))
+        frames = fixtures.depth_frames(market, 20)
+        handle = bot._BinanceFutures__on_link_message
+        first, second = bot.links
+        first.ws = second.ws = UP
+        for frame in frames[:10]:
+            await handle(frame, first)
+        for frame in frames[15:]:
+            await handle(frame, second)
+        assert bot.gap_count == 0
+        assert len(bot.held) == 5
+        await asyncio.sleep(binancefutures.LINK_HOLD * 2)
+        assert not bot.held
+        assert bot.gap_count == 1
+        if bot.resync_task is not None:
+            bot.resync_task.cancel()
+            await asyncio.gather(bot.resync_task, return_exceptions=True)
+        await bot.client.close()
+    asyncio.run(run())
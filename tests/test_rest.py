@@ -0,0 +1,99 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import urllib.parse
+
+from aiohttp import web
+
+from tradingbot.binancefutures import BinanceFutures
+
+
+async def serve(handler):
+    """A local REST endpoint answering every request with `handler`; returns the runner and its base url."""
+    app = web.Application()
+    app.router.add_route('*', '/fapi/{path:.*}', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, 'http://127.0.0.1:%d/fapi' % port
+
+
+def test_request_is_encoded_once_and_signed():
+    async def run():
+        requests = []
+
+        async def handler(request):
+            requests.append(request)
+            return web.json_response([])
+        runner, base_url = await serve(handler)
+        bot = BinanceFutures('key', 'secret', 'btcusdt')
+        bot.base_url = base_url
+        curl = bot._BinanceFutures__curl_binancefutures
+        orders = [{'symbol': 'BTCUSDT', 'side': 'BUY', 'price': '100.0', 'quantity': '0.001'}]
+        await curl('/v1/batchOrders', query={'batchOrders': orders}, verb='POST')
+        request, = requests
+        assert request.method == 'POST' and request.path == '/fapi/v1/batchOrders'
+        assert request.headers['X-MBX-APIKEY'] == 'key'
+        # List parameters are JSON, not the repr of a Python list.
+        params = urllib.parse.parse_qs(request.query_string)
+        assert json.loads(params['batchOrders'][0]) == orders
+        assert 'timestamp' in params
+        signed, signature = request.raw_path.split('?', 1)[1].rsplit('&signature=', 1)
+        assert signature == hmac.new(b'secret', signed.encode('utf-8'), hashlib.sha256).hexdigest()
+        await bot.client.close()
+        await runner.cleanup()
+    asyncio.run(run())
+
+
+def test_retry_reuses_the_encoded_parameters():
+    async def run():
+        requests = []
+
+        async def handler(request):
+            requests.append(request.query_string)
+            if len(requests) == 1:
+                await asyncio.sleep(0.5)
+            return web.json_response({'ok': True})
+        runner, base_url = await serve(handler)
+        bot = BinanceFutures('key', 'secret', 'btcusdt')
+        bot.base_url = base_url
+        curl = bot._BinanceFutures__curl_binancefutures
+        assert await curl('/v1/openOrders', query={'symbol': 'BTCUSDT'}, verb='GET', timeout=0.2) == {'ok': True}
+        assert len(requests) == 2
+        first, second = (urllib.parse.parse_qs(query) for query in requests)
+        assert first['symbol'] == second['symbol'] == ['BTCUSDT']
+        # Only the timestamp and the signature are redone.
+        assert set(first) == set(second) == {'symbol', 'timestamp', 'signature'}
+        await bot.client.close()
+        await runner.cleanup()
+    asyncio.run(run())
+
+
+def test_warm_up_opens_pooled_connections(caplog):
+    async def run():
+        peers = set()
+
+        async def handler(request):
+            peers.add(request.transport.get_extra_info('peername'))
+            await asyncio.sleep(0.05)
+            return web.json_response({})
+        runner, base_url = await serve(handler)
+        bot = BinanceFutures('key', 'secret', 'btcusdt', connection_limit=4)
+        bot.base_url = base_url
+        assert bot.client.connector.limit == 4
+        await bot.warm_up(3)
+        assert len(peers) == 3
+        # The connections are kept alive for the requests that follow.
+        await bot._BinanceFutures__curl_binancefutures('/v1/ping')
+        assert len(peers) == 3
+        await runner.cleanup()
+        # A failed warm-up is logged, not raised.
+        with caplog.at_level(logging.WARNING):
+            await bot.warm_up()
+        assert 'warm-up failed' in caplog.text
+        await bot.client.close()
+    asyncio.run(run())
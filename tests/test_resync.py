@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+from tradingbot.binancefutures import LIVE, SYNCING, BinanceFutures
+
+
+def depth_frame(U, u, pu, bids=(), asks=()):
+    return json.dumps({'stream': 'btcusdt@depth@0ms',
+                       'data': {'e': 'depthUpdate', 'U': U, 'u': u, 'pu': pu, 'b': list(bids), 'a': list(asks)}})
+
+
+def snapshot(last_update_id):
+    return {'lastUpdateId': last_update_id, 'bids': [['100.0', '1'], ['99.0', '1']],
+            'asks': [['100.1', '1'], ['101.0', '1']]}
+
+
+class Snapshots:
+    """Stands in for the REST depth request: returns or raises the given results in turn, noting the call times."""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.times = []
+
+    async def __call__(self, path, query=None, timeout=None, verb=None, **kwargs):
+        assert path == '/v1/depth'
+        self.times.append(asyncio.get_running_loop().time())
+        await asyncio.sleep(0)
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def syncing_bot(snapshots):
+    bot = BinanceFutures('', '', 'btcusdt')
+    bot.depth.set_tick_size(0.1)
+    bot.resync_backoff = 0.02
+    bot._BinanceFutures__curl_binancefutures = snapshots
+    return bot
+
+
+async def wait_live(bot, timeout=1):
+    for _ in range(int(timeout / 0.005)):
+        if bot.book_state == LIVE:
+            return
+        await asyncio.sleep(0.005)
+
+
+def test_buffered_updates_bridge_the_snapshot():
+    async def run():
+        snapshots = Snapshots(snapshot(12))
+        bot = syncing_bot(snapshots)
+        on_message = bot._BinanceFutures__on_message
+        await on_message(depth_frame(10, 11, 9, bids=[['99.5', '2']]))
+        assert bot.book_state == SYNCING and bot.resync_task is not None
+        await on_message(depth_frame(12, 13, 11, bids=[['99.0', '0']]))
+        await on_message(depth_frame(14, 14, 13, asks=[['100.1', '3']]))
+        await wait_live(bot)
+        assert bot.book_state == LIVE
+        assert bot.prev_u == 14
+        # The update before the snapshot is not applied; the ones bridging and following it are.
+        assert list(bot.depth.bids()[1]) == [1.0]
+        assert bot.depth.best_ask_qty == 3.0
+        assert bot.resync_task is None
+        await bot.client.close()
+    asyncio.run(run())
+
+
+def test_stale_snapshot_is_refetched_after_a_backoff():
+    async def run():
+        snapshots = Snapshots(snapshot(5), snapshot(21))
+        bot = syncing_bot(snapshots)
+        on_message = bot._BinanceFutures__on_message
+        u = 10
+        await on_message(depth_frame(u, u, u - 1))
+        while bot.book_state != LIVE and u < 100:
+            u += 1
+            await on_message(depth_frame(u, u, u - 1))
+            await asyncio.sleep(0.005)
+        assert bot.book_state == LIVE
+        assert len(snapshots.times) == 2
+        assert snapshots.times[1] - snapshots.times[0] >= 0.02
+        assert bot.resync_attempts == 0
+        await bot.client.close()
+    asyncio.run(run())
+
+
+def test_failed_snapshot_is_retried_with_backoff():
+    async def run():
+        snapshots = Snapshots(ConnectionError('418'), ConnectionError('418'), snapshot(10))
+        bot = syncing_bot(snapshots)
+        on_message = bot._BinanceFutures__on_message
+        await on_message(depth_frame(10, 10, 9))
+        for u in range(11, 30):
+            await asyncio.sleep(0.01)
+            await on_message(depth_frame(u, u, u - 1))
+            if bot.book_state == LIVE:
+                break
+        assert bot.book_state == LIVE
+        # One request at a time, however many updates arrive meanwhile, and further apart after each failure.
+        assert len(snapshots.times) == 3
+        first, second = snapshots.times[1] - snapshots.times[0], snapshots.times[2] - snapshots.times[1]
+        assert first >= 0.02 and second >= 0.04
+        assert bot.resync_attempts == 0
+        await bot.client.close()
+    asyncio.run(run())
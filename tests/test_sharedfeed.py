@@ -0,0 +1,122 @@
+import os
+from multiprocessing import resource_tracker
+
+import numpy as np
+
+from tradingbot.binancefutures import LIVE, SYNCING
+from tradingbot.orderbook import OrderBook
+from tradingbot.sharedfeed import SEQ, SharedBookReader, SharedBookWriter, StaleFeedError, tracker_name
+
+
+class Bot:
+    """The parts of a BinanceFutures instance a SharedBookWriter publishes."""
+
+    def __init__(self):
+        self.depth = OrderBook(0.1)
+        self.book_state = LIVE
+        self.prev_u = 0
+        self.last_price = None
+        self.handlers = {'depthUpdate': self.on_depth_update, 'trade': self.on_trade, 'aggTrade': self.on_trade}
+
+    def on_depth_update(self, data):
+        self.depth.apply(data['b'], data['a'])
+        self.prev_u = data['u']
+
+    def on_trade(self, data):
+        self.last_price = float(data['p'])
+
+
+def feed(capacity=256):
+    writer = SharedBookWriter('btcusdt', 0.1, capacity=capacity, name='tradingbot-test-%d' % os.getpid())
+    bot = Bot()
+    writer.attach(bot)
+    reader = SharedBookReader(writer.name, stall_timeout=0.01)
+    # The reader shares the writer's process here: restore the registration it dropped, which the writer's unlink ends.
+    resource_tracker.register(tracker_name(reader.shm), 'shared_memory')
+    return writer, bot, reader
+
+
+def assert_same_book(reader, book):
+    for side in ('bids', 'asks'):
+        prices, qtys = getattr(reader.book, side)()
+        expected_prices, expected_qtys = getattr(book, side)()
+        assert np.array_equal(np.rint(prices / 0.1), np.rint(expected_prices / 0.1))
+        assert np.array_equal(qtys, expected_qtys)
+
+
+def test_reader_follows_the_writer_across_recentres():
+    writer, bot, reader = feed()
+    try:
+        bot.handlers['depthUpdate']({'u': 1, 'b': [(10000, 1.0), (9990, 2.0)], 'a': [(10001, 1.5), (10010, 3.0)]})
+        bot.handlers['trade']({'p': '1000.0', 'q': '0.5'})
+        assert reader.refresh() is not None
+        assert (reader.state, reader.update_id, reader.last_price, reader.last_qty) == (LIVE, 1, 1000.0, 0.5)
+        assert (reader.book.best_bid_tick, reader.book.best_ask_tick) == (10000, 10001)
+        assert reader.book.best_bid_qty == 1.0
+        assert_same_book(reader, bot.depth)
+        # The price moves out of the middle half of the 256 tick window: the window recentres on it.
+        origin = writer.origin
+        bot.handlers['depthUpdate']({'u': 2, 'b': [(10000, 0), (10100, 4.0)],
+                                     'a': [(10001, 0), (10010, 0), (10101, 1.0)]})
+        reader.refresh()
+        assert writer.origin != origin and reader.book.origin == writer.origin
+        assert (reader.book.best_bid_tick, reader.book.best_ask_tick, reader.update_id) == (10100, 10101, 2)
+        assert_same_book(reader, bot.depth)
+        # A resyncing book is published as SYNCING, and copied in full once it is LIVE again.
+        bot.book_state = SYNCING
+        bot.handlers['depthUpdate']({'u': 3, 'b': [], 'a': []})
+        reader.refresh()
+        assert reader.state == SYNCING
+        bot.book_state = LIVE
+        bot.handlers['depthUpdate']({'u': 4, 'b': [(10099, 1.0)], 'a': []})
+        reader.refresh()
+        assert reader.state == LIVE
+        assert_same_book(reader, bot.depth)
+    finally:
+        reader.close()
+        writer.close()
+
+
+def test_a_publication_left_in_progress_makes_the_feed_stale():
+    writer, bot, reader = feed()
+    try:
+        bot.handlers['depthUpdate']({'u': 1, 'b': [(10000, 1.0)], 'a': [(10001, 1.0)]})
+        assert reader.refresh() is not None and reader.state == LIVE
+        # The feed handler dies in the middle of a publication.
+        writer.ints[SEQ] += 1
+        assert reader.refresh() is None
+        assert reader.state == SYNCING
+        try:
+            reader.read(lambda book: book.best_bid_qty)
+            assert False, 'no error'
+        except StaleFeedError:
+            pass
+        # A restarted feed handler publishes again.
+        writer.ints[SEQ] += 1
+        bot.handlers['depthUpdate']({'u': 2, 'b': [(10000, 2.0)], 'a': []})
+        assert reader.refresh() is not None and reader.state == LIVE
+        assert reader.book.best_bid_qty == 2.0
+    finally:
+        reader.close()
+        writer.close()
+
+
+def test_reads_overlapping_a_publication_are_retried():
+    writer, bot, reader = feed()
+    try:
+        bot.handlers['depthUpdate']({'u': 1, 'b': [(10000, 1.0)], 'a': [(10001, 1.0)]})
+        calls = []
+
+        def best_bid_qty(book):
+            # A nested read runs as part of this one.
+            calls.append(book.best_bid_qty)
+            if len(calls) == 1:
+                # Published while this read runs: the result is discarded and the read runs again.
+                bot.handlers['depthUpdate']({'u': 2, 'b': [(10000, 5.0)], 'a': []})
+            return calls[-1]
+        assert reader.read(best_bid_qty) == 5.0
+        assert calls == [1.0, 5.0]
+        assert reader.update_id == 2
+    finally:
+        reader.close()
+        writer.close()
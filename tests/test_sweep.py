@@ -0,0 +1,80 @@
+import json
+import random
+
+from tradingbot.ordermanager import OrderManager
+from tradingbot.recorder import FRAME, SNAPSHOT, Recorder, read_records, recorded_files, write_records
+from tradingbot.sweep import Sweep, format_table, grid, parse_param, random_search, write_csv
+
+T0 = 1700000000000000000
+MS = 1000000
+
+
+class BidBelowTheTouch(OrderManager):
+    """Bids `offset` ticks below the best bid; swept by the tests below."""
+
+    offset = 0
+
+    async def place_orders(self):
+        book = self.binance_futures.depth
+        await self.converge_orders([{'price': book.tick_to_price(book.best_bid_tick - self.offset),
+                                     'quantity': 0.001}], [])
+
+
+def depth_update(U, u, pu, bids=(), asks=()):
+    return json.dumps({'stream': 'btcusdt@depth@0ms', 'data': {'e': 'depthUpdate', 'U': U, 'u': u, 'pu': pu,
+                                                               'b': list(bids), 'a': list(asks)}})
+
+
+def record(directory):
+    recorder = Recorder(directory)
+    recorder.record(FRAME, depth_update(99, 101, 98, [['100.0', '1']], [['100.1', '1']]), T0)
+    recorder.record(SNAPSHOT, json.dumps({'lastUpdateId': 100, 'bids': [['100.0', '1'], ['99.9', '1']],
+                                          'asks': [['100.1', '1']]}), T0 + MS)
+    recorder.record(FRAME, depth_update(102, 102, 101), T0 + 10 * MS)
+    recorder.record(FRAME, depth_update(103, 103, 102), T0 + 20 * MS)
+    # A trade at 99.9 fills the bids at the touch and one tick below, not the one two ticks below.
+    recorder.record(FRAME, json.dumps({'stream': 'btcusdt@trade',
+                                       'data': {'e': 'trade', 'p': '99.9', 'q': '3', 'm': True}}), T0 + 30 * MS)
+    recorder.record(FRAME, depth_update(104, 104, 103), T0 + 40 * MS)
+    recorder.close()
+
+
+def test_parameter_spaces():
+    assert grid({'a': [1, 2], 'b': [0.5]}) == [{'a': 1, 'b': 0.5}, {'a': 2, 'b': 0.5}]
+    assert parse_param('half_spread=1,2,3.5') == ('half_spread', [1, 2, 3.5])
+    assert parse_param('depth=0.01:0.1') == ('depth', (0.01, 0.1))
+    param_sets = random_search({'grid_num': (10, 40), 'depth': (0.01, 0.1), 'mode': ['a', 'b']}, 50, seed=1)
+    assert param_sets == random_search({'grid_num': (10, 40), 'depth': (0.01, 0.1), 'mode': ['a', 'b']}, 50, seed=1)
+    for params in param_sets:
+        assert isinstance(params['grid_num'], int) and 10 <= params['grid_num'] <= 40
+        assert isinstance(params['depth'], float) and 0.01 <= params['depth'] <= 0.1
+        assert params['mode'] in ('a', 'b')
+
+
+def test_write_records_unpacks_a_recording(tmp_path):
+    rng = random.Random(1)
+    records = [(FRAME, T0 + i, bytes(rng.getrandbits(8) for _ in range(rng.randint(0, 200)))) for i in range(3000)]
+    directory = str(tmp_path / 'recording')
+    recorder = Recorder(directory, max_file_size=8192)
+    for kind, timestamp, payload in records:
+        recorder.record(kind, payload, timestamp)
+    recorder.close()
+    path = str(tmp_path / 'unpacked.bfr')
+    assert write_records(read_records(recorded_files(directory)), path, block_size=4096) == len(records)
+    assert [(kind, timestamp, bytes(payload)) for kind, timestamp, payload in read_records([path])] == records
+
+
+def test_sweep_ranks_the_parameter_sets(tmp_path):
+    directory = str(tmp_path / 'recording')
+    record(directory)
+    sweep = Sweep(__name__, recorded_files(directory), grid({'offset': [0, 1, 2]}), workers=2, sort='fills',
+                  symbol='btcusdt', tick_size=0.1, event_driven=False, loop_interval=10)
+    results = sweep.run()
+    assert [(params['offset'], result['fills']) for params, result in results][-1] == (2, 0)
+    assert sorted(params['offset'] for params, result in results[:2]) == [0, 1]
+    assert all(result['fills'] == 1 for params, result in results[:2])
+    table = format_table(results).splitlines()
+    assert table[0].split()[:3] == ['rank', 'offset', 'pnl']
+    assert len(table) == 4
+    write_csv(results, str(tmp_path / 'results.csv'))
+    assert open(str(tmp_path / 'results.csv')).read().splitlines()[0].startswith('rank,offset,pnl,')
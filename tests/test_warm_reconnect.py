@@ -0,0 +1,90 @@
+import asyncio
+
+from tradingbot.binancefutures import LIVE, BinanceFutures
+from tradingbot.mockexchange import MockExchange
+from tradingbot.orderstore import CLOSED
+
+SINCE = 1700000000000
+
+
+def order(client_order_id, status='NEW', update_time=SINCE - 1000, symbol='BTCUSDT', price='100.0'):
+    return {'clientOrderId': client_order_id, 'symbol': symbol, 'side': 'BUY', 'price': price, 'origQty': '0.001',
+            'status': status, 'updateTime': update_time}
+
+
+def test_reconcile_orders_closes_the_orders_missed_while_disconnected():
+    async def run():
+        bot = BinanceFutures('key', 'secret', 'btcusdt', orderIDPrefix='bot_')
+        bot.set_tick_size(0.1)
+        for client_order_id, status, update_time in (('bot_open', 'NEW', SINCE - 1000),
+                                                     ('bot_gone', 'PARTIALLY_FILLED', SINCE - 1000),
+                                                     ('bot_pending', 'PENDING_NEW', SINCE - 1000),
+                                                     ('bot_late', 'NEW', SINCE + 10)):
+            bot.open_orders_ws.update(order(client_order_id, status, update_time))
+        bot.reconcile_orders([order('bot_open', 'PARTIALLY_FILLED', SINCE - 500),
+                              # Another process's order and another symbol's are not this bot's to track.
+                              order('other_open'),
+                              order('bot_eth', symbol='ETHUSDT')], SINCE)
+        store = bot.open_orders_ws
+        assert store.get('bot_open')['status'] == 'PARTIALLY_FILLED'
+        # Missing from the snapshot: filled or cancelled while the stream was down.
+        assert store.get('bot_gone')['status'] == CLOSED
+        # Not acknowledged yet, or changed after the snapshot was requested: the snapshot may not show them.
+        assert sorted(store.active) == ['bot_late', 'bot_open', 'bot_pending']
+        assert 'other_open' not in store and 'bot_eth' not in store
+        await bot.client.close()
+    asyncio.run(run())
+
+
+async def wait_for(condition, timeout=5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, 'timed out'
+        await asyncio.sleep(0.01)
+
+
+async def reconnect_with_a_resting_order(warm_reconnect):
+    """Rest an order, drop the stream connection and wait for the bot to be LIVE again; returns the mock, the bot, its
+       connect task, the order and the listen key before the drop."""
+    mock = await MockExchange(api_key='key', api_secret='secret', message_rate=100, trade_ratio=0, seed=1).start()
+    bot = BinanceFutures('key', 'secret', 'btcusdt', base_url=mock.base_url, stream_url=mock.stream_url,
+                         warm_reconnect=warm_reconnect)
+    bot.set_tick_size(mock.tick_size)
+    task = asyncio.create_task(bot.connect())
+    await wait_for(lambda: bot.book_state == LIVE)
+    resting = {'tick': bot.depth.best_bid_tick - 20, 'lots': 1, 'side': 'Buy'}
+    await bot.create_orders(resting)
+    listen_key = bot.listen_key
+    await mock.disconnect()
+    await wait_for(lambda: bot.reconnects == 1 and bot.book_state == LIVE)
+    return mock, bot, task, resting, listen_key
+
+
+async def close(mock, bot, task):
+    bot.closed = True
+    await bot.ws.close()
+    await task
+    await bot.client.close()
+    await mock.stop()
+
+
+def test_warm_reconnect_keeps_the_orders_listen_key_and_book():
+    async def run():
+        mock, bot, task, resting, listen_key = await reconnect_with_a_resting_order(True)
+        assert bot.listen_key == listen_key
+        assert list(bot.open_orders_active()) == [resting['newClientOrderId']]
+        assert resting['newClientOrderId'] in mock.orders and mock.resting['BUY']
+        # The book was resynced in place and follows the mock again.
+        await wait_for(lambda: bot.depth.best_bid_tick == max(mock.bids))
+        await close(mock, bot, task)
+    asyncio.run(run())
+
+
+def test_reconnect_is_cold_by_default():
+    async def run():
+        mock, bot, task, resting, listen_key = await reconnect_with_a_resting_order(False)
+        assert bot.listen_key != listen_key
+        # Every order of the symbol was cancelled before subscribing again.
+        assert mock.resting == {'BUY': {}, 'SELL': {}}
+        await close(mock, bot, task)
+    asyncio.run(run())
@@ -0,0 +1,108 @@
+import asyncio
+import hashlib
+import hmac
+import json
+
+import aiohttp
+from aiohttp import web
+
+from tradingbot.ratelimit import RateLimiter
+from tradingbot.wsapi import WebSocketAPIError, WebSocketOrderEntry
+
+
+async def serve(handle):
+    """A local WebSocket API calling `handle(ws, request)` for every request frame; returns the runner and its url."""
+    async def handler(request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        async for msg in ws:
+            await handle(ws, json.loads(msg.data))
+        return ws
+    app = web.Application()
+    app.router.add_get('/ws-fapi/v1', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    return runner, 'ws://127.0.0.1:%d/ws-fapi/v1' % runner.addresses[0][1]
+
+
+def order_entry(url, session, **kwargs):
+    return WebSocketOrderEntry(url, 'key', hmac.new(b'secret', digestmod=hashlib.sha256), session, **kwargs)
+
+
+def test_responses_are_matched_by_id():
+    async def run():
+        received = []
+
+        async def handle(ws, request):
+            received.append(request)
+            # Answer the first request last.
+            if len(received) == 3:
+                for request in reversed(received):
+                    await ws.send_json({'id': request['id'], 'status': 200, 'result': request['params']['n'],
+                                        'rateLimits': [{'rateLimitType': 'ORDERS', 'interval': 'SECOND',
+                                                        'intervalNum': 10, 'limit': 300, 'count': 20}]})
+        runner, url = await serve(handle)
+        session = aiohttp.ClientSession()
+        limiter = RateLimiter()
+        entry = order_entry(url, session, rate_limiter=limiter)
+        results = await asyncio.gather(*(entry.request('order.place', {'n': n}) for n in range(3)))
+        assert results == [0, 1, 2]
+        # Concurrent requests shared one connection.
+        assert len({request['id'] for request in received}) == 3
+        params = dict(received[0]['params'])
+        assert params['apiKey'] == 'key'
+        signature = params.pop('signature')
+        payload = '&'.join('%s=%s' % (key, params[key]) for key in sorted(params))
+        assert signature == hmac.new(b'secret', payload.encode('utf-8'), hashlib.sha256).hexdigest()
+        assert limiter.buckets['ORDERS_10S'].tokens <= 270 - 20
+        await entry.close()
+        await session.close()
+        await runner.cleanup()
+    asyncio.run(run())
+
+
+def test_error_response_raises():
+    async def run():
+        async def handle(ws, request):
+            await ws.send_json({'id': request['id'], 'status': 400,
+                                'error': {'code': -2011, 'msg': 'Unknown order sent.'}})
+        runner, url = await serve(handle)
+        session = aiohttp.ClientSession()
+        entry = order_entry(url, session)
+        try:
+            await entry.request('order.cancel', {'origClientOrderId': 'x'})
+            assert False, 'no error raised'
+        except WebSocketAPIError as e:
+            assert (e.status, e.code, e.msg) == (400, -2011, 'Unknown order sent.')
+        assert entry.pending == {}
+        await entry.close()
+        await session.close()
+        await runner.cleanup()
+    asyncio.run(run())
+
+
+def test_requests_in_flight_fail_when_the_connection_drops():
+    async def run():
+        async def handle(ws, request):
+            if request['params'].get('drop'):
+                await ws.close()
+            else:
+                await ws.send_json({'id': request['id'], 'status': 200, 'result': 'ok'})
+        runner, url = await serve(handle)
+        session = aiohttp.ClientSession()
+        entry = order_entry(url, session)
+        try:
+            await entry.request('order.place', {'drop': True})
+            assert False, 'no error raised'
+        except aiohttp.ClientConnectionError:
+            pass
+        await entry.reader
+        assert entry.ws is None
+        # The next request reconnects.
+        assert await entry.request('order.place', {}) == 'ok'
+        await entry.close()
+        await session.close()
+        await runner.cleanup()
+    asyncio.run(run())
@@ -0,0 +1,614 @@
+import argparse
+import asyncio
+import heapq
+import importlib
+import itertools
+import logging
+import math
+import time
+
+import numpy as np
+
+from tradingbot import settings
+from tradingbot.binancefutures import LIVE, BinanceFutures
+from tradingbot.codec import json_loads
+from tradingbot.ordermanager import OrderManager
+from tradingbot.ratelimit import RateLimiter
+from tradingbot.recorder import SNAPSHOT, read_records, recorded_files
+from tradingbot.wsapi import WebSocketAPIError
+
+# Recorded events replayed into the bot; user data events belong to the account that recorded them.
+MARKET_EVENTS = frozenset(['depthUpdate', 'trade', 'aggTrade'])
+
+TERMINAL_STATUSES = frozenset(['FILLED', 'CANCELED', 'EXPIRED'])
+
+
+###
+# Latency and queue position models
+###
+
+class ConstantLatency:
+    """Fixed order entry latency (bot to exchange) and response latency (exchange to bot), in seconds."""
+
+    def __init__(self, entry=0.005, response=0.005):
+        self.entry_ns = int(entry * 1e9)
+        self.response_ns = int(response * 1e9)
+
+    def entry(self, now):
+        return self.entry_ns
+
+    def response(self, now):
+        return self.response_ns
+
+
+class RiskAverseQueueModel:
+    """Our order only moves up the queue on trades at its price; cancels are assumed to come from behind it,
+       except that the quantity ahead can never exceed what is left on the level."""
+
+    def on_level(self, order, qty):
+        if qty < order.queue_ahead:
+            order.queue_ahead = qty
+        order.level_qty = qty
+
+
+class ProbQueueModel(RiskAverseQueueModel):
+    """Quantity leaving the level without trading is split between ahead of and behind our order in proportion to
+       f(ahead) / (f(ahead) + f(behind)) with f(x) = x ** power."""
+
+    def __init__(self, power=2):
+        self.power = power
+
+    def on_level(self, order, qty):
+        decrease = order.level_qty - qty
+        if decrease > 0:
+            front = order.queue_ahead
+            back = max(order.level_qty - front, 0)
+            f_front = front ** self.power
+            f_back = back ** self.power
+            if f_front + f_back > 0:
+                order.queue_ahead = max(front - decrease * f_front / (f_front + f_back), 0)
+        super().on_level(order, qty)
+
+
+###
+# Simulated exchange
+###
+
+class SimulatedOrder:
+    def __init__(self, client_order_id, order_id, side, price, tick, qty, time_in_force):
+        self.client_order_id = client_order_id
+        self.order_id = order_id
+        self.side = side
+        self.price = price
+        self.tick = tick
+        self.qty = qty
+        self.time_in_force = time_in_force
+        self.executed = 0.0
+        self.status = 'NEW'
+        self.update_time = 0
+        self.queue_ahead = 0.0
+        self.level_qty = 0.0
+        # False while the order is on its way to the exchange.
+        self.resting = False
+
+
+class SimulatedExchange:
+    """Matching engine for our own orders against the replayed market.
+
+    Requests take effect `latency.entry` after they are sent and the resulting ORDER_TRADE_UPDATE and ACCOUNT_UPDATE
+    events reach the bot `latency.response` later. A resting order fills when a trade prints through its price, or at
+    its price once the quantity ahead of it in the queue is used up. The book the orders are matched against is the
+    bot's own book at the replayed receive time."""
+
+    def __init__(self, symbol, book, latency=None, queue_model=None, maker_fee=0.0002, taker_fee=0.0004):
+        self.symbol = symbol.upper()
+        self.book = book
+        self.latency = latency if latency is not None else ConstantLatency()
+        self.queue_model = queue_model if queue_model is not None else RiskAverseQueueModel()
+        self.maker_fee = maker_fee
+        self.taker_fee = taker_fee
+        self.bot = None
+        self.now = 0
+        self.orders = {}
+        self.resting = {'BUY': {}, 'SELL': {}}
+        self.heap = []
+        self.seq = itertools.count()
+        self.order_ids = itertools.count(1)
+        self.requests = 0
+        self.position = 0.0
+        self.cash = 0.0
+        self.fees = 0.0
+        self.volume = 0.0
+        # (time in ns, side, price, qty, fee, maker)
+        self.fills = []
+
+    def schedule(self, at, fn, *args):
+        heapq.heappush(self.heap, (at, next(self.seq), fn, args))
+
+    def advance(self, now):
+        """Run everything due up to `now` (ns)."""
+        heap = self.heap
+        while heap and heap[0][0] <= now:
+            at, _, fn, args = heapq.heappop(heap)
+            self.now = at
+            fn(*args)
+        self.now = now
+
+    ###
+    # Requests
+    ###
+
+    def submit(self, method, params):
+        """Handle a WebSocket API order request; returns the result or raises WebSocketAPIError.
+           Responses carry the request time as updateTime, so that the events of the exchange processing the request
+           supersede them in the order store."""
+        self.requests += 1
+        arrival = self.now + self.latency.entry(self.now)
+        if method == 'order.place':
+            price = float(params['price'])
+            order = SimulatedOrder(params['newClientOrderId'], next(self.order_ids), params['side'], price,
+                                   self.book.price_to_tick(price), float(params['quantity']), params['timeInForce'])
+            order.update_time = self.now // 1000000
+            self.orders[order.client_order_id] = order
+            self.schedule(arrival, self.__arrive_place, order)
+            return self.__report(order)
+        order = self.orders.get(params['origClientOrderId'])
+        if order is None or order.status in TERMINAL_STATUSES:
+            if method == 'order.modify':
+                raise WebSocketAPIError(400, -2013, 'Order does not exist.')
+            raise WebSocketAPIError(400, -2011, 'Unknown order sent.')
+        if method == 'order.modify':
+            price = float(params['price'])
+            qty = float(params['quantity'])
+            self.schedule(arrival, self.__arrive_modify, order, price, qty)
+            result = self.__report(order)
+            result.update({'price': params['price'], 'origQty': params['quantity'], 'updateTime': self.now // 1000000})
+            return result
+        if method == 'order.cancel':
+            self.schedule(arrival, self.__arrive_cancel, order)
+            result = self.__report(order)
+            result.update({'status': 'CANCELED', 'updateTime': self.now // 1000000})
+            return result
+        raise WebSocketAPIError(400, -1100, 'Unknown method %s.' % method)
+
+    def cancel_all(self):
+        self.requests += 1
+        arrival = self.now + self.latency.entry(self.now)
+        for order in list(self.orders.values()):
+            if order.status not in TERMINAL_STATUSES:
+                self.schedule(arrival, self.__arrive_cancel, order)
+        return {'code': 200, 'msg': 'The operation of cancel all open order is done.'}
+
+    def open_orders(self):
+        return [self.__report(order) for order in self.orders.values() if order.status not in TERMINAL_STATUSES]
+
+    def __arrive_place(self, order):
+        if order.status != 'NEW':
+            # Cancelled before it got here.
+            return
+        self.__touch(order)
+        book = self.book
+        if order.side == 'BUY':
+            crossing = book.best_ask_tick is not None and order.tick >= book.best_ask_tick
+            touch = book.best_ask
+        else:
+            crossing = book.best_bid_tick is not None and order.tick <= book.best_bid_tick
+            touch = book.best_bid
+        if crossing:
+            if order.time_in_force == 'GTX':
+                self.__finish(order, 'EXPIRED')
+            else:
+                self.__fill(order, order.qty, touch, False)
+            return
+        self.__rest(order)
+        self.__emit(order, 0.0)
+
+    def __arrive_modify(self, order, price, qty):
+        if order.status != 'NEW':
+            return
+        self.__unrest(order)
+        order.price = price
+        order.tick = self.book.price_to_tick(price)
+        order.qty = qty
+        # A modified order loses its queue position.
+        self.__arrive_place(order)
+
+    def __arrive_cancel(self, order):
+        if order.status in TERMINAL_STATUSES:
+            return
+        self.__finish(order, 'CANCELED')
+
+    ###
+    # Matching
+    ###
+
+    def __rest(self, order):
+        qty = self.__level_qty(order.side, order.tick)
+        order.queue_ahead = qty
+        order.level_qty = qty
+        order.resting = True
+        self.resting[order.side].setdefault(order.tick, []).append(order)
+
+    def __unrest(self, order):
+        if not order.resting:
+            return
+        order.resting = False
+        level = self.resting[order.side][order.tick]
+        level.remove(order)
+        if not level:
+            del self.resting[order.side][order.tick]
+
+    def __level_qty(self, side, tick):
+        book = self.book
+        i = tick - book.origin
+        if side == 'BUY':
+            return float(book.bid_qty[i]) if 0 <= i < len(book.bid_qty) else 0.0
+        return float(book.ask_qty[i]) if 0 <= i < len(book.ask_qty) else 0.0
+
+    def on_depth(self, bids, asks):
+        """Update the queue position of our orders on the levels of a decoded depth update."""
+        for side, levels in (('BUY', bids), ('SELL', asks)):
+            resting = self.resting[side]
+            if not resting:
+                continue
+            for tick, qty in levels:
+                orders = resting.get(tick)
+                if orders:
+                    for order in orders:
+                        self.queue_model.on_level(order, qty)
+
+    def on_trade(self, price, qty, buyer_maker):
+        """Fill our orders against a trade. A buyer-maker trade is a sell hitting the bids."""
+        side = 'BUY' if buyer_maker else 'SELL'
+        resting = self.resting[side]
+        if not resting:
+            return
+        tick = self.book.price_to_tick(price)
+        for order_tick in list(resting):
+            if (order_tick > tick) if side == 'BUY' else (order_tick < tick):
+                # The trade printed through our price.
+                for order in list(resting[order_tick]):
+                    self.__fill(order, order.qty - order.executed, order.price, True)
+            elif order_tick == tick:
+                for order in list(resting[order_tick]):
+                    executed = qty - order.queue_ahead
+                    order.queue_ahead = max(order.queue_ahead - qty, 0.0)
+                    order.level_qty = max(order.level_qty - qty, 0.0)
+                    if executed > 0:
+                        self.__fill(order, min(executed, order.qty - order.executed), order.price, True)
+
+    def __fill(self, order, qty, price, maker):
+        qty = round(qty, 8)
+        if qty <= 0:
+            return
+        notional = price * qty
+        fee = notional * (self.maker_fee if maker else self.taker_fee)
+        sign = 1 if order.side == 'BUY' else -1
+        self.position = round(self.position + sign * qty, 8)
+        self.cash -= sign * notional + fee
+        self.fees += fee
+        self.volume += notional
+        self.fills.append((self.now, order.side, price, qty, fee, maker))
+        order.executed = round(order.executed + qty, 8)
+        if order.executed >= order.qty:
+            self.__finish(order, 'FILLED', qty)
+        else:
+            order.status = 'PARTIALLY_FILLED'
+            self.__touch(order)
+            self.__emit(order, qty)
+        self.__emit_account()
+
+    def __finish(self, order, status, last_qty=0.0):
+        self.__unrest(order)
+        order.status = status
+        self.__touch(order)
+        self.__emit(order, last_qty)
+
+    ###
+    # Events to the bot
+    ###
+
+    def __touch(self, order):
+        # Every event of an order must be newer than the last for the order store to take it, even within 1ms.
+        order.update_time = max(self.now // 1000000, order.update_time + 1)
+
+    def __report(self, order):
+        return {
+            'symbol': self.symbol,
+            'clientOrderId': order.client_order_id,
+            'orderId': order.order_id,
+            'side': order.side,
+            'price': str(order.price),
+            'origQty': str(order.qty),
+            'executedQty': str(order.executed),
+            'cumQty': str(order.executed),
+            'status': order.status,
+            'updateTime': order.update_time,
+        }
+
+    def __emit(self, order, last_qty):
+        data = {
+            'e': 'ORDER_TRADE_UPDATE',
+            'E': self.now // 1000000,
+            'o': {
+                's': self.symbol,
+                'c': order.client_order_id,
+                'S': order.side,
+                'q': str(order.qty),
+                'p': str(order.price),
+                'X': order.status,
+                'i': order.order_id,
+                'l': str(last_qty),
+                'z': str(order.executed),
+                'T': order.update_time,
+            }
+        }
+        self.schedule(self.now + self.latency.response(self.now), self.bot.handlers['ORDER_TRADE_UPDATE'], data)
+
+    def __emit_account(self):
+        data = {
+            'e': 'ACCOUNT_UPDATE',
+            'E': self.now // 1000000,
+            'a': {'P': [{'s': self.symbol, 'pa': str(self.position), 'ps': 'BOTH'}]}
+        }
+        self.schedule(self.now + self.latency.response(self.now), self.bot.handlers['ACCOUNT_UPDATE'], data)
+
+
+class SimulatedOrderEntry:
+    """Stands in for WebSocketOrderEntry, routing the order requests to a SimulatedExchange."""
+
+    def __init__(self, exchange):
+        self.exchange = exchange
+
+    async def connect(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def request(self, method, params, signed=True):
+        return self.exchange.submit(method, params)
+
+
+class BacktestBinanceFutures(BinanceFutures):
+    """BinanceFutures fed from a recording, with its order entry going to a SimulatedExchange.
+
+    Market data goes through the same handlers as live; the depth snapshots of a resync come from the recording."""
+
+    def __init__(self, symbol, tick_size, latency=None, queue_model=None, maker_fee=0.0002, taker_fee=0.0004,
+                 postOnly=False, orderIDPrefix='bot_bf_', step_size=0.001):
+        unlimited = RateLimiter(weight_limit=math.inf, order_limit_1m=math.inf, order_limit_10s=math.inf)
+        super().__init__('', '', symbol, postOnly=postOnly, orderIDPrefix=orderIDPrefix, rate_limiter=unlimited)
+        self.set_tick_size(tick_size, step_size)
+        self.tick_size = tick_size
+        self.step_size = step_size
+        self.exchange = SimulatedExchange(symbol, self.depth, latency, queue_model, maker_fee, taker_fee)
+        self.exchange.bot = self
+        self.ws_api = SimulatedOrderEntry(self.exchange)
+        self.snapshot_waiter = None
+        # A stale snapshot is retried with the next one in the recording, without waiting in real time.
+        self.resync_backoff = 0
+        # The latest recorded snapshot nobody was waiting for, handed to the next resync.
+        self.snapshot = None
+
+    async def warm_up(self, connections=2):
+        pass
+
+    async def get_symbol_info(self, symbol):
+        return {'symbol': symbol.upper(), 'filters': [{'filterType': 'PRICE_FILTER', 'tickSize': str(self.tick_size)},
+                                                      {'filterType': 'LOT_SIZE', 'stepSize': str(self.step_size)}]}
+
+    async def get_depth_snapshot(self, limit=1000):
+        if self.snapshot is not None:
+            data, self.snapshot = self.snapshot, None
+            return data
+        self.snapshot_waiter = asyncio.get_running_loop().create_future()
+        return await self.snapshot_waiter
+
+    def on_snapshot(self, data):
+        if self.snapshot_waiter is not None and not self.snapshot_waiter.done():
+            self.snapshot_waiter.set_result(data)
+        else:
+            # Recorded before the update that starts the resync, as the live bot requests it once subscribed.
+            self.snapshot = data
+
+    async def cancel_all_orders(self):
+        return self.exchange.cancel_all()
+
+    async def open_orders(self):
+        return self.exchange.open_orders()
+
+    async def open_position(self):
+        return str(self.exchange.position)
+
+    async def connect(self):
+        pass
+
+    async def close(self):
+        self.closed = True
+        await self.client.close()
+
+
+###
+# Replay
+###
+
+class BacktestResult:
+    """Fills and sampled mid, position and PnL of a backtest. Times are local receive times in ns."""
+
+    def __init__(self, exchange, times, mids, positions, pnls, messages, elapsed):
+        self.fills = exchange.fills
+        self.times = np.array(times, dtype=np.int64)
+        self.mids = np.array(mids)
+        self.positions = np.array(positions)
+        self.pnls = np.array(pnls)
+        self.fees = exchange.fees
+        self.volume = exchange.volume
+        self.messages = messages
+        self.elapsed = elapsed
+
+    def summary(self):
+        duration = (self.times[-1] - self.times[0]) / 1e9 if len(self.times) > 1 else 0.0
+        pnls = self.pnls
+        return {
+            'duration': duration,
+            'messages': self.messages,
+            'speedup': duration / self.elapsed if self.elapsed else 0.0,
+            'fills': len(self.fills),
+            'maker_fills': sum(1 for fill in self.fills if fill[5]),
+            'volume': self.volume,
+            'fees': self.fees,
+            'pnl': float(pnls[-1]) if len(pnls) else 0.0,
+            'max_drawdown': float(np.max(np.maximum.accumulate(pnls) - pnls)) if len(pnls) else 0.0,
+            'max_position': float(np.max(np.abs(self.positions))) if len(self.positions) else 0.0,
+            'final_position': float(self.positions[-1]) if len(self.positions) else 0.0,
+        }
+
+
+class Backtest:
+    """Replay recorded market data through an unmodified OrderManager subclass.
+
+    The strategy is scheduled in replayed time, either every `loop_interval` seconds or, event driven, on material
+    changes at most every `min_order_interval` seconds, and it is not called again before the responses to its last
+    order requests would have arrived. Mid, position and PnL are sampled every `sample_interval` seconds."""
+
+    def __init__(self, manager_class, paths, symbol=None, tick_size=0.1, latency=None, queue_model=None,
+                 maker_fee=0.0002, taker_fee=0.0004, event_driven=None, loop_interval=None, min_order_interval=None,
+                 sample_interval=1.0, post_only=None, step_size=0.001):
+        self.manager_class = manager_class
+        self.paths = paths
+        self.symbol = symbol if symbol is not None else settings.SYMBOL
+        self.tick_size = tick_size
+        self.step_size = step_size
+        self.latency = latency if latency is not None else ConstantLatency()
+        self.queue_model = queue_model
+        self.maker_fee = maker_fee
+        self.taker_fee = taker_fee
+        self.event_driven = event_driven if event_driven is not None else settings.EVENT_DRIVEN
+        self.loop_interval = loop_interval if loop_interval is not None else settings.LOOP_INTERVAL
+        self.min_order_interval = min_order_interval if min_order_interval is not None else settings.MIN_ORDER_INTERVAL
+        self.sample_interval = sample_interval
+        self.post_only = post_only if post_only is not None else settings.POST_ONLY
+
+    def records(self):
+        return read_records(self.paths)
+
+    async def run(self):
+        bf = BacktestBinanceFutures(self.symbol, self.tick_size, self.latency, self.queue_model, self.maker_fee,
+                                    self.taker_fee, postOnly=self.post_only, step_size=self.step_size)
+        exchange = bf.exchange
+        manager = self.manager_class()
+        manager.binance_futures = bf
+        manager.tick_size = self.tick_size
+        manager.run = True
+        manager.quote_state = None
+
+        handlers = bf.handlers
+        update_event = bf.update_event
+        book = bf.depth
+        loop_interval = int(self.loop_interval * 1e9)
+        min_order_interval = int(self.min_order_interval * 1e9)
+        sample_interval = int(self.sample_interval * 1e9)
+        event_driven = self.event_driven
+        last_run = next_run = next_sample = None
+        busy_until = 0
+        times, mids, positions, pnls = [], [], [], []
+        messages = 0
+        start = time.perf_counter()
+        try:
+            for kind, timestamp, payload in self.records():
+                if exchange.heap and exchange.heap[0][0] <= timestamp:
+                    exchange.advance(timestamp)
+                exchange.now = timestamp
+                if kind == SNAPSHOT:
+                    bf.on_snapshot(json_loads(bytes(payload)))
+                    await asyncio.sleep(0)
+                    continue
+                data = json_loads(bytes(payload))['data']
+                event = data['e']
+                if event not in MARKET_EVENTS:
+                    continue
+                messages += 1
+                handlers[event](data)
+                if bf.book_state != LIVE:
+                    # Let the resync task pick up the snapshot and the buffered updates.
+                    if bf.resync_task is not None:
+                        await asyncio.sleep(0)
+                    continue
+                if event == 'depthUpdate':
+                    exchange.on_depth(data['b'], data['a'])
+                else:
+                    exchange.on_trade(float(data['p']), float(data['q']), data['m'])
+
+                if next_sample is None:
+                    last_run = next_run = next_sample = timestamp
+                if timestamp >= next_sample:
+                    mid = book.mid
+                    if not math.isnan(mid):
+                        times.append(timestamp)
+                        mids.append(mid)
+                        positions.append(exchange.position)
+                        pnls.append(exchange.cash + exchange.position * mid)
+                    next_sample = timestamp + sample_interval
+
+                if timestamp < busy_until:
+                    continue
+                if event_driven:
+                    if timestamp - last_run < min_order_interval:
+                        continue
+                    heartbeat = timestamp - last_run >= loop_interval
+                    if not update_event.is_set() and not heartbeat:
+                        continue
+                    update_event.clear()
+                    if not manager.material_change() and not heartbeat:
+                        continue
+                elif timestamp < next_run:
+                    continue
+                requests = exchange.requests
+                await manager.run_place_orders()
+                last_run = timestamp
+                next_run = timestamp + loop_interval
+                if exchange.requests != requests:
+                    busy_until = timestamp + self.latency.entry(timestamp) + self.latency.response(timestamp)
+        finally:
+            await bf.close()
+        return BacktestResult(exchange, times, mids, positions, pnls, messages, time.perf_counter() - start)
+
+
+def load_manager_class(module_name):
+    """The OrderManager subclass defined in a strategy module."""
+    module = importlib.import_module(module_name)
+    for value in vars(module).values():
+        if isinstance(value, type) and issubclass(value, OrderManager) and value.__module__ == module.__name__:
+            return value
+    raise ValueError('No OrderManager subclass in %s.' % module_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded market data through a strategy.')
+    parser.add_argument('strategy', help='strategy module, e.g. tradingbot.gridtrading')
+    parser.add_argument('directory', help='recorder directory')
+    parser.add_argument('--symbol', default=settings.SYMBOL)
+    parser.add_argument('--tick-size', type=float, default=0.1)
+    parser.add_argument('--step-size', type=float, default=0.001)
+    parser.add_argument('--entry-latency', type=float, default=0.005, help='seconds')
+    parser.add_argument('--response-latency', type=float, default=0.005, help='seconds')
+    parser.add_argument('--queue-model', choices=['risk-averse', 'prob'], default='risk-averse')
+    parser.add_argument('--maker-fee', type=float, default=0.0002)
+    parser.add_argument('--taker-fee', type=float, default=0.0004)
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level)
+    queue_model = ProbQueueModel() if args.queue_model == 'prob' else RiskAverseQueueModel()
+    backtest = Backtest(load_manager_class(args.strategy), recorded_files(args.directory, args.symbol),
+                        symbol=args.symbol, tick_size=args.tick_size, step_size=args.step_size,
+                        latency=ConstantLatency(args.entry_latency, args.response_latency), queue_model=queue_model,
+                        maker_fee=args.maker_fee, taker_fee=args.taker_fee)
+    result = asyncio.run(backtest.run())
+    for key, value in result.summary().items():
+        print('%-15s %s' % (key, value))
+
+
+if __name__ == '__main__':
+    main()
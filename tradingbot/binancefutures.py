@@ -2,124 +2,434 @@ import asyncio
 import base64
 import hashlib
 import hmac
-import json
 import logging
 import time
 import urllib.parse
 import uuid
+from collections import deque
 
 import aiohttp
-from aiohttp import ClientSession, WSMsgType
+from aiohttp import WSMsgType
 from yarl import URL
 
+from tradingbot.codec import json_dumps, json_loads
+from tradingbot.features import BookFeatures
+from tradingbot.instrument import Instrument
+from tradingbot.messagequeue import MessageQueue
+from tradingbot.metrics import metrics
+from tradingbot.orderbook import OrderBook
+from tradingbot.orderstore import CLOSED, OrderStore
+from tradingbot.ratelimit import RateLimiter
+from tradingbot.recorder import FRAME, SNAPSHOT
+from tradingbot.wsapi import WebSocketAPIError, WebSocketOrderEntry
+
+# Book states: SYNCING while waiting for a snapshot to be bridged by the buffered updates, LIVE once it is.
+SYNCING = 'SYNCING'
+LIVE = 'LIVE'
+
+# Seconds to wait before requesting the depth snapshot again after a failed or stale one, doubling with every further
+# attempt up to RESYNC_BACKOFF_MAX.
+RESYNC_BACKOFF = 0.5
+RESYNC_BACKOFF_MAX = 30
+
+
+def create_session(connection_limit=20, keepalive_timeout=60, dns_cache_ttl=300):
+    # Keep-alive connections with cached DNS; aiohttp sets TCP_NODELAY on every connection it opens.
+    connector = aiohttp.TCPConnector(limit=connection_limit, keepalive_timeout=keepalive_timeout,
+                                     ttl_dns_cache=dns_cache_ttl)
+    return aiohttp.ClientSession(connector=connector, headers={ 'Content-Type': 'application/json' })
+
+
+# First arrival times of the last ARRIVAL_RING update or trade ids per stream, to measure how late the other copies are.
+ARRIVAL_RING = 4096
+# Seconds a depth update that skips ahead of the last one passed on is held, waiting for another link to deliver the
+# updates in between.
+LINK_HOLD = 0.05
+
+
+class MarketDataLink:
+    """One of several connections receiving the same market data, with its lead/lag statistics: how many of its
+       messages arrived first (leads) and, for the others, how long after the first copy (lag)."""
+
+    def __init__(self, symbol, index):
+        self.index = index
+        self.ws = None
+        self.messages = 0
+        self.leads = 0
+        self.lag_histogram = metrics.histogram('%s.md.link%d.lag' % (symbol, index))
+        metrics.gauge('%s.md.link%d.connected' % (symbol, index), lambda: self.ws is not None)
+        metrics.gauge('%s.md.link%d.lead_ratio' % (symbol, index), self.lead_ratio)
+
+    def lead_ratio(self):
+        return self.leads / self.messages if self.messages else None
+
 
 class BinanceFutures:
-    def __init__(self, api_key, api_secret, symbol='btcusdt', testnet=True, orderIDPrefix='bot_bf_', postOnly=False, timeout=10):
+    def __init__(self, api_key, api_secret, symbol='btcusdt', testnet=True, orderIDPrefix='bot_bf_', postOnly=False, timeout=10,
+                 max_pending_messages=10000, connection_limit=20, keepalive_timeout=60, dns_cache_ttl=300,
+                 rate_limiter=None, order_transport='rest', base_url=None, ws_api_url=None, stream_url=None,
+                 recorder=None, session=None, ws_api=None, market_data=True, user_data=True, warm_reconnect=False,
+                 market_data_connections=1, symbol_cache=None, message_batch=0, conflate_lag=None):
         self.api_key = api_key
         self.api_secret = api_secret
         self.symbol = symbol
-        self.client = aiohttp.ClientSession(headers={ 'Content-Type': 'application/json' })
+        # A session passed in is shared with other instances and is closed by its owner.
+        self.owns_session = session is None
+        if session is None:
+            session = create_session(connection_limit, keepalive_timeout, dns_cache_ttl)
+        self.client = session
+        self.client_timeout = aiohttp.ClientTimeout(total=timeout)
+        self.headers = {'X-MBX-APIKEY': api_key}
+        self.hmac = hmac.new(api_secret.encode('utf-8'), digestmod=hashlib.sha256)
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        metrics.gauge('rate_limit.headroom', self.rate_limiter.headroom)
+        if base_url is not None:
+            self.base_url = base_url
+        elif testnet:
+            self.base_url = 'https://testnet.binancefuture.com/fapi'
+        else:
+            self.base_url = 'https://fapi.binance.com/fapi'
+        if stream_url is not None:
+            self.stream_url = stream_url
+        elif testnet:
+            self.stream_url = 'wss://stream.binancefuture.com/stream'
+        else:
+            self.stream_url = 'wss://fstream.binance.com/stream'
+        # Order entry goes over REST or, with order_transport='ws', over a persistent WebSocket API connection.
+        # An existing WebSocketOrderEntry can be shared between instances.
+        self.ws_api = None
+        if order_transport == 'ws' and ws_api is not None:
+            self.ws_api = ws_api
+        elif order_transport == 'ws':
+            if ws_api_url is None:
+                if testnet:
+                    ws_api_url = 'wss://testnet.binancefuture.com/ws-fapi/v1'
+                else:
+                    ws_api_url = 'wss://ws-fapi.binance.com/ws-fapi/v1'
+            self.ws_api = WebSocketOrderEntry(ws_api_url, api_key, self.hmac, self.client, timeout, self.rate_limiter)
+        elif order_transport != 'rest':
+            raise ValueError('Unknown order transport: %s' % order_transport)
+        # Streams to subscribe to. Without user data the bot neither cancels orders nor tracks the position.
+        self.market_data = market_data
+        self.user_data = user_data
+        # After a drop, reconnect keeping the orders, the listen key and the book (see connect).
+        self.warm_reconnect = warm_reconnect
         self.closed = False
-        self.depth = {}
-        self.pending_messages = None
+        self.ws = None
+        self.keep_alive = None
+        self.listen_key = None
+        self.connected = False
+        self.reconnects = 0
+        # With market_data_connections > 1 the market data streams are also received over extra connections. Every
+        # message is applied from whichever connection delivers it first and the other copies are dropped unparsed, by
+        # the update id of depth updates and the trade id of trades. The connection carrying the user data stream is
+        # link 0.
+        self.links = []
+        self.mirrors = []
+        if market_data and market_data_connections > 1:
+            self.links = [MarketDataLink(symbol, i) for i in range(market_data_connections)]
+        # stream -> key of the id in its messages, and the last id applied
+        self.id_keys = {'%s@depth@0ms' % symbol: '"u":', '%s@trade' % symbol: '"t":', '%s@aggTrade' % symbol: '"a":'}
+        self.last_ids = {}
+        # Depth updates are passed on in sequence; those ahead of it wait here, by pu, for up to LINK_HOLD seconds.
+        self.depth_stream = '%s@depth@0ms' % symbol
+        self.held = {}
+        self.hold_timer = None
+        self.arrivals = {stream: ([0] * ARRIVAL_RING, [0.0] * ARRIVAL_RING) for stream in self.id_keys}
+        # Optional tradingbot.recorder.Recorder capturing the raw stream and the depth snapshots.
+        self.recorder = recorder
+        # With message_batch > 0 the frames are only queued as they are read and handled by another task, up to
+        # message_batch at a time and conflated once they lag conflate_lag seconds (see tradingbot.messagequeue).
+        # Otherwise each frame is handled as it is read.
+        self.message_queue = None
+        if message_batch > 0:
+            self.message_queue = MessageQueue('%s.stream' % symbol, self.__on_queued_message, message_batch,
+                                              conflate_lag, on_error=self.__drop_connection)
+        # Optional tradingbot.symbolcache.SymbolInfoCache for get_symbols_info.
+        self.symbol_cache = symbol_cache
+        # Price and quantity grid of the symbol; orders given as ticks and lots are formatted with it.
+        self.instrument = None
+        self.depth = OrderBook()
+        self.features = BookFeatures(self.depth)
         self.prev_u = None
+        # Depth updates are buffered while the book is SYNCING and replayed on top of the snapshot.
+        self.book_state = SYNCING
+        self.pending_messages = deque(maxlen=max_pending_messages)
+        self.pending_event = asyncio.Event()
+        self.resync_task = None
+        self.resync_started = None
+        self.resync_attempts = 0
+        self.resync_backoff = RESYNC_BACKOFF
+        self.last_resync_duration = None
+        self.gap_count = 0
+        self.dropped_messages = 0
         self.testnet = testnet
         self.timeout = timeout
         self.postOnly = postOnly
         self.orderIDPrefix = orderIDPrefix
         self.last_price = 0
-        self.open_orders_ws = {}
+        self.running_qty = '0'
+        self.open_orders_ws = OrderStore()
+        # Set whenever the book, trades, orders or position change; used to wake an event-driven strategy.
+        self.update_event = asyncio.Event()
+        # Latency metrics. quote_trigger_time is the time of the book change the current place_orders cycle acts on.
+        self.on_message_histogram = metrics.histogram('md.on_message')
+        self.event_latency_histogram = metrics.histogram('md.event_to_receive')
+        self.tick_to_order_histogram = metrics.histogram('order.tick_to_order')
+        self.last_update_time = None
+        self.quote_trigger_time = None
+        metrics.gauge('%s.book.gap_count' % symbol, lambda: self.gap_count)
+        metrics.gauge('%s.book.dropped_messages' % symbol, lambda: self.dropped_messages)
+        metrics.gauge('%s.book.last_resync_duration' % symbol, lambda: self.last_resync_duration)
+        metrics.gauge('%s.orders.active' % symbol, lambda: len(self.open_orders_ws.active))
+        metrics.gauge('%s.stream.reconnects' % symbol, lambda: self.reconnects)
         self.retries = 0  # initialize counter
+        self.handlers = {
+            'listenKeyExpired': self.__on_listen_key_expired,
+            'ACCOUNT_UPDATE': self.__on_account_update,
+            'ORDER_TRADE_UPDATE': self.__on_order_trade_update,
+            'depthUpdate': self.__on_depth_update,
+            'aggTrade': self.__on_trade,
+            'trade': self.__on_trade,
+        }
+
+    def set_tick_size(self, tick_size, step_size=0.001):
+        self.set_instrument(Instrument(self.symbol, tick_size, step_size))
+
+    def set_instrument(self, instrument):
+        self.instrument = instrument
+        self.depth.set_tick_size(instrument.tick_size)
+        self.open_orders_ws.set_tick_size(instrument.tick_size)
+        if self.book_state == LIVE:
+            # The book was cleared for the new tick size; the next update finds it out of sync and rebuilds it.
+            self.book_state = SYNCING
 
     def open_orders_active(self):
-        return {order_id: order for order_id, order in self.open_orders_ws.items() if order['status'] in ['PENDING_NEW', 'NEW', 'PARTIALLY_FILLED']}
+        return self.open_orders_ws.active
 
     async def __on_message(self, message):
-        message = json.loads(message)
-        logging.debug(message)
+        received = time.time()
+        start = time.perf_counter()
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug(message)
+        data = json_loads(message)['data']
+        handler = self.handlers.get(data['e'])
+        if handler is not None:
+            handler(data)
+        self.on_message_histogram.record(time.perf_counter() - start)
+        if 'E' in data:
+            self.event_latency_histogram.record(received - data['E'] / 1000)
+
+    def __on_queued_message(self, received, message):
+        """Handle a message parsed, and possibly conflated, by the message queue."""
+        start = time.perf_counter()
         data = message['data']
-        evt = data['e']
-        if evt == 'listenKeyExpired':
-            logging.warning('Listen key is expired.')
-            await self.ws.close()
-        elif evt == 'ACCOUNT_UPDATE':
-            account = data['a']
-            positions = account['P']
-            for position in positions:
-                position_side = position['ps']
-                if 'BOTH' == position_side:
-                    if position['s'].upper() == self.symbol.upper():
-                        self.running_qty = position['pa']
-        elif evt == 'ORDER_TRADE_UPDATE':
-            # timestamp = data['E']
-            order = data['o']
-            order_ = {
-                'symbol': order['s'],
-                'clientOrderId': order['c'],
-                'side': order['S'],
-                'origQty': order['q'],
-                'price': order['p'],
-                'status': order['X'],
-                'orderId': order['i'],
-                'executedQty': order['l'],
-                'cumQty': order['z'],
-                'updateTime': order['T']
-            }
-            existing_order = self.open_orders_ws.setdefault(order['c'], order_)
-            if 'updateTime' not in existing_order or existing_order['updateTime'] < order_['updateTime']:
-                existing_order.update(order_)
-            now = time.time()
-            for order_id, order in list(self.open_orders_ws.items()):
-                if order['status'] not in ['PENDING_NEW', 'NEW', 'PARTIALLY_FILLED'] \
-                        and order['updateTime'] < (now - 300) * 1000:
-                    del self.open_orders_ws[order_id]
-        elif evt == 'depthUpdate':
-            data = message['data']
-            u = data['u']
-            pu = data['pu']
-            if self.prev_u is None or pu != self.prev_u:
-                if self.pending_messages is None:
-                    logging.warning('Mismatch on the book. prev_update_id=%s, pu=%s' % (self.prev_u, pu))
-                    asyncio.create_task(self.__get_marketdepth_snapshot())
-                    self.pending_messages = []
-                self.pending_messages.append(data)
-                return
-            for price, qty in data['b']:
-                if qty == '0':
-                    del self.depth[price]
-                else:
-                    self.depth[price] = float(qty)
-            for price, qty in data['a']:
-                if qty == '0':
-                    del self.depth[price]
-                else:
-                    self.depth[price] = -float(qty)
-            self.prev_u = u
-        elif evt == 'aggTrade':
-            data = message['data']
-            price = data['p']
-            qty = data['q']
-            self.last_price = price
-            self.last_qty = qty
-        elif evt == 'trade':
-            data = message['data']
-            price = data['p']
-            qty = data['q']
-            self.last_price = price
-            self.last_qty = qty
+        handler = self.handlers.get(data['e'])
+        if handler is not None:
+            handler(data)
+        self.on_message_histogram.record(time.perf_counter() - start)
+        if 'E' in data:
+            self.event_latency_histogram.record(received - data['E'] / 1000)
+
+    def __drop_connection(self):
+        """Close the stream after a queued message failed, so that connect reconnects."""
+        if self.ws is not None:
+            asyncio.create_task(self.ws.close())
+
+    async def __on_link_message(self, message, link):
+        """Handle a message of a redundant market data link, unless another link delivered it first. The stream name
+           and the ids are read off the text, so a duplicate costs a few finds and is never parsed.
+
+        Depth updates are passed on in sequence, each with the pu of the u passed on last; anything at or below that u
+        is a duplicate. An update skipping ahead is held while another link is up, as that link may still deliver the
+        updates in between; after LINK_HOLD seconds the held updates are passed on all the same and the book resyncs."""
+        if message.startswith('{"stream":"'):
+            stream = message[11:message.find('"', 11)]
+            key = self.id_keys.get(stream)
+            i = message.find(key) if key is not None else -1
+            if i >= 0:
+                i += len(key)
+                id_ = int(message[i:message.find(',', i)])
+                received = time.perf_counter()
+                link.messages += 1
+                ids, times = self.arrivals[stream]
+                slot = id_ % ARRIVAL_RING
+                last_id = self.last_ids.get(stream, 0)
+                duplicate = id_ <= last_id
+                depth = not duplicate and stream == self.depth_stream
+                if depth:
+                    i = message.find('"pu":', i) + 5
+                    pu = int(message[i:message.find(',', i)])
+                    duplicate = pu in self.held
+                if duplicate:
+                    if ids[slot] == id_:
+                        link.lag_histogram.record(received - times[slot])
+                    return
+                ids[slot] = id_
+                times[slot] = received
+                link.leads += 1
+                if depth and last_id and pu > last_id and \
+                        any(other.ws is not None for other in self.links if other is not link):
+                    self.held[pu] = (id_, message)
+                    if self.hold_timer is None:
+                        self.hold_timer = asyncio.get_running_loop().call_later(
+                            LINK_HOLD, lambda: asyncio.create_task(self.__release_held()))
+                    return
+                self.last_ids[stream] = id_
+                if depth and self.held:
+                    await self.__deliver(message)
+                    await self.__release_chain()
+                    return
+        if self.recorder is not None:
+            self.recorder.record(FRAME, message)
+        if self.message_queue is not None:
+            self.message_queue.put(message)
+            return
+        await self.__on_message(message)
+
+    async def __deliver(self, message):
+        if self.recorder is not None:
+            self.recorder.record(FRAME, message)
+        if self.message_queue is not None:
+            self.message_queue.put(message)
+            return
+        await self.__on_message(message)
+
+    async def __release_chain(self):
+        """Pass on the held depth updates that follow on from the last one passed on."""
+        held = self.held
+        stream = self.depth_stream
+        while True:
+            item = held.pop(self.last_ids[stream], None)
+            if item is None:
+                break
+            self.last_ids[stream], message = item
+            await self.__deliver(message)
+        for pu in [pu for pu in held if pu < self.last_ids[stream]]:
+            del held[pu]
+        if not held:
+            self.__cancel_hold()
+
+    async def __release_held(self):
+        """No link filled the gap in time: pass on the held depth updates, leaving the book to resync."""
+        self.hold_timer = None
+        if not self.held:
+            return
+        logging.warning('Market data gap on every link. symbol=%s, prev_update_id=%s, held=%d'
+                        % (self.symbol, self.last_ids.get(self.depth_stream), len(self.held)))
+        held, self.held = self.held, {}
+        for pu in sorted(held):
+            self.last_ids[self.depth_stream], message = held[pu]
+            await self.__deliver(message)
+
+    def __cancel_hold(self):
+        if self.hold_timer is not None:
+            self.hold_timer.cancel()
+            self.hold_timer = None
+
+    def __on_listen_key_expired(self, data):
+        logging.warning('Listen key is expired.')
+        self.listen_key = None
+        if self.ws is not None:
+            asyncio.create_task(self.ws.close())
+
+    def __on_account_update(self, data):
+        account = data['a']
+        positions = account['P']
+        for position in positions:
+            position_side = position['ps']
+            if 'BOTH' == position_side:
+                if position['s'].upper() == self.symbol.upper():
+                    self.running_qty = position['pa']
+        self.update_event.set()
+
+    def __on_order_trade_update(self, data):
+        # timestamp = data['E']
+        order = data['o']
+        order_ = {
+            'symbol': order['s'],
+            'clientOrderId': order['c'],
+            'side': order['S'],
+            'origQty': order['q'],
+            'price': order['p'],
+            'status': order['X'],
+            'orderId': order['i'],
+            'executedQty': order['l'],
+            'cumQty': order['z'],
+            'updateTime': order['T']
+        }
+        self.open_orders_ws.update(order_)
+        self.open_orders_ws.purge(time.time() * 1000)
+        self.update_event.set()
+
+    def __on_depth_update(self, data):
+        # Convert the price levels to (tick, qty) once, whether they are applied now or buffered for a resync.
+        data['b'] = self.depth.decode(data['b'])
+        data['a'] = self.depth.decode(data['a'])
+        if self.book_state == LIVE and data['pu'] == self.prev_u:
+            self.depth.apply(data['b'], data['a'])
+            self.prev_u = data['u']
+            self.last_update_time = time.perf_counter()
+            self.update_event.set()
+            return
+        if self.resync_task is None:
+            if self.book_state == LIVE:
+                self.gap_count += 1
+            logging.warning('Mismatch on the book. prev_update_id=%s, pu=%s' % (self.prev_u, data['pu']))
+            self.__start_resync()
+        if len(self.pending_messages) == self.pending_messages.maxlen:
+            self.dropped_messages += 1
+        self.pending_messages.append(data)
+        self.pending_event.set()
+
+    def __on_trade(self, data):
+        self.last_price = data['p']
+        self.last_qty = data['q']
+        self.update_event.set()
 
     async def __keep_alive(self):
         while not self.closed:
             try:
                 await asyncio.sleep(5)
-                await self.keepalive_user_data_stream()
+                if self.user_data:
+                    await self.keepalive_user_data_stream()
                 await self.ws.pong()
-            except:
+            except Exception:
                 pass
 
-    async def __curl_binancefutures(self, path, query=None, timeout=None, verb=None, rethrow_errors=True, max_retries=None):
+    def __encode_query(self, query):
+        """Url-encode the request parameters once; list parameters such as batchOrders are sent as JSON."""
+        if not query:
+            return ''
+        return urllib.parse.urlencode({key: json_dumps(value) if isinstance(value, (list, dict)) else value
+                                       for key, value in query.items()})
+
+    def __sign(self, query):
+        """Append the timestamp and the signature to an encoded query, copying the pre-keyed HMAC."""
+        timestamp = 'timestamp=%d' % (int(time.time() * 1000) - 1000)
+        query = '%s&%s' % (query, timestamp) if query else timestamp
+        signature = self.hmac.copy()
+        signature.update(query.encode('utf-8'))
+        return '%s&signature=%s' % (query, signature.hexdigest())
+
+    async def warm_up(self, connections=2):
+        """Open `connections` keep-alive connections to the REST endpoint ahead of the first order."""
+        async def ping():
+            async with self.client.get(self.base_url + '/v1/ping', timeout=self.client_timeout) as response:
+                await response.read()
+        try:
+            await asyncio.gather(*(ping() for _ in range(connections)))
+            if self.ws_api is not None:
+                await self.ws_api.connect()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            logging.warning('Connection warm-up failed.', exc_info=True)
+
+    async def __curl_binancefutures(self, path, query=None, timeout=None, verb=None, rethrow_errors=True, max_retries=None,
+                                    weight=1, orders=0):
         if timeout is None:
-            timeout = self.timeout
+            timeout = self.client_timeout
+        else:
+            timeout = aiohttp.ClientTimeout(total=timeout)
 
         # Default to POST if data is attached, GET otherwise
         if not verb:
@@ -132,13 +442,10 @@ class BinanceFutures:
         if max_retries is None:
             max_retries = 0 if verb in ['POST', 'PUT'] else 3
 
-        if query is None:
-            query = {}
-        query['timestamp'] = str(int(time.time() * 1000) - 1000)
-        query = urllib.parse.urlencode(query)
-        query = query.replace('%27', '%22')
-        signature = hmac.new(self.api_secret.encode('utf-8'), query.encode('utf-8'), hashlib.sha256).hexdigest()
+        # The parameters are encoded once; only the timestamp and the signature are redone on a retry.
+        return await self.__send(verb, path, self.__encode_query(query), timeout, rethrow_errors, max_retries, weight, orders)
 
+    async def __send(self, verb, path, query, timeout, rethrow_errors, max_retries, weight, orders):
         def exit_or_throw(e):
             if rethrow_errors:
                 raise e
@@ -148,17 +455,19 @@ class BinanceFutures:
         def retry():
             self.retries += 1
             if self.retries > max_retries:
-                raise Exception("Max retries on %s (%s) hit, raising." % (path, json.dumps(query or '')))
-            return self.__curl_binancefutures(path, query, timeout, verb, rethrow_errors, max_retries)
+                raise Exception("Max retries on %s (%s) hit, raising." % (path, query))
+            return self.__send(verb, path, query, timeout, rethrow_errors, max_retries, weight, orders)
 
-        # Make the request
+        # Wait for the request's weight and order count to fit within the rate limits, then sign it.
+        await self.rate_limiter.acquire(weight, orders)
+        url = URL('%s%s?%s' % (self.base_url, path, self.__sign(query)), encoded=True)
         try:
-            if self.testnet:
-                url = URL('https://testnet.binancefuture.com/fapi%s?%s&signature=%s' % (path, query, signature), encoded=True)
-            else:
-                url = URL('https://fapi.binance.com/fapi%s?%s&signature=%s' % (path, query, signature), encoded=True)
-            logging.debug("sending req to %s: %s" % (url, json.dumps(query or query or '')))
-            response = await self.client.request(verb, url, headers={'X-MBX-APIKEY': self.api_key}, timeout=timeout)
+            if logging.root.isEnabledFor(logging.DEBUG):
+                logging.debug("sending req to %s: %s" % (url, query))
+            start = time.perf_counter()
+            response = await self.client.request(verb, url, headers=self.headers, timeout=timeout)
+            metrics.record('rest.%s %s' % (verb, path), time.perf_counter() - start)
+            self.rate_limiter.update(response.headers)
             # Make non-200s throw
             response.raise_for_status()
 
@@ -177,32 +486,31 @@ class BinanceFutures:
             #     if verb == 'DELETE':
             #         logging.error("Order not found: %s" % query['orderId'])
             #         return
-            #     logging.error("Unable to contact the Binance Futures API (404). " + "Request: %s \n %s" % (url, json.dumps(query)))
+            #     logging.error("Unable to contact the Binance Futures API (404). " + "Request: %s \n %s" % (url, query))
             #     exit_or_throw(e)
 
-            # 429, ratelimit; cancel orders & wait until X-RateLimit-Reset
-            elif e.status == 429:
-                logging.error("Ratelimited on current request. Sleeping, then trying again. Try fewer " + "Request: %s \n %s" % (url, json.dumps(query)))
-                logging.warning("Canceling all known orders in the meantime.")
+            # 429, ratelimit (418 once banned); hold every request until Retry-After, then cancel orders and retry.
+            # The wait is asynchronous so that market data keeps flowing.
+            elif e.status in (418, 429):
+                logging.error("Ratelimited on current request. Sleeping, then trying again. Try fewer " + "Request: %s \n %s" % (url, query))
+                to_sleep = int(e.headers.get('Retry-After', 5)) if e.headers else 5
+                logging.error("Sleeping for %d seconds." % (to_sleep))
+                self.rate_limiter.block(to_sleep)
 
+                logging.warning("Canceling all known orders in the meantime.")
                 await self.cancel_all_orders()
 
-                #logging.error("Your ratelimit will reset at %s. Sleeping for %d seconds." % (reset_str, to_sleep))
-                to_sleep = 5
-                logging.error("Sleeping for %d seconds." % (to_sleep))
-                time.sleep(to_sleep)
-
                 # Retry the request.
                 return await retry()
 
             elif e.status == 502:
-                logging.warning("Unable to contact the Binance Futures API (502), retrying. " + "Request: %s \n %s" % (url, json.dumps(query)))
+                logging.warning("Unable to contact the Binance Futures API (502), retrying. " + "Request: %s \n %s" % (url, query))
                 await asyncio.sleep(3)
                 return await retry()
 
             # 503 - Binance Futures temporary downtime, likely due to a deploy. Try again
             elif e.status == 503:
-                logging.warning("Unable to contact the Binance Futures API (503), retrying. " + "Request: %s \n %s" % (url, json.dumps(query)))
+                logging.warning("Unable to contact the Binance Futures API (503), retrying. " + "Request: %s \n %s" % (url, query))
                 await asyncio.sleep(3)
                 return await retry()
 
@@ -210,31 +518,102 @@ class BinanceFutures:
                 pass
             # If we haven't returned or re-raised yet, we get here.
             logging.error("Unhandled Error: %s: %s" % (e, e.message))
-            logging.error("Endpoint was: %s %s: %s" % (verb, path, json.dumps(query)))
+            logging.error("Endpoint was: %s %s: %s" % (verb, path, query))
             exit_or_throw(e)
 
         except asyncio.TimeoutError as e:
             # Timeout, re-run this request
-            logging.warning("Timed out on request: %s (%s), retrying..." % (path, json.dumps(query or '')))
+            logging.warning("Timed out on request: %s (%s), retrying..." % (path, query))
             return await retry()
 
         except aiohttp.ClientConnectionError as e:
-            logging.warning("Unable to contact the Binance Futures API (%s). Please check the URL. Retrying. Request: %s \n %s" % (e, url, json.dumps(query)))
+            logging.warning("Unable to contact the Binance Futures API (%s). Please check the URL. Retrying. Request: %s \n %s" % (e, url, query))
             await asyncio.sleep(1)
             return await retry()
 
         # Reset retry counter on success
         self.retries = 0
-        return await response.json()
+        return await response.json(loads=json_loads)
 
     async def get_symbol_info(self, symbol):
+        return (await self.get_symbols_info([symbol])).get(symbol.upper())
+
+    async def get_symbols_info(self, symbols, on_refresh=None):
+        """Symbol information of several symbols, by upper case symbol.
+
+        With a symbol_cache holding every symbol the information comes from disk. A stale entry is used all the same
+        and refreshed in the background; `on_refresh` is then called with the information of the symbols that
+        changed, if any. Otherwise all symbols are downloaded with one exchangeInfo request and cached."""
+        symbols = set(symbol.upper() for symbol in symbols)
+        if self.symbol_cache is not None:
+            cached, age = self.symbol_cache.load(self.base_url)
+            if cached is not None and symbols <= cached.keys():
+                if age > self.symbol_cache.ttl:
+                    asyncio.create_task(self.__refresh_symbols_info(symbols, cached, on_refresh))
+                return {symbol: cached[symbol] for symbol in symbols}
+        symbols_info = await self.__download_symbols_info()
+        return {symbol: info for symbol, info in symbols_info.items() if symbol in symbols}
+
+    async def __download_symbols_info(self):
         resp = await self.__curl_binancefutures(verb='GET', path='/v1/exchangeInfo')
-        for x in resp['symbols']:
-            if x['symbol'].upper() == symbol.upper():
-                return x
+        symbols_info = {x['symbol'].upper(): x for x in resp['symbols']}
+        if self.symbol_cache is not None:
+            self.symbol_cache.save(self.base_url, symbols_info)
+        return symbols_info
+
+    async def __refresh_symbols_info(self, symbols, cached, on_refresh):
+        try:
+            symbols_info = await self.__download_symbols_info()
+        except Exception:
+            logging.warning('Refreshing the symbol information failed.', exc_info=True)
+            return
+        changed = {symbol: symbols_info[symbol] for symbol in symbols
+                   if symbol in symbols_info and symbols_info[symbol] != cached[symbol]}
+        if changed:
+            logging.warning('Symbol information changed. symbols=%s' % ','.join(sorted(changed)))
+            if on_refresh is not None:
+                on_refresh(changed)
+
+    async def __ws_api_request(self, method, params, weight=1, orders=0):
+        await self.rate_limiter.acquire(weight, orders)
+        start = time.perf_counter()
+        resp = await self.ws_api.request(method, params)
+        metrics.record('ws_api.%s' % method, time.perf_counter() - start)
+        return resp
+
+    def __encode_order(self, order):
+        """Replace the tick and lots of an order with the price and quantity strings sent on the wire; returns the
+           tick. Orders may also be given with price and quantity strings."""
+        tick = order.pop('tick', None)
+        if tick is not None:
+            order['price'] = self.instrument.format_price(tick)
+        lots = order.pop('lots', None)
+        if lots is not None:
+            order['quantity'] = self.instrument.format_qty(lots)
+        return tick
+
+    def __record_tick_to_order(self):
+        if self.quote_trigger_time is not None:
+            self.tick_to_order_histogram.record(time.perf_counter() - self.quote_trigger_time)
+
+    async def __ws_api_batch(self, method, batch, weight=1, orders=0):
+        """Send the requests of a batch concurrently over the WebSocket API and shape the results like a REST batch
+           response: error responses become {'code', 'msg'} items, connection errors and timeouts are raised."""
+        results = await asyncio.gather(*(self.__ws_api_request(method, params, weight, orders) for params in batch),
+                                       return_exceptions=True)
+        resp = []
+        for result in results:
+            if isinstance(result, WebSocketAPIError):
+                resp.append({'code': result.code, 'msg': result.msg})
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                resp.append(result)
+        return resp
 
     async def create_orders(self, order):
         """Create a single order."""
+        tick = self.__encode_order(order)
         order['newClientOrderId'] = self.orderIDPrefix + base64.b64encode(uuid.uuid4().bytes).decode('utf8').replace('+', '').replace('/', '').rstrip('=\n')
         order['symbol'] = self.symbol
         order['side'] = order['side'].upper()
@@ -246,19 +625,22 @@ class BinanceFutures:
         pending_order = order.copy()
         pending_order['status'] = 'PENDING_NEW'
         pending_order['clientOrderId'] = order['newClientOrderId']
-        self.open_orders_ws[order['newClientOrderId']] = pending_order
+        if tick is not None:
+            pending_order['tick'] = tick
+        self.open_orders_ws.update(pending_order)
         try:
-            resp = await self.__curl_binancefutures(verb='POST', path='/v1/order', query=order,
-                                                    max_retries=0)
-            order_id = resp['clientOrderId']
-            order = self.open_orders_ws[order_id]
-            if 'updateTime' not in order or order['updateTime'] < resp['updateTime']:
-                order.update(resp)
+            self.__record_tick_to_order()
+            if self.ws_api is not None:
+                resp = await self.__ws_api_request('order.place', order, weight=0, orders=1)
+            else:
+                resp = await self.__curl_binancefutures(verb='POST', path='/v1/order', query=order,
+                                                        max_retries=0, weight=0, orders=1)
+            self.open_orders_ws.update(resp)
             return resp
-        except (aiohttp.ClientResponseError, aiohttp.ClientConnectionError, asyncio.TimeoutError):
+        except (aiohttp.ClientResponseError, aiohttp.ClientConnectionError, asyncio.TimeoutError, WebSocketAPIError):
             order = self.open_orders_ws.get(pending_order['newClientOrderId'])
             if order is not None and order['status'] == 'PENDING_NEW':
-                del self.open_orders_ws[pending_order['newClientOrderId']]
+                self.open_orders_ws.remove(pending_order['newClientOrderId'])
             raise
 
     async def create_bulk_orders(self, orders):
@@ -267,6 +649,7 @@ class BinanceFutures:
             raise Exception('The number of orders cannot exceed 5.')
         pending_orders = []
         for order in orders:
+            tick = self.__encode_order(order)
             order['newClientOrderId'] = self.orderIDPrefix + base64.b64encode(uuid.uuid4().bytes).decode('utf8').replace('+', '').replace('/', '').rstrip('=\n')
             order['symbol'] = self.symbol
             order['side'] = order['side'].upper()
@@ -278,42 +661,99 @@ class BinanceFutures:
             pending_order = order.copy()
             pending_order['status'] = 'PENDING_NEW'
             pending_order['clientOrderId'] = order['newClientOrderId']
-            self.open_orders_ws[order['newClientOrderId']] = pending_order
+            if tick is not None:
+                pending_order['tick'] = tick
+            self.open_orders_ws.update(pending_order)
             pending_orders.append(pending_order)
         try:
-            resp = await self.__curl_binancefutures(verb='POST', path='/v1/batchOrders', query={'batchOrders': orders},
-                                                    max_retries=0)
-            for item in resp:
-                order_id = item['clientOrderId']
-                order = self.open_orders_ws[order_id]
-                if 'updateTime' not in order or order['updateTime'] < item['updateTime']:
-                    order.update(item)
+            self.__record_tick_to_order()
+            if self.ws_api is not None:
+                resp = await self.__ws_api_batch('order.place', orders, weight=0, orders=1)
+            else:
+                resp = await self.__curl_binancefutures(verb='POST', path='/v1/batchOrders', query={'batchOrders': orders},
+                                                        max_retries=0, weight=5, orders=len(orders))
+            # The batch response lists the results in request order; rejected orders come back as error items.
+            for pending_order, item in zip(pending_orders, resp):
+                if 'code' in item:
+                    logging.warning('create_bulk_orders: error response=%s' % str(item))
+                    order = self.open_orders_ws.get(pending_order['clientOrderId'])
+                    if order is not None and order['status'] == 'PENDING_NEW':
+                        self.open_orders_ws.remove(pending_order['clientOrderId'])
+                    continue
+                self.open_orders_ws.update(item)
             return resp
         except (aiohttp.ClientResponseError, aiohttp.ClientConnectionError, asyncio.TimeoutError):
             for pending_order in pending_orders:
                 order = self.open_orders_ws.get(pending_order['newClientOrderId'])
                 if order is not None and order['status'] == 'PENDING_NEW':
-                    del self.open_orders_ws[pending_order['newClientOrderId']]
+                    self.open_orders_ws.remove(pending_order['newClientOrderId'])
             raise
 
+    async def amend_orders(self, order):
+        """Modify the price and quantity of a single open order identified by its clientOrderId."""
+        self.__encode_order(order)
+        query = {
+            'symbol': self.symbol,
+            'origClientOrderId': order['clientOrderId'],
+            'side': order['side'].upper(),
+            'price': order['price'],
+            'quantity': order['quantity']
+        }
+        self.__record_tick_to_order()
+        if self.ws_api is not None:
+            resp = await self.__ws_api_request('order.modify', query, weight=1, orders=1)
+        else:
+            resp = await self.__curl_binancefutures(verb='PUT', path='/v1/order', query=query,
+                                                    max_retries=0, weight=1, orders=1)
+        self.open_orders_ws.update(resp)
+        return resp
+
+    async def amend_bulk_orders(self, orders):
+        """Modify multiple open orders."""
+        if len(orders) > 5:
+            raise Exception('The number of orders cannot exceed 5.')
+        for order in orders:
+            self.__encode_order(order)
+        batch = [{
+            'symbol': self.symbol,
+            'origClientOrderId': order['clientOrderId'],
+            'side': order['side'].upper(),
+            'price': order['price'],
+            'quantity': order['quantity']
+        } for order in orders]
+        self.__record_tick_to_order()
+        if self.ws_api is not None:
+            resp = await self.__ws_api_batch('order.modify', batch, weight=1, orders=1)
+        else:
+            resp = await self.__curl_binancefutures(verb='PUT', path='/v1/batchOrders', query={'batchOrders': batch},
+                                                    max_retries=0, weight=5, orders=len(orders))
+        for item in resp:
+            if 'code' in item:
+                logging.warning('amend_bulk_orders: error response=%s' % str(item))
+                continue
+            self.open_orders_ws.update(item)
+        return resp
+
     async def cancel_bulk_orders(self, origClientOrderIdList):
         if len(origClientOrderIdList) > 10:
             raise Exception('The number of orders cannot exceed 10.')
-        resp = await self.__curl_binancefutures(verb='DELETE', path='/v1/batchOrders',
-                                                query={'symbol': self.symbol, 'origClientOrderIdList': origClientOrderIdList},
-                                                max_retries=0)
+        if self.ws_api is not None:
+            resp = await self.__ws_api_batch('order.cancel', [{'symbol': self.symbol, 'origClientOrderId': order_id}
+                                                              for order_id in origClientOrderIdList], weight=1)
+        else:
+            resp = await self.__curl_binancefutures(verb='DELETE', path='/v1/batchOrders',
+                                                    query={'symbol': self.symbol, 'origClientOrderIdList': origClientOrderIdList},
+                                                    max_retries=0)
         for item in resp:
             if 'code' in item:
                 if item['code'] != -2011:
                     logging.warning('cancel_bulk_orders: error response=%s' % str(item))
                 continue
-            order_id = item['clientOrderId']
-            order = self.open_orders_ws[order_id]
-            if 'updateTime' not in order or order['updateTime'] < item['updateTime']:
-                order.update(item)
+            self.open_orders_ws.update(item)
         return resp
 
     async def cancel_all_orders(self):
+        # The WebSocket API has no cancel-all method, so this always goes over REST.
         resp = await self.__curl_binancefutures(verb='DELETE', path='/v1/allOpenOrders', query={'symbol': self.symbol})
         # if resp['code'] == '200':
         #     now = time.time()
@@ -324,16 +764,23 @@ class BinanceFutures:
         return resp
 
     async def open_orders(self):
-        return await self.__curl_binancefutures(verb='GET', path='/v1/openOrders')
+        return await self.__curl_binancefutures(verb='GET', path='/v1/openOrders', weight=40)
 
     async def open_position(self):
-        response = await self.__curl_binancefutures(verb='GET', path='/v2/positionRisk')
-        for position in response:
-            side = position['positionSide']
-            if 'BOTH' == side:
-                if position['symbol'].upper() == self.symbol.upper():
-                    return position['positionAmt']
-        return '0'
+        return (await self.open_positions()).get(self.symbol.upper(), '0')
+
+    async def open_positions(self):
+        """One-way mode position amounts of every symbol, by upper case symbol."""
+        response = await self.__curl_binancefutures(verb='GET', path='/v2/positionRisk', weight=5)
+        return {position['symbol'].upper(): position['positionAmt'] for position in response
+                if position['positionSide'] == 'BOTH'}
+
+    async def get_depth_snapshot(self, limit=1000):
+        data = await self.__curl_binancefutures(verb='GET', path='/v1/depth', query={'symbol': self.symbol, 'limit': limit},
+                                                weight=20)
+        if self.recorder is not None:
+            self.recorder.record(SNAPSHOT, json_dumps(data))
+        return data
 
     async def open_user_data_stream(self):
         response = await self.__curl_binancefutures(verb='POST', path='/v1/listenKey')
@@ -342,86 +789,275 @@ class BinanceFutures:
     async def keepalive_user_data_stream(self):
         return await self.__curl_binancefutures(verb='PUT', path='/v1/listenKey')
 
+    def reconcile_orders(self, orders, since):
+        """Bring the order store in line with an open orders snapshot requested at `since` (ms) after events may have
+           been missed. This bot's orders in the snapshot are merged in; active ones missing from it have left the book
+           meanwhile and are marked CLOSED, unless they are still pending or changed after the snapshot was requested."""
+        store = self.open_orders_ws
+        symbol = self.symbol.upper()
+        open_ids = set()
+        for order in orders:
+            if order['symbol'].upper() != symbol or not order['clientOrderId'].startswith(self.orderIDPrefix):
+                continue
+            open_ids.add(order['clientOrderId'])
+            store.update(order)
+        closed = [client_order_id for client_order_id, order in store.active.items()
+                  if client_order_id not in open_ids and order['status'] != 'PENDING_NEW'
+                  and order.get('updateTime', since) < since]
+        for client_order_id in closed:
+            store.update({'clientOrderId': client_order_id, 'status': CLOSED, 'updateTime': since})
+        logging.info('Orders reconciled. symbol=%s, open=%d, closed=%d' % (self.symbol, len(open_ids), len(closed)))
+
+    async def __reconcile(self):
+        """Catch up with what happened while the user data stream was down, in one round trip."""
+        try:
+            since = int(time.time() * 1000)
+            orders, self.running_qty = await asyncio.gather(self.open_orders(), self.open_position())
+            self.reconcile_orders(orders, since)
+            self.update_event.set()
+        except Exception:
+            logging.exception('Reconciliation failed, reconnecting.')
+            if self.ws is not None:
+                await self.ws.close()
+
+    async def __renew_listen_key(self):
+        """The listen key of the previous connection if it is still valid, otherwise a new one."""
+        if self.listen_key is not None:
+            try:
+                await self.keepalive_user_data_stream()
+                return self.listen_key
+            except Exception:
+                logging.warning('The listen key could not be kept alive, opening a new one.', exc_info=True)
+        return await self.open_user_data_stream()
+
     async def connect(self):
+        """Subscribe to the streams and process them until the connection drops, then reconnect.
+
+        The first connection, and every one without warm_reconnect, starts cold: the open orders of the symbol are
+        cancelled and the position is fetched before subscribing. A warm reconnect leaves the orders resting and
+        subscribes right away with the same listen key; the orders and the position are then reconciled with one REST
+        snapshot and the book, kept across the drop, is resynced from a depth snapshot and the buffered updates.
+        Either way the depth snapshot is requested as soon as the websocket is open, alongside the first updates.
+        With redundant market data links the book is only touched once every link is down."""
+        warm = self.warm_reconnect and self.connected
+        opened = False
+        link = self.links[0] if self.links else None
+        if self.message_queue is not None:
+            self.message_queue.start()
+        if self.links and not self.mirrors:
+            self.mirrors = [asyncio.create_task(self.__run_link(link_)) for link_ in self.links[1:]]
         try:
-            await self.cancel_all_orders()
-            self.running_qty = await self.open_position()
-            self.listen_key = await self.open_user_data_stream()
-            if self.testnet:
-                # url = 'wss://stream.binancefuture.com/stream?streams=%s/%s/%s' % (self.listen_key, '%s@depth@0ms' % self.symbol, '%s@aggTrade' % self.symbol)
-                url = 'wss://stream.binancefuture.com/stream?streams=%s/%s/%s' % (self.listen_key, '%s@depth@0ms' % self.symbol, '%s@trade' % self.symbol)
-            else:
-                # url = 'wss://fstream.binance.com/stream?streams=%s/%s/%s' % (self.listen_key, '%s@depth@0ms' % self.symbol, '%s@aggTrade' % self.symbol)
-                url = 'wss://fstream.binance.com/stream?streams=%s/%s/%s' % (self.listen_key, '%s@depth@0ms' % self.symbol, '%s@trade' % self.symbol)
-            async with ClientSession() as session:
-                async with session.ws_connect(url) as ws:
-                    logging.info('WS Connected.')
-                    self.ws = ws
-                    self.keep_alive = asyncio.create_task(self.__keep_alive())
-                    async for msg in ws:
-                        if msg.type == WSMsgType.TEXT:
-                            await self.__on_message(msg.data)
-                        elif msg.type == WSMsgType.BINARY:
-                            pass
-                        elif msg.type == WSMsgType.PING:
-                            await self.ws.pong()
-                        elif msg.type == WSMsgType.PONG:
-                            await self.ws.ping()
-                        elif msg.type == WSMsgType.ERROR:
-                            exc = ws.exception()
-                            raise exc if exc is not None else Exception
+            streams = []
+            if self.user_data:
+                if warm:
+                    self.listen_key = await self.__renew_listen_key()
+                else:
+                    # Independent requests, sent at once.
+                    _, self.running_qty, self.listen_key = await asyncio.gather(
+                        self.cancel_all_orders(), self.open_position(), self.open_user_data_stream())
+                streams.append(self.listen_key)
+            if self.market_data:
+                streams += self.market_data_streams()
+            url = '%s?streams=%s' % (self.stream_url, '/'.join(streams))
+            async with self.client.ws_connect(url) as ws:
+                logging.info('WS Connected.')
+                opened = True
+                if self.connected:
+                    self.reconnects += 1
+                self.connected = True
+                self.ws = ws
+                if link is not None:
+                    link.ws = ws
+                self.keep_alive = asyncio.create_task(self.__keep_alive())
+                if self.market_data and self.book_state != LIVE and self.resync_task is None:
+                    # Subscribed first, so the snapshot is no older than the first update; it is fetched while those
+                    # are buffered rather than after the first one arrives.
+                    self.__start_resync()
+                if warm and self.user_data:
+                    # Subscribed first, so no order event falls between the snapshot and the stream.
+                    asyncio.create_task(self.__reconcile())
+                recorder = self.recorder
+                queue = self.message_queue
+                async for msg in ws:
+                    if msg.type == WSMsgType.TEXT:
+                        if link is not None:
+                            await self.__on_link_message(msg.data, link)
+                            continue
+                        if recorder is not None:
+                            recorder.record(FRAME, msg.data)
+                        if queue is not None:
+                            queue.put(msg.data)
+                            continue
+                        await self.__on_message(msg.data)
+                    elif msg.type == WSMsgType.BINARY:
+                        pass
+                    elif msg.type == WSMsgType.PING:
+                        await self.ws.pong()
+                    elif msg.type == WSMsgType.PONG:
+                        await self.ws.ping()
+                    elif msg.type == WSMsgType.ERROR:
+                        exc = ws.exception()
+                        raise exc if exc is not None else Exception
         except:
             logging.exception('WS Error')
         finally:
             logging.info('WS Disconnected.')
-            self.keep_alive.cancel()
-            await self.keep_alive
+            if self.keep_alive is not None:
+                self.keep_alive.cancel()
+                await asyncio.gather(self.keep_alive, return_exceptions=True)
+                self.keep_alive = None
             self.ws = None
-            self.depth.clear()
+            if link is not None:
+                link.ws = None
+            if self.market_data:
+                await self.__market_data_lost()
             if not self.closed:
-                await asyncio.sleep(1)
+                # Reconnect at once after a drop, a second later after a failed attempt.
+                if not opened:
+                    await asyncio.sleep(1)
                 asyncio.create_task(self.connect())
 
+    def market_data_streams(self):
+        # return ['%s@depth@0ms' % self.symbol, '%s@aggTrade' % self.symbol]
+        return ['%s@depth@0ms' % self.symbol, '%s@trade' % self.symbol]
+
+    async def __run_link(self, link):
+        """Receive the market data over an extra connection, reconnecting until the bot is closed."""
+        url = '%s?streams=%s' % (self.stream_url, '/'.join(self.market_data_streams()))
+        while not self.closed:
+            opened = False
+            try:
+                async with self.client.ws_connect(url) as ws:
+                    logging.info('Market data link %d connected.' % link.index)
+                    opened = True
+                    link.ws = ws
+                    async for msg in ws:
+                        if msg.type == WSMsgType.TEXT:
+                            await self.__on_link_message(msg.data, link)
+                        elif msg.type == WSMsgType.ERROR:
+                            exc = ws.exception()
+                            raise exc if exc is not None else Exception
+            except Exception:
+                logging.warning('Market data link %d failed.' % link.index, exc_info=True)
+            finally:
+                link.ws = None
+            logging.info('Market data link %d disconnected.' % link.index)
+            if not self.closed:
+                await self.__market_data_lost()
+                if not opened:
+                    await asyncio.sleep(1)
+
+    async def __market_data_lost(self):
+        """A market data connection dropped. Another link carries on if one is up; otherwise the strategies stop
+           quoting until the book is LIVE again. A warm reconnect resyncs it in place."""
+        if any(link.ws is not None for link in self.links):
+            logging.warning('Market data failed over. symbol=%s, links=%s' % (
+                self.symbol, ','.join(str(link.index) for link in self.links if link.ws is not None)))
+            return
+        if self.resync_task is not None:
+            self.resync_task.cancel()
+            await asyncio.gather(self.resync_task, return_exceptions=True)
+        self.book_state = SYNCING
+        self.last_ids.clear()
+        self.held.clear()
+        self.__cancel_hold()
+        if not self.warm_reconnect:
+            self.depth.clear()
+
     async def close(self):
-        await self.cancel_all_orders()
+        if self.user_data:
+            await self.cancel_all_orders()
         self.closed = True
+        self.__cancel_hold()
         if self.ws is not None:
             await self.ws.close()
-        await self.client.close()
+        for link in self.links[1:]:
+            if link.ws is not None:
+                await link.ws.close()
+        await asyncio.gather(*self.mirrors, return_exceptions=True)
+        if self.message_queue is not None:
+            await self.message_queue.close()
+        if self.ws_api is not None:
+            await self.ws_api.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.owns_session:
+            await self.client.close()
         await asyncio.sleep(1)
 
-    async def __get_marketdepth_snapshot(self):
-        data = await self.__curl_binancefutures(verb='GET', path='/v1/depth', query={'symbol': self.symbol, 'limit': 1000})
-        l_bid, _ = data['bids'][-1]
-        h_ask, _ = data['asks'][-1]
-        self.depth = {price: qty for price, qty in self.depth.items() if (price < l_bid and qty > 0) or (price > h_ask and qty < 0)}
-        for price, qty in data['bids']:
-            self.depth[price] = float(qty)
-        for price, qty in data['asks']:
-            self.depth[price] = -float(qty)
-        lastUpdateId = data['lastUpdateId']
-        self.prev_u = None
-        # Process the pending messages.
-        while self.prev_u is None:
-            while self.pending_messages:
-                item = self.pending_messages.pop(0)
-                u = item['u']
-                U = item['U']
-                pu = item['pu']
-                # https://binance-docs.github.io/apidocs/futures/en/#how-to-manage-a-local-order-book-correctly
-                # The first processed event should have U <= lastUpdateId AND u >= lastUpdateId
-                if (u < lastUpdateId or U > lastUpdateId) and self.prev_u is None:
-                    continue
-                if self.prev_u is not None and pu != self.prev_u:
-                    logging.warning('UpdateId does not match. symbol=%s, prev_update_id=%d, pu=%d' % (self.symbol, self.prev_u, pu))
-                for price, qty in item['b']:
-                    if qty != '0':
-                        self.depth[price] = float(qty)
-                for price, qty in item['a']:
-                    if qty != '0':
-                        self.depth[price] = -float(qty)
-                self.prev_u = u
-            if self.prev_u is None:
-                await asyncio.sleep(0.5)
-        self.pending_messages = None
-        logging.warning('The book is initialized. symbol=%s, prev_update_id=%d' % (self.symbol, self.prev_u))
+    def __start_resync(self):
+        self.book_state = SYNCING
+        self.resync_started = time.time()
+        self.pending_messages.clear()
+        self.__request_snapshot()
+
+    def __request_snapshot(self, delay=0):
+        self.resync_task = asyncio.create_task(self.__get_marketdepth_snapshot(delay))
+        self.resync_task.add_done_callback(self.__on_resync_done)
+
+    def __on_resync_done(self, task):
+        """Try again, later and later, if the snapshot could not be fetched."""
+        if task.cancelled() or task.exception() is None:
+            return
+        delay = self.__resync_delay()
+        logging.error('The depth snapshot failed, retrying in %.1fs. symbol=%s' % (delay, self.symbol),
+                      exc_info=task.exception())
+        # A resync may have started anew meanwhile.
+        if not self.closed and self.resync_task is None and self.book_state != LIVE:
+            self.__request_snapshot(delay)
+
+    def __resync_delay(self):
+        self.resync_attempts += 1
+        return min(self.resync_backoff * 2 ** (self.resync_attempts - 1), RESYNC_BACKOFF_MAX)
+
+    async def __get_marketdepth_snapshot(self, delay=0):
+        try:
+            while True:
+                if delay:
+                    await asyncio.sleep(delay)
+                data = await self.get_depth_snapshot()
+                l_bid, _ = data['bids'][-1]
+                h_ask, _ = data['asks'][-1]
+                self.depth.clear_inside(self.depth.price_to_tick(l_bid), self.depth.price_to_tick(h_ask))
+                self.depth.apply(self.depth.decode(data['bids']), self.depth.decode(data['asks']))
+                lastUpdateId = data['lastUpdateId']
+                self.prev_u = None
+                stale = False
+                # Process the pending messages, waiting for more until one bridges the snapshot.
+                while self.prev_u is None and not stale:
+                    while self.pending_messages:
+                        item = self.pending_messages.popleft()
+                        u = item['u']
+                        U = item['U']
+                        pu = item['pu']
+                        # https://binance-docs.github.io/apidocs/futures/en/#how-to-manage-a-local-order-book-correctly
+                        # The first processed event should have U <= lastUpdateId AND u >= lastUpdateId
+                        if self.prev_u is None:
+                            if u < lastUpdateId:
+                                continue
+                            # An update that directly follows the snapshot bridges it as well.
+                            if U > lastUpdateId and pu != lastUpdateId:
+                                # The bridging update was missed or dropped from the buffer; the snapshot is too old.
+                                self.pending_messages.appendleft(item)
+                                stale = True
+                                break
+                        elif pu != self.prev_u:
+                            logging.warning('UpdateId does not match. symbol=%s, prev_update_id=%d, pu=%d' % (self.symbol, self.prev_u, pu))
+                        self.depth.apply(item['b'], item['a'])
+                        self.prev_u = u
+                    if self.prev_u is None and not stale:
+                        self.pending_event.clear()
+                        await self.pending_event.wait()
+                if not stale:
+                    break
+                delay = self.__resync_delay()
+                logging.warning('The snapshot is older than the buffered updates, retrying in %.1fs. symbol=%s, lastUpdateId=%d'
+                                % (delay, self.symbol, lastUpdateId))
+            self.book_state = LIVE
+            self.resync_attempts = 0
+            self.last_resync_duration = time.time() - self.resync_started
+            self.update_event.set()
+            logging.warning('The book is initialized. symbol=%s, prev_update_id=%d, resync_duration=%.3fs'
+                            % (self.symbol, self.prev_u, self.last_resync_duration))
+        finally:
+            self.resync_task = None
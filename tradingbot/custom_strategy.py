@@ -1,29 +1,28 @@
 import logging
 import sys
 
-import pandas as pd
-
+from tradingbot.binancefutures import LIVE
 from tradingbot.ordermanager import OrderManager
 
 
 class CustomOrderManager(OrderManager):
     """A sample order manager for implementing your own custom strategy"""
 
+    order_qty_dollar = 100
+    threshold = 1000  # need to find an optimal value
+    depth = 0.05  # need to find an optimal value
+
     async def place_orders(self):
         # implement your custom strategy here
-        order_qty_dollar = 100
-        threshold = 1000  # need to find an optimal value
-        depth = 0.05  # need to find an optimal value
-
-        market_depth = self.binance_futures.depth
-        bid = map(lambda x: (float(x[0]), x[1]), sorted(filter(lambda x: x[1] > 0, market_depth.items()), key=lambda x: -float(x[0])))
-        ask = map(lambda x: (float(x[0]), x[1]), sorted(filter(lambda x: x[1] < 0, market_depth.items()), key=lambda x: float(x[0])))
-        bid = pd.DataFrame(bid, columns=['price', 'size'])
-        ask = pd.DataFrame(ask, columns=['price', 'size'])
-        mid = (bid['price'][0] + ask['price'][0]) / 2.0
-
-        buy = bid[bid['price'] > mid * (1 - depth)]['size'].sum()
-        sell = ask[ask['price'] > mid * (1 + depth)]['size'].sum()
+        order_qty_dollar = self.order_qty_dollar
+        threshold = self.threshold
+        depth = self.depth
+
+        book = self.binance_futures.depth
+        if self.binance_futures.book_state != LIVE or book.best_bid_tick is None or book.best_ask_tick is None:
+            return
+
+        buy, sell = self.binance_futures.features.band_volume(depth)
         alpha = buy - sell
 
         buy_orders = []
@@ -35,10 +34,11 @@ class CustomOrderManager(OrderManager):
             logging.info('buy=%f, sell=%f, alpha=%f, threshold=%f, last=%f, order_qty=%f', buy, sell, alpha, threshold,
                          float(self.binance_futures.last_price), order_qty)
 
+            lots = self.instrument.qty_to_lots(order_qty)
             if alpha > threshold and not self.long_position_limit_exceeded():
-                buy_orders.append({'price': bid['price'][0], 'quantity': order_qty, 'side': "Buy"})
+                buy_orders.append({'tick': book.best_bid_tick, 'lots': lots, 'side': "Buy"})
             if alpha < -threshold and not self.short_position_limit_exceeded():
-                sell_orders.append({'price': ask['price'][0], 'quantity': order_qty, 'side': "Sell"})
+                sell_orders.append({'tick': book.best_ask_tick, 'lots': lots, 'side': "Sell"})
 
             await self.converge_orders(buy_orders, sell_orders)
         except ZeroDivisionError:
@@ -57,4 +57,6 @@ def run():
     except (KeyboardInterrupt, SystemExit):
         sys.exit()
 
-run()
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,137 @@
+import math
+
+
+class Band:
+    """Bid and ask volume within `depth` (a fraction of mid) around mid."""
+
+    def __init__(self, depth):
+        self.depth = depth
+        self.bid_edge = None  # lowest bid tick inside the band
+        self.ask_edge = None  # highest ask tick inside the band
+        self.bid_volume = 0.0
+        self.ask_volume = 0.0
+
+
+class BookFeatures:
+    """Book features maintained incrementally from the level deltas applied to an OrderBook.
+
+    The banded volumes are kept as running sums; a level update inside a band adjusts the sum by the quantity change
+    and a mid move only sums the ticks that enter or leave the band, so reading a feature is O(1)."""
+
+    def __init__(self, book, bands=(), resync_interval=100000):
+        self.book = book
+        self.bands = {}
+        self.resync_interval = resync_interval
+        self.updates = 0
+        self._bid_tick = None
+        self._ask_tick = None
+        for depth in bands:
+            self.add_band(depth)
+        book.features = self
+
+    def add_band(self, depth):
+        band = self.bands.get(depth)
+        if band is None:
+            band = self.bands[depth] = Band(depth)
+            self._move_band(band)
+        return band
+
+    def band_volume(self, depth):
+        """Returns (bid volume, ask volume) within `depth` of mid, registering the band on first use."""
+        band = self.bands.get(depth)
+        if band is None:
+            band = self.add_band(depth)
+        return band.bid_volume, band.ask_volume
+
+    @property
+    def imbalance(self):
+        """Top-of-book imbalance in [-1, 1]; positive when the bid is heavier."""
+        bid_qty = self.book.best_bid_qty
+        ask_qty = self.book.best_ask_qty
+        total = bid_qty + ask_qty
+        if total == 0:
+            return 0.0
+        return (bid_qty - ask_qty) / total
+
+    @property
+    def microprice(self):
+        book = self.book
+        bid_qty = book.best_bid_qty
+        ask_qty = book.best_ask_qty
+        total = bid_qty + ask_qty
+        if total == 0:
+            return math.nan
+        return (book.best_bid * ask_qty + book.best_ask * bid_qty) / total
+
+    ###
+    # Book callbacks
+    ###
+
+    def on_bid(self, tick, delta):
+        for band in self.bands.values():
+            if band.bid_edge is not None and tick >= band.bid_edge:
+                band.bid_volume += delta
+
+    def on_ask(self, tick, delta):
+        for band in self.bands.values():
+            if band.ask_edge is not None and tick <= band.ask_edge:
+                band.ask_volume += delta
+
+    def on_update(self):
+        """Called once the deltas of a depth update are applied; moves the band edges if the mid moved."""
+        book = self.book
+        self.updates += 1
+        if self.updates % self.resync_interval == 0:
+            self.reset()
+            return
+        if book.best_bid_tick == self._bid_tick and book.best_ask_tick == self._ask_tick:
+            return
+        self._bid_tick = book.best_bid_tick
+        self._ask_tick = book.best_ask_tick
+        for band in self.bands.values():
+            self._move_band(band)
+
+    def reset(self):
+        """Recompute every band from scratch; called when the book is cleared or rebuilt from a snapshot."""
+        self._bid_tick = self.book.best_bid_tick
+        self._ask_tick = self.book.best_ask_tick
+        for band in self.bands.values():
+            band.bid_edge = band.ask_edge = None
+            band.bid_volume = band.ask_volume = 0.0
+            self._move_band(band)
+
+    ###
+    # Internals
+    ###
+
+    def _sum(self, qty, start_tick, end_tick):
+        """Sum of `qty` over the ticks [start_tick, end_tick)."""
+        origin = self.book.origin
+        start = min(max(start_tick - origin, 0), len(qty))
+        end = min(max(end_tick - origin, 0), len(qty))
+        return float(qty[start:end].sum())
+
+    def _move_band(self, band):
+        book = self.book
+        if book.best_bid_tick is None or book.best_ask_tick is None:
+            band.bid_edge = band.ask_edge = None
+            band.bid_volume = band.ask_volume = 0.0
+            return
+        mid = book.mid / book.tick_size
+        # Strictly inside the band: price > mid * (1 - depth) and price < mid * (1 + depth).
+        bid_edge = math.floor(mid * (1 - band.depth)) + 1
+        ask_edge = math.ceil(mid * (1 + band.depth)) - 1
+        if band.bid_edge is None:
+            band.bid_volume = self._sum(book.bid_qty, bid_edge, book.best_bid_tick + 1)
+        elif bid_edge < band.bid_edge:
+            band.bid_volume += self._sum(book.bid_qty, bid_edge, band.bid_edge)
+        elif bid_edge > band.bid_edge:
+            band.bid_volume -= self._sum(book.bid_qty, band.bid_edge, bid_edge)
+        if band.ask_edge is None:
+            band.ask_volume = self._sum(book.ask_qty, book.best_ask_tick, ask_edge + 1)
+        elif ask_edge > band.ask_edge:
+            band.ask_volume += self._sum(book.ask_qty, band.ask_edge + 1, ask_edge + 1)
+        elif ask_edge < band.ask_edge:
+            band.ask_volume -= self._sum(book.ask_qty, ask_edge + 1, band.ask_edge + 1)
+        band.bid_edge = bid_edge
+        band.ask_edge = ask_edge
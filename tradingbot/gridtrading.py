@@ -1,38 +1,59 @@
 import logging
 import sys
 
-import pandas as pd
 from numpy import floor, ceil
 
+from tradingbot.binancefutures import LIVE
 from tradingbot.ordermanager import OrderManager
 
 
 class CustomOrderManager(OrderManager):
     """A sample order manager for implementing your own custom strategy"""
 
+    order_qty_dollar = 50
+    half_spread = 3.588029293964708
+    price_range = 158.10344098886486
+    grid_num = 20  # 60
+    max_position = 5000
+
+    grid_state = None
+
+    def material_change(self):
+        """Requote only when the first bid or ask grid level or the position changes."""
+        book = self.binance_futures.depth
+        if book.best_bid_tick is None or book.best_ask_tick is None:
+            return False
+        order_interval = 2 * self.price_range / self.grid_num
+        mid = book.mid
+        state = (int(floor(min(mid - self.half_spread, book.best_bid) / order_interval)),
+                 int(ceil(max(mid + self.half_spread, book.best_ask) / order_interval)),
+                 self.binance_futures.running_qty)
+        if state == self.grid_state:
+            return False
+        self.grid_state = state
+        return True
+
     async def place_orders(self):
         # implement your custom strategy here
-        order_qty_dollar = 50
-        half_spread = 3.588029293964708
-        price_range = 158.10344098886486
-        grid_num = 20  # 60
-        tick_size = 0.1
+        order_qty_dollar = self.order_qty_dollar
+        half_spread = self.half_spread
+        price_range = self.price_range
+        grid_num = self.grid_num
+        tick_size = self.tick_size
         tick_ub = 100000
         order_interval = 2 * price_range / grid_num
         interval_tick = int(round(order_interval / tick_size))
-        max_position = 5000
-
-        market_depth = self.binance_futures.depth
-        bid = map(lambda x: (float(x[0]), x[1]), sorted(filter(lambda x: x[1] > 0, market_depth.items()), key=lambda x: -float(x[0])))
-        ask = map(lambda x: (float(x[0]), x[1]), sorted(filter(lambda x: x[1] < 0, market_depth.items()), key=lambda x: float(x[0])))
-        bid = pd.DataFrame(bid, columns=['price', 'size'])
-        ask = pd.DataFrame(ask, columns=['price', 'size'])
-        if len(bid) == 0 or len(ask) == 0:
+        max_position = self.max_position
+
+        book = self.binance_futures.depth
+        if self.binance_futures.book_state != LIVE or book.best_bid_tick is None or book.best_ask_tick is None:
             return
-        mid = (bid['price'][0] + ask['price'][0]) / 2.0
+        best_bid = book.best_bid
+        best_ask = book.best_ask
+        mid = (best_bid + best_ask) / 2.0
 
-        bid_order_begin = min(mid - half_spread, bid['price'][0])
-        ask_order_begin = max(mid + half_spread, ask['price'][0])
+        bid_order_begin = min(mid - half_spread, best_bid)
+        ask_order_begin = max(mid + half_spread, best_ask)
         lb_price = mid - price_range
         ub_price = mid + price_range
 
@@ -58,13 +79,13 @@ class CustomOrderManager(OrderManager):
         for tick in range(max_bid_order_tick, min_bid_order_tick, -1):
             bid_price_tick = tick * interval_tick
             bid_price = bid_price_tick * tick_size
-            order_qty = round(order_qty_dollar / bid_price, 3)
-            buy_orders.append({'price': '%1.f' % bid_price, 'quantity': order_qty, 'side': "Buy"})
+            lots = self.instrument.qty_to_lots(order_qty_dollar / bid_price, nearest=True)
+            buy_orders.append({'tick': bid_price_tick, 'lots': lots, 'side': "Buy"})
         for tick in range(min_ask_order_tick, max_ask_order_tick, 1):
             ask_price_tick = tick * interval_tick
             ask_price = ask_price_tick * tick_size
-            order_qty = round(order_qty_dollar / ask_price, 3)
-            sell_orders.append({'price': '%1.f' % ask_price, 'quantity': order_qty, 'side': "Sell"})
+            lots = self.instrument.qty_to_lots(order_qty_dollar / ask_price, nearest=True)
+            sell_orders.append({'tick': ask_price_tick, 'lots': lots, 'side': "Sell"})
 
         try:
             logging.info('mid=%.1f, running_qty%%=%f, buy_orders=%s, sell_orders=%s', mid, x, buy_orders, sell_orders)
@@ -82,4 +103,6 @@ def run():
     except (KeyboardInterrupt, SystemExit):
         sys.exit()
 
-run()
+
+if __name__ == '__main__':
+    run()
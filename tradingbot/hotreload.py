@@ -0,0 +1,135 @@
+import asyncio
+import ctypes
+import ctypes.util
+import importlib.util
+import logging
+import os
+import struct
+import sys
+
+# inotify(7) event header (wd, mask, cookie, len), followed by `len` bytes of NUL-padded file name
+INOTIFY_EVENT = struct.Struct('iIII')
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+# Editors save in place (CLOSE_WRITE) or write a new file and rename it over the old one (MOVED_TO, CREATE).
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+
+def load_inotify():
+    """libc's inotify functions, or None where inotify is not available."""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class FileWatcher:
+    """Calls `callback(paths)` with the set of changed paths shortly after any of `paths` is written.
+
+    On Linux the directories of the files are watched with inotify and the events are read from the event loop, so
+    nothing is polled; elsewhere the modification times are checked every `poll_interval` seconds. Changes within
+    `debounce` seconds of each other, e.g. an editor writing a file in several steps, are reported together."""
+
+    def __init__(self, paths, callback, debounce=0.2, poll_interval=1.0):
+        self.paths = set(os.path.abspath(path) for path in paths)
+        self.callback = callback
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.changed = set()
+        self.flush_handle = None
+        self.fd = None
+        self.directories = {}
+        self.poller = None
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        libc = load_inotify()
+        if libc is not None:
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd >= 0:
+                self.fd = fd
+                for directory in set(os.path.dirname(path) for path in self.paths):
+                    wd = libc.inotify_add_watch(fd, directory.encode(), WATCH_MASK)
+                    if wd < 0:
+                        logging.warning('Cannot watch %s: %s' % (directory, os.strerror(ctypes.get_errno())))
+                        continue
+                    self.directories[wd] = directory
+                loop.add_reader(fd, self.__read)
+                return
+        logging.info('inotify is not available, polling the watched files.')
+        # Taken now, so that a change before the poller first runs is not missed.
+        mtimes = {path: self.__mtime(path) for path in self.paths}
+        self.poller = asyncio.create_task(self.__poll(mtimes))
+
+    def close(self):
+        if self.fd is not None:
+            asyncio.get_running_loop().remove_reader(self.fd)
+            os.close(self.fd)
+            self.fd = None
+        if self.poller is not None:
+            self.poller.cancel()
+            self.poller = None
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+    def __read(self):
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0').decode()
+            offset += length
+            directory = self.directories.get(wd)
+            if directory is not None:
+                self.__changed(os.path.join(directory, name))
+
+    async def __poll(self, mtimes):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            for path in self.paths:
+                mtime = self.__mtime(path)
+                if mtime != mtimes[path]:
+                    mtimes[path] = mtime
+                    self.__changed(path)
+
+    @staticmethod
+    def __mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def __changed(self, path):
+        if path not in self.paths:
+            return
+        self.changed.add(path)
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+        self.flush_handle = asyncio.get_running_loop().call_later(self.debounce, self.__flush)
+
+    def __flush(self):
+        self.flush_handle = None
+        changed, self.changed = self.changed, set()
+        self.callback(changed)
+
+
+def load_module(name, path):
+    """A fresh module `name` executed from `path`, registered in sys.modules in place of the old one only if it loads.
+       Unlike importlib.reload this also works for a module run as __main__, and a module that fails to load leaves
+       the old one alone."""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    sys.modules[name] = module
+    return module
@@ -0,0 +1,68 @@
+import decimal
+import math
+
+
+def decimals(value):
+    """Number of decimal places of a tick or step size such as '0.10' or 0.001."""
+    exponent = decimal.Decimal(str(value)).normalize().as_tuple().exponent
+    return max(0, -exponent)
+
+
+def format_fixed(units, places):
+    """Format an integer number of 10**-places units as a decimal string, exactly."""
+    if places == 0:
+        return str(units)
+    sign = '-' if units < 0 else ''
+    whole, fraction = divmod(abs(units), 10 ** places)
+    return '%s%d.%0*d' % (sign, whole, places, fraction)
+
+
+class Instrument:
+    """Price and quantity grid of a symbol, from the tickSize and stepSize filters of its exchange information.
+
+    Prices are carried as integer ticks and quantities as integer lots from the strategy through the order store to
+    the request, where they are formatted to wire strings exactly, with the symbol's own number of decimals."""
+
+    def __init__(self, symbol, tick_size, step_size=0.001):
+        self.symbol = symbol
+        self.tick_size = float(tick_size)
+        self.step_size = float(step_size)
+        self.price_decimals = decimals(tick_size)
+        self.qty_decimals = decimals(step_size)
+        # Size of a tick or a lot in units of the last decimal place
+        self.tick_units = int(decimal.Decimal(str(tick_size)).scaleb(self.price_decimals))
+        self.lot_units = int(decimal.Decimal(str(step_size)).scaleb(self.qty_decimals))
+
+    @classmethod
+    def from_symbol_info(cls, symbol_info):
+        tick_size = step_size = None
+        for x in symbol_info['filters']:
+            if 'tickSize' in x:
+                tick_size = x['tickSize']
+            if x.get('filterType') == 'LOT_SIZE':
+                step_size = x['stepSize']
+        if tick_size is None:
+            raise Exception('No tick size. symbol=%s' % symbol_info['symbol'])
+        return cls(symbol_info['symbol'], tick_size, step_size if step_size is not None else 0.001)
+
+    def price_to_tick(self, price):
+        return int(round(float(price) / self.tick_size))
+
+    def tick_to_price(self, tick):
+        return tick * self.tick_size
+
+    def qty_to_lots(self, qty, nearest=False):
+        """Whole lots in `qty`, rounded down, or to the nearest lot if `nearest`. A quantity a hair below a lot
+           boundary counts as the boundary."""
+        if nearest:
+            return int(round(float(qty) / self.step_size))
+        return int(math.floor(float(qty) / self.step_size + 1e-9))
+
+    def lots_to_qty(self, lots):
+        return lots * self.step_size
+
+    def format_price(self, tick):
+        return format_fixed(tick * self.tick_units, self.price_decimals)
+
+    def format_qty(self, lots):
+        return format_fixed(lots * self.lot_units, self.qty_decimals)
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from tradingbot.codec import json_loads
+from tradingbot.metrics import metrics
+
+TRADE_EVENTS = frozenset(['trade', 'aggTrade'])
+
+
+def conflate(items):
+    """Conflate parsed combined stream messages, given as (received, message) pairs in arrival order.
+
+    Consecutive depth updates of a stream are merged into the first of them, the levels of later updates replacing
+    those of earlier ones, and a trade replaces the previous trade of its stream. Other events are kept as they are.
+    A merged update spans the update ids of its parts (U and pu of the first, u of the last), so the book checks it for
+    gaps like any other; a gap ends the merge."""
+    out = []
+    last = {}
+    levels = {}
+    for item in items:
+        received, message = item
+        data = message['data']
+        event = data['e']
+        stream = message['stream']
+        i = last.get(stream)
+        if event == 'depthUpdate':
+            if i is not None:
+                merged = out[i][1]
+                merged_data = merged['data']
+                if data['pu'] == merged_data['u']:
+                    sides = levels.get(i)
+                    if sides is None:
+                        sides = levels[i] = (dict(merged_data['b']), dict(merged_data['a']))
+                    sides[0].update(data['b'])
+                    sides[1].update(data['a'])
+                    merged_data['u'] = data['u']
+                    merged_data['E'] = data['E']
+                    out[i] = (received, merged)
+                    continue
+        elif event in TRADE_EVENTS:
+            if i is not None:
+                out[i] = item
+                continue
+        else:
+            out.append(item)
+            continue
+        last[stream] = len(out)
+        out.append(item)
+    for i, (bids, asks) in levels.items():
+        data = out[i][1]['data']
+        data['b'] = list(bids.items())
+        data['a'] = list(asks.items())
+    return out
+
+
+class MessageQueue:
+    """Frames read off a stream connection, waiting to be handled.
+
+    The reading task only timestamps and appends each frame (put), so a slow handler does not hold up the socket; the
+    processing task (run) parses them and calls `handle(received, message)` for up to `max_batch` at a time, yielding
+    to the reader in between. With `conflate_lag`, once the oldest frame has waited longer than that many seconds the
+    whole backlog is parsed and conflated (see conflate) before it is handled, which bounds how stale the book gets
+    under a burst. `record(received, frame, message)`, if given, sees every frame before it is conflated.
+
+    Should handling a frame fail, the frames still queued are dropped and `on_error()` is called, for the owner to close
+    the connection and reconnect as it does when a frame handled as it is read fails.
+
+    The metrics are <name>.queue.depth, .lag (of the oldest frame) and .conflated (frames merged away) as gauges, and
+    the lag at every batch and the time to handle a batch as histograms."""
+
+    def __init__(self, name, handle, max_batch=100, conflate_lag=None, record=None, on_error=None):
+        self.handle = handle
+        self.on_error = on_error
+        self.max_batch = max_batch
+        self.conflate_lag = conflate_lag
+        self.record = record
+        # (receive time, frame)
+        self.frames = deque()
+        self.event = asyncio.Event()
+        self.task = None
+        self.conflated = 0
+        self.lag_histogram = metrics.histogram('%s.queue.lag' % name)
+        self.batch_histogram = metrics.histogram('%s.queue.batch' % name)
+        metrics.gauge('%s.queue.depth' % name, lambda: len(self.frames))
+        metrics.gauge('%s.queue.lag' % name, self.lag)
+        metrics.gauge('%s.queue.conflated' % name, lambda: self.conflated)
+
+    def put(self, frame):
+        self.frames.append((time.time(), frame))
+        self.event.set()
+
+    def lag(self):
+        """Seconds the oldest queued frame has been waiting."""
+        return time.time() - self.frames[0][0] if self.frames else 0.0
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def run(self):
+        frames = self.frames
+        while True:
+            if not frames:
+                self.event.clear()
+                await self.event.wait()
+            try:
+                self.drain()
+            except Exception:
+                logging.exception('Message handling failed, dropping %d queued frames.' % len(frames))
+                frames.clear()
+                if self.on_error is not None:
+                    self.on_error()
+            # Let the reader take in what arrived meanwhile before the next batch.
+            await asyncio.sleep(0)
+
+    def drain(self):
+        """Handle a batch of the queued frames, or the whole backlog conflated if it lags."""
+        frames = self.frames
+        start = time.perf_counter()
+        lag = time.time() - frames[0][0]
+        self.lag_histogram.record(lag)
+        conflating = self.conflate_lag is not None and lag > self.conflate_lag
+        if conflating:
+            batch = list(frames)
+            frames.clear()
+        else:
+            batch = [frames.popleft() for _ in range(min(len(frames), self.max_batch))]
+        debug = logging.root.isEnabledFor(logging.DEBUG)
+        record = self.record
+        items = []
+        for received, frame in batch:
+            if debug:
+                logging.debug(frame)
+            message = json_loads(frame)
+            if record is not None:
+                record(received, frame, message)
+            items.append((received, message))
+        if conflating:
+            items = conflate(items)
+            self.conflated += len(batch) - len(items)
+        handle = self.handle
+        for received, message in items:
+            handle(received, message)
+        self.batch_histogram.record(time.perf_counter() - start)
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+
+from aiohttp import web
+
+from tradingbot.codec import json_dumps
+
+
+class Histogram:
+    """Latency histogram with log-linear microsecond buckets (4 per power of two, ~19% resolution).
+
+    Recording is a couple of integer operations and a list increment, cheap enough for the per-message path."""
+
+    SIZE = 256
+
+    def __init__(self):
+        self.counts = [0] * self.SIZE
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        us = int(seconds * 1e6)
+        if us < 8:
+            index = us if us > 0 else 0
+        else:
+            e = us.bit_length() - 3
+            index = e * 4 + (us >> e)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    @staticmethod
+    def bucket_upper(index):
+        """Upper bound of a bucket in seconds."""
+        if index < 8:
+            return (index + 1) / 1e6
+        e = index // 4 - 1
+        return ((index % 4 + 5) << e) / 1e6
+
+    def percentile(self, q):
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(self.bucket_upper(index), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.percentile(0.5),
+            'p90': self.percentile(0.9),
+            'p99': self.percentile(0.99),
+            'p999': self.percentile(0.999),
+            'max': self.max,
+        }
+
+
+class Metrics:
+    """Registry of latency histograms and gauges, exposed as JSON over HTTP or dumped to the log."""
+
+    def __init__(self):
+        self.histograms = {}
+        self.gauges = {}
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        return histogram
+
+    def record(self, name, seconds):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.record(seconds)
+
+    def gauge(self, name, fn):
+        """Register a callable reporting a current value, e.g. a queue depth or a counter."""
+        self.gauges[name] = fn
+
+    def snapshot(self):
+        return {
+            'histograms': {name: histogram.summary() for name, histogram in sorted(self.histograms.items())},
+            'gauges': {name: fn() for name, fn in sorted(self.gauges.items())},
+        }
+
+    def reset(self):
+        self.histograms.clear()
+
+    async def dump_periodically(self, interval, reset=False):
+        """Log a snapshot every `interval` seconds, optionally starting a new window each time."""
+        while True:
+            await asyncio.sleep(interval)
+            logging.info('metrics: %s' % json_dumps(self.snapshot()))
+            if reset:
+                self.reset()
+
+    async def serve(self, host='127.0.0.1', port=9100):
+        """Serve the snapshot as JSON on http://host:port/metrics."""
+        async def handle(request):
+            return web.Response(text=json_dumps(self.snapshot()), content_type='application/json')
+
+        app = web.Application()
+        app.router.add_get('/metrics', handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logging.info('Serving metrics on http://%s:%d/metrics' % (host, port))
+        return runner
+
+
+# Process-wide registry
+metrics = Metrics()
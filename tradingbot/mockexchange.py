@@ -0,0 +1,633 @@
+import argparse
+import asyncio
+import decimal
+import hashlib
+import hmac
+import itertools
+import logging
+import random
+import time
+
+from aiohttp import web, WSMsgType
+
+from tradingbot.codec import json_dumps, json_loads
+
+# (method, path) -> (request weight, order count) for the endpoints with a weight other than 1
+WEIGHTS = {
+    ('POST', '/fapi/v1/order'): (0, 1),
+    ('PUT', '/fapi/v1/order'): (1, 1),
+    ('POST', '/fapi/v1/batchOrders'): (5, 0),
+    ('PUT', '/fapi/v1/batchOrders'): (5, 0),
+    ('GET', '/fapi/v1/openOrders'): (40, 0),
+    ('GET', '/fapi/v2/positionRisk'): (5, 0),
+}
+
+# WebSocket API method -> (request weight, order count)
+WS_API_WEIGHTS = {
+    'order.place': (0, 1),
+    'order.modify': (1, 1),
+    'order.cancel': (1, 0),
+}
+
+# Endpoints that need neither an API key nor a signature
+PUBLIC_PATHS = frozenset(['/fapi/v1/ping', '/fapi/v1/exchangeInfo', '/fapi/v1/depth'])
+
+ACTIVE_STATUSES = frozenset(['NEW', 'PARTIALLY_FILLED'])
+
+UNKNOWN_ORDER = {'code': -2011, 'msg': 'Unknown order sent.'}
+
+
+class MockExchange:
+    """Local stand-in for the Binance Futures REST API, combined market/user data stream and WebSocket API.
+
+    A random-walk book publishes depth updates and trades at `message_rate` messages per second with the same u/pu
+    sequencing as Binance, and serves depth snapshots consistent with it. Orders rest until a trade prints at or
+    through their price and are then filled in full; fills are reported as ORDER_TRADE_UPDATE and ACCOUNT_UPDATE on the
+    listen key stream. REST and WebSocket API requests can be delayed by `latency` seconds and a fraction `error_rate`
+    of the REST requests fails with one of `errors`; a fraction `gap_rate` of the depth updates is never sent, so the
+    client sees a sequence gap. Signatures are checked when `api_secret` is given."""
+
+    def __init__(self, symbol='btcusdt', tick_size=0.1, step_size=0.001, api_key=None, api_secret=None,
+                 message_rate=100, trade_ratio=0.2, latency=0.0, error_rate=0.0, errors=(429, 502, 503), gap_rate=0.0,
+                 price=60000.0, levels=200, seed=None):
+        self.symbol = symbol.upper()
+        self.tick_size = tick_size
+        self.step_size = step_size
+        self.price_format = '%%.%df' % max(0, -decimal.Decimal(str(tick_size)).as_tuple().exponent)
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.message_rate = message_rate
+        self.trade_ratio = trade_ratio
+        self.latency = latency
+        self.error_rate = error_rate
+        self.errors = errors
+        self.gap_rate = gap_rate
+        self.rng = random.Random(seed)
+        self.depth_stream = '%s@depth@0ms' % symbol.lower()
+        self.trade_stream = '%s@trade' % symbol.lower()
+
+        mid = round(price / tick_size)
+        self.mid = mid
+        self.levels = levels
+        self.bids = {mid - i: self.__random_qty() for i in range(1, levels)}
+        self.asks = {mid + i: self.__random_qty() for i in range(1, levels)}
+        # Levels changed by trades, sent with the next depth update
+        self.changed_bids = {}
+        self.changed_asks = {}
+        self.update_id = 1
+        self.trade_ids = itertools.count(1)
+
+        self.orders = {}
+        self.resting = {'BUY': {}, 'SELL': {}}
+        self.order_ids = itertools.count(1)
+        self.position = 0.0
+        self.entry_price = 0.0
+        self.user_events = []
+        self.listen_keys = set()
+        self.clients = {}
+
+        self.weight_window = self.orders_1m_window = self.orders_10s_window = None
+        self.used_weight = self.orders_1m = self.orders_10s = 0
+
+        self.runner = None
+        self.port = None
+        self.generator = None
+        self.messages_sent = 0
+        self.gaps = 0
+        self.errors_injected = 0
+
+    @property
+    def base_url(self):
+        return 'http://127.0.0.1:%d/fapi' % self.port
+
+    @property
+    def stream_url(self):
+        return 'ws://127.0.0.1:%d/stream' % self.port
+
+    @property
+    def ws_api_url(self):
+        return 'ws://127.0.0.1:%d/ws-fapi/v1' % self.port
+
+    async def start(self, host='127.0.0.1', port=0):
+        app = web.Application(middlewares=[self.__middleware()])
+        app.router.add_get('/fapi/v1/ping', self.__ping)
+        app.router.add_get('/fapi/v1/exchangeInfo', self.__exchange_info)
+        app.router.add_get('/fapi/v1/depth', self.__depth)
+        app.router.add_route('*', '/fapi/v1/order', self.__order)
+        app.router.add_route('*', '/fapi/v1/batchOrders', self.__batch_orders)
+        app.router.add_delete('/fapi/v1/allOpenOrders', self.__all_open_orders)
+        app.router.add_get('/fapi/v1/openOrders', self.__open_orders)
+        app.router.add_route('*', '/fapi/v1/listenKey', self.__listen_key)
+        app.router.add_get('/fapi/v2/positionRisk', self.__position_risk)
+        app.router.add_get('/stream', self.__stream)
+        app.router.add_get('/ws-fapi/v1', self.__ws_api)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        if self.message_rate:
+            self.generator = asyncio.create_task(self.__generate())
+        logging.info('Mock exchange listening on %s:%d' % (host, self.port))
+        return self
+
+    async def stop(self):
+        if self.generator is not None:
+            self.generator.cancel()
+        for ws in list(self.clients):
+            await ws.close()
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    async def disconnect(self):
+        """Drop the stream connections, as a network blip would; the orders stay and user events meanwhile are lost."""
+        for ws in list(self.clients):
+            await ws.close()
+
+    ###
+    # Market
+    ###
+
+    def __random_qty(self):
+        return round(self.rng.uniform(0.01, 5), 3)
+
+    def __best_bid(self):
+        tick = self.mid - 1
+        while tick not in self.bids:
+            tick -= 1
+        return tick
+
+    def __best_ask(self):
+        tick = self.mid + 1
+        while tick not in self.asks:
+            tick += 1
+        return tick
+
+    def __format_levels(self, levels):
+        return [[self.price_format % (tick * self.tick_size), '%.3f' % qty] for tick, qty in levels]
+
+    def depth_update(self):
+        """Move the book; returns the depth update event or None if it is dropped to simulate a gap."""
+        rng = self.rng
+        bids = self.changed_bids
+        asks = self.changed_asks
+        step = rng.choice((-1, 0, 0, 0, 1))
+        if step:
+            # The level at the new mid leaves the side the mid moved into and the far end of the other side is cut
+            # off, keeping the book `levels` deep.
+            self.mid += step
+            mid = self.mid
+            inside, far = (self.asks, self.bids) if step > 0 else (self.bids, self.asks)
+            inside_changed, far_changed = (asks, bids) if step > 0 else (bids, asks)
+            if inside.pop(mid, None) is not None:
+                inside_changed[mid] = 0
+            if far.pop(mid - step * self.levels, None) is not None:
+                far_changed[mid - step * self.levels] = 0
+        mid = self.mid
+        for book, changed, sign in ((self.bids, bids, -1), (self.asks, asks, 1)):
+            if mid + sign not in book:
+                book[mid + sign] = changed[mid + sign] = self.__random_qty()
+            for _ in range(4):
+                tick = mid + sign * rng.randint(1, 30)
+                qty = 0 if rng.random() < 0.2 else self.__random_qty()
+                if qty:
+                    book[tick] = qty
+                else:
+                    book.pop(tick, None)
+                changed[tick] = qty
+        now = int(time.time() * 1000)
+        data = {'e': 'depthUpdate', 'E': now, 'T': now, 's': self.symbol, 'U': self.update_id + 1,
+                'u': self.update_id + 1, 'pu': self.update_id,
+                'b': self.__format_levels(bids.items()), 'a': self.__format_levels(asks.items())}
+        self.update_id += 1
+        self.changed_bids = {}
+        self.changed_asks = {}
+        if rng.random() < self.gap_rate:
+            self.gaps += 1
+            return None
+        return data
+
+    def trade(self):
+        rng = self.rng
+        buyer_maker = rng.random() < 0.5
+        book, changed = (self.bids, self.changed_bids) if buyer_maker else (self.asks, self.changed_asks)
+        tick = self.__best_bid() if buyer_maker else self.__best_ask()
+        qty = min(book[tick], round(rng.uniform(0.001, 2), 3))
+        left = round(book[tick] - qty, 3)
+        if left > 0:
+            book[tick] = changed[tick] = left
+        elif len(book) > 1:
+            del book[tick]
+            changed[tick] = 0
+        now = int(time.time() * 1000)
+        data = {'e': 'trade', 'E': now, 'T': now, 's': self.symbol, 't': next(self.trade_ids),
+                'p': self.price_format % (tick * self.tick_size), 'q': '%.3f' % qty, 'X': 'MARKET', 'm': buyer_maker}
+        # A sell hitting the bids fills our buy orders at or above its price, and vice versa.
+        if buyer_maker:
+            filled = [order for order_tick, orders in self.resting['BUY'].items() if order_tick >= tick
+                      for order in orders.values()]
+        else:
+            filled = [order for order_tick, orders in self.resting['SELL'].items() if order_tick <= tick
+                      for order in orders.values()]
+        for order in filled:
+            self.__fill(order, float(order['price']))
+        return data
+
+    def snapshot(self, limit=500):
+        """The current book as a REST depth snapshot."""
+        bids = sorted(self.bids.items(), reverse=True)[:limit]
+        asks = sorted(self.asks.items())[:limit]
+        return {'lastUpdateId': self.update_id, 'E': int(time.time() * 1000),
+                'bids': self.__format_levels(bids), 'asks': self.__format_levels(asks)}
+
+    async def __generate(self):
+        loop = asyncio.get_running_loop()
+        credit = 0.0
+        last = loop.time()
+        while True:
+            await asyncio.sleep(0.001)
+            now = loop.time()
+            credit += (now - last) * self.message_rate
+            last = now
+            n = int(credit)
+            credit -= n
+            for _ in range(n):
+                if self.rng.random() < self.trade_ratio:
+                    await self.__publish(self.trade_stream, self.trade())
+                    await self.__flush_user_events()
+                else:
+                    data = self.depth_update()
+                    if data is not None:
+                        await self.__publish(self.depth_stream, data)
+
+    async def __publish(self, stream, data):
+        message = None
+        for ws, streams in list(self.clients.items()):
+            if stream in streams and not ws.closed:
+                if message is None:
+                    message = json_dumps({'stream': stream, 'data': data})
+                await ws.send_str(message)
+        self.messages_sent += 1
+
+    async def __flush_user_events(self):
+        events = self.user_events
+        if not events:
+            return
+        self.user_events = []
+        for data in events:
+            for ws, streams in list(self.clients.items()):
+                if ws.closed:
+                    continue
+                for stream in streams & self.listen_keys:
+                    await ws.send_str(json_dumps({'stream': stream, 'data': data}))
+
+    ###
+    # Matching engine
+    ###
+
+    def __check_filters(self, params):
+        """Reject a price or quantity off the tick or lot grid or with more decimals than the grid, as Binance does."""
+        for key, size, code, msg in (('price', self.tick_size, -4014, 'Price not increased by tick size.'),
+                                     ('quantity', self.step_size, -4023, 'Quantity not increased by step size.')):
+            value = decimal.Decimal(params[key])
+            size = decimal.Decimal(str(size))
+            if -value.normalize().as_tuple().exponent > -size.normalize().as_tuple().exponent:
+                return {'code': -1111, 'msg': 'Precision is over the maximum defined for this asset.'}
+            if value <= 0 or value % size:
+                return {'code': code, 'msg': msg}
+        return None
+
+    def __place(self, params):
+        client_order_id = params.get('newClientOrderId') or 'mock_%d' % next(self.order_ids)
+        if client_order_id in self.orders:
+            return {'code': -4015, 'msg': 'Client order id is not valid.'}
+        error = self.__check_filters(params)
+        if error is not None:
+            return error
+        side = params['side'].upper()
+        now = int(time.time() * 1000)
+        order = {
+            'symbol': self.symbol,
+            'orderId': next(self.order_ids),
+            'clientOrderId': client_order_id,
+            'side': side,
+            'type': params.get('type', 'LIMIT'),
+            'timeInForce': params.get('timeInForce', 'GTC'),
+            'price': params['price'],
+            'origQty': params['quantity'],
+            'executedQty': '0',
+            'cumQty': '0',
+            'status': 'NEW',
+            'updateTime': now,
+        }
+        self.orders[client_order_id] = order
+        tick = round(float(order['price']) / self.tick_size)
+        if side == 'BUY':
+            best = self.__best_ask()
+            crossing = tick >= best
+        else:
+            best = self.__best_bid()
+            crossing = tick <= best
+        if crossing:
+            if order['timeInForce'] == 'GTX':
+                order['status'] = 'EXPIRED'
+                self.__order_event(order)
+            else:
+                self.__fill(order, best * self.tick_size)
+            return dict(order)
+        self.__rest(order, tick)
+        self.__order_event(order)
+        return dict(order)
+
+    def __modify(self, params):
+        order = self.__find(params)
+        if order is None:
+            return {'code': -2013, 'msg': 'Order does not exist.'}
+        error = self.__check_filters(params)
+        if error is not None:
+            return error
+        self.__unrest(order)
+        order['price'] = params['price']
+        order['origQty'] = params['quantity']
+        order['updateTime'] = int(time.time() * 1000)
+        self.__rest(order, round(float(order['price']) / self.tick_size))
+        self.__order_event(order)
+        return dict(order)
+
+    def __cancel(self, params):
+        order = self.__find(params)
+        if order is None:
+            return UNKNOWN_ORDER
+        self.__unrest(order)
+        order['status'] = 'CANCELED'
+        order['updateTime'] = int(time.time() * 1000)
+        self.__order_event(order)
+        return dict(order)
+
+    def __find(self, params):
+        order = self.orders.get(params.get('origClientOrderId'))
+        if order is None or order['status'] not in ACTIVE_STATUSES:
+            return None
+        return order
+
+    def __rest(self, order, tick):
+        order['tick'] = tick
+        self.resting[order['side']].setdefault(tick, {})[order['clientOrderId']] = order
+
+    def __unrest(self, order):
+        tick = order.pop('tick', None)
+        if tick is None:
+            return
+        level = self.resting[order['side']][tick]
+        del level[order['clientOrderId']]
+        if not level:
+            del self.resting[order['side']][tick]
+
+    def __fill(self, order, price):
+        self.__unrest(order)
+        qty = float(order['origQty']) - float(order['executedQty'])
+        signed = qty if order['side'] == 'BUY' else -qty
+        position = round(self.position + signed, 8)
+        if position == 0:
+            self.entry_price = 0.0
+        elif self.position == 0 or (self.position > 0) == (signed > 0):
+            self.entry_price = (self.entry_price * abs(self.position) + price * qty) / abs(position)
+        elif (position > 0) != (self.position > 0):
+            self.entry_price = price
+        self.position = position
+        order['executedQty'] = order['cumQty'] = order['origQty']
+        order['status'] = 'FILLED'
+        order['updateTime'] = int(time.time() * 1000)
+        self.__order_event(order, qty, price)
+        now = int(time.time() * 1000)
+        self.user_events.append({
+            'e': 'ACCOUNT_UPDATE', 'E': now, 'T': now,
+            'a': {'m': 'ORDER', 'B': [], 'P': [{'s': self.symbol, 'pa': str(self.position), 'ep': str(self.entry_price),
+                                                 'ps': 'BOTH'}]}
+        })
+
+    def __order_event(self, order, last_qty=0.0, last_price=0.0):
+        now = int(time.time() * 1000)
+        self.user_events.append({
+            'e': 'ORDER_TRADE_UPDATE', 'E': now, 'T': now,
+            'o': {'s': self.symbol, 'c': order['clientOrderId'], 'S': order['side'], 'o': order['type'],
+                  'f': order['timeInForce'], 'q': order['origQty'], 'p': order['price'], 'X': order['status'],
+                  'x': 'TRADE' if last_qty else order['status'], 'i': order['orderId'], 'l': str(last_qty),
+                  'L': str(last_price), 'z': order['executedQty'], 'T': order['updateTime']}
+        })
+
+    def __report(self, order):
+        order = dict(order)
+        order.pop('tick', None)
+        return order
+
+    ###
+    # REST API
+    ###
+
+    def __middleware(self):
+        @web.middleware
+        async def middleware(request, handler):
+            if not request.path.startswith('/fapi/'):
+                return await handler(request)
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            if self.error_rate and self.rng.random() < self.error_rate:
+                self.errors_injected += 1
+                status = self.rng.choice(self.errors)
+                headers = {'Retry-After': '1'} if status in (418, 429) else None
+                return web.json_response({'code': -1003, 'msg': 'Injected error.'}, status=status, headers=headers)
+            if self.api_secret is not None and request.path not in PUBLIC_PATHS:
+                if request.headers.get('X-MBX-APIKEY') != self.api_key:
+                    return web.json_response({'code': -2015, 'msg': 'Invalid API-key.'}, status=401)
+                # The signature covers the query string as sent, before any percent-decoding.
+                payload, _, signature = request.rel_url.raw_query_string.rpartition('&signature=')
+                if not self.__verify(payload, signature):
+                    return web.json_response({'code': -1022, 'msg': 'Signature for this request is not valid.'},
+                                             status=400)
+            weight, orders = WEIGHTS.get((request.method, request.path), (1, 0))
+            if request.path == '/fapi/v1/batchOrders' and request.method in ('POST', 'PUT'):
+                orders = len(json_loads(request.query['batchOrders']))
+            self.__count(weight, orders)
+            response = await handler(request)
+            response.headers.update({
+                'X-MBX-USED-WEIGHT-1M': str(self.used_weight),
+                'X-MBX-ORDER-COUNT-1M': str(self.orders_1m),
+                'X-MBX-ORDER-COUNT-10S': str(self.orders_10s),
+            })
+            await self.__flush_user_events()
+            return response
+        return middleware
+
+    def __verify(self, payload, signature):
+        expected = hmac.new(self.api_secret.encode('utf-8'), payload.encode('utf-8'), hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, signature)
+
+    def __count(self, weight, orders):
+        now = time.time()
+        if self.weight_window != int(now // 60):
+            self.weight_window = self.orders_1m_window = int(now // 60)
+            self.used_weight = self.orders_1m = 0
+        if self.orders_10s_window != int(now // 10):
+            self.orders_10s_window = int(now // 10)
+            self.orders_10s = 0
+        self.used_weight += weight
+        self.orders_1m += orders
+        self.orders_10s += orders
+
+    def __json(self, data, status=200):
+        return web.json_response(data, status=status, dumps=json_dumps)
+
+    async def __ping(self, request):
+        return self.__json({})
+
+    async def __exchange_info(self, request):
+        return self.__json({'symbols': [{
+            'symbol': self.symbol,
+            'status': 'TRADING',
+            'filters': [
+                {'filterType': 'PRICE_FILTER', 'tickSize': str(self.tick_size)},
+                {'filterType': 'LOT_SIZE', 'stepSize': str(self.step_size)},
+            ],
+        }]})
+
+    async def __depth(self, request):
+        return self.__json(self.snapshot(int(request.query.get('limit', 500))))
+
+    async def __order(self, request):
+        params = request.query
+        if request.method == 'POST':
+            result = self.__place(params)
+        elif request.method == 'PUT':
+            result = self.__modify(params)
+        elif request.method == 'DELETE':
+            result = self.__cancel(params)
+        else:
+            raise web.HTTPMethodNotAllowed(request.method, ['POST', 'PUT', 'DELETE'])
+        if 'code' in result:
+            return self.__json(result, status=400)
+        return self.__json(self.__report(result))
+
+    async def __batch_orders(self, request):
+        if request.method == 'POST':
+            results = [self.__place(params) for params in json_loads(request.query['batchOrders'])]
+        elif request.method == 'PUT':
+            results = [self.__modify(params) for params in json_loads(request.query['batchOrders'])]
+        elif request.method == 'DELETE':
+            results = [self.__cancel({'origClientOrderId': client_order_id})
+                       for client_order_id in json_loads(request.query['origClientOrderIdList'])]
+        else:
+            raise web.HTTPMethodNotAllowed(request.method, ['POST', 'PUT', 'DELETE'])
+        return self.__json([result if 'code' in result else self.__report(result) for result in results])
+
+    async def __all_open_orders(self, request):
+        for order in list(self.orders.values()):
+            if order['status'] in ACTIVE_STATUSES:
+                self.__cancel({'origClientOrderId': order['clientOrderId']})
+        return self.__json({'code': 200, 'msg': 'The operation of cancel all open order is done.'})
+
+    async def __open_orders(self, request):
+        return self.__json([self.__report(order) for order in self.orders.values()
+                            if order['status'] in ACTIVE_STATUSES])
+
+    async def __listen_key(self, request):
+        if request.method == 'POST':
+            listen_key = 'mock%016x' % self.rng.getrandbits(64)
+            self.listen_keys.add(listen_key)
+            return self.__json({'listenKey': listen_key})
+        return self.__json({})
+
+    async def __position_risk(self, request):
+        return self.__json([{'symbol': self.symbol, 'positionSide': 'BOTH', 'positionAmt': str(self.position),
+                             'entryPrice': str(self.entry_price)}])
+
+    ###
+    # WebSocket endpoints
+    ###
+
+    async def __stream(self, request):
+        ws = web.WebSocketResponse(autoping=True)
+        await ws.prepare(request)
+        self.clients[ws] = set(request.query.get('streams', '').split('/'))
+        try:
+            async for msg in ws:
+                pass
+        finally:
+            del self.clients[ws]
+        return ws
+
+    async def __ws_api(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        methods = {'order.place': self.__place, 'order.modify': self.__modify, 'order.cancel': self.__cancel}
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            req = json_loads(msg.data)
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            params = dict(req['params'])
+            signature = params.pop('signature', None)
+            method = methods.get(req['method'])
+            if self.api_secret is not None and (params.get('apiKey') != self.api_key or not self.__verify(
+                    '&'.join('%s=%s' % (key, params[key]) for key in sorted(params)), signature or '')):
+                result = {'code': -1022, 'msg': 'Signature for this request is not valid.'}
+            elif method is None:
+                result = {'code': -1100, 'msg': 'Unknown method %s.' % req['method']}
+            else:
+                self.__count(*WS_API_WEIGHTS[req['method']])
+                result = method(params)
+            rate_limits = [
+                {'rateLimitType': 'REQUEST_WEIGHT', 'interval': 'MINUTE', 'intervalNum': 1, 'count': self.used_weight},
+                {'rateLimitType': 'ORDERS', 'interval': 'MINUTE', 'intervalNum': 1, 'count': self.orders_1m},
+                {'rateLimitType': 'ORDERS', 'interval': 'SECOND', 'intervalNum': 10, 'count': self.orders_10s},
+            ]
+            if 'code' in result:
+                response = {'id': req['id'], 'status': 400, 'error': result, 'rateLimits': rate_limits}
+            else:
+                response = {'id': req['id'], 'status': 200, 'result': self.__report(result), 'rateLimits': rate_limits}
+            await ws.send_str(json_dumps(response))
+            await self.__flush_user_events()
+        return ws
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local mock Binance Futures exchange.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--symbol', default='btcusdt')
+    parser.add_argument('--rate', type=float, default=100, help='market data messages per second')
+    parser.add_argument('--trade-ratio', type=float, default=0.2)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every API request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of REST requests failing')
+    parser.add_argument('--gap-rate', type=float, default=0.0, help='fraction of depth updates dropped')
+    parser.add_argument('--api-key')
+    parser.add_argument('--api-secret')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    async def serve():
+        exchange = MockExchange(args.symbol, api_key=args.api_key, api_secret=args.api_secret, message_rate=args.rate,
+                                trade_ratio=args.trade_ratio, latency=args.latency, error_rate=args.error_rate,
+                                gap_rate=args.gap_rate)
+        await exchange.start(args.host, args.port)
+        logging.info('BASE_URL=%r STREAM_URL=%r WS_API_URL=%r' % (exchange.base_url, exchange.stream_url,
+                                                                  exchange.ws_api_url))
+        try:
+            while True:
+                await asyncio.sleep(60)
+                logging.info('messages=%d gaps=%d errors=%d orders=%d position=%s' % (
+                    exchange.messages_sent, exchange.gaps, exchange.errors_injected, len(exchange.orders),
+                    exchange.position))
+        finally:
+            await exchange.stop()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
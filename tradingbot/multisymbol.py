@@ -0,0 +1,261 @@
+import asyncio
+import logging
+import time
+
+from aiohttp import WSMsgType
+
+from tradingbot.binancefutures import SYNCING, BinanceFutures, create_session
+from tradingbot.codec import json_loads
+from tradingbot.messagequeue import MessageQueue
+from tradingbot.metrics import metrics
+from tradingbot.ratelimit import RateLimiter
+from tradingbot.recorder import FRAME
+
+# Streams a single combined stream connection can carry on Binance Futures
+MAX_STREAMS = 200
+
+
+class MultiSymbolBinanceFutures:
+    """Trade several symbols over one combined market data stream, one user data stream and one REST session.
+
+    Each symbol gets a BinanceFutures instance with its own book and order store. They share the HTTP session, the
+    rate limit governor and, with order_transport='ws', the WebSocket API connection, so every request counts
+    against one budget. Market data is routed to a symbol by its stream name, order updates by their symbol."""
+
+    def __init__(self, api_key, api_secret, symbols, testnet=True, orderIDPrefix='bot_bf_', postOnly=False, timeout=10,
+                 max_pending_messages=10000, connection_limit=20, keepalive_timeout=60, dns_cache_ttl=300,
+                 rate_limiter=None, order_transport='rest', base_url=None, ws_api_url=None, stream_url=None,
+                 recorders=None, user_data=True, warm_reconnect=False, symbol_cache=None, message_batch=0,
+                 conflate_lag=None):
+        symbols = [symbol.lower() for symbol in symbols]
+        if not symbols:
+            raise ValueError('No symbols.')
+        if 2 * len(symbols) + 1 > MAX_STREAMS:
+            raise ValueError('Too many symbols for one stream connection: %d' % len(symbols))
+        recorders = recorders or {}
+        self.client = create_session(connection_limit, keepalive_timeout, dns_cache_ttl)
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        self.bots = {}
+        ws_api = None
+        for symbol in symbols:
+            bot = BinanceFutures(api_key, api_secret, symbol, testnet, orderIDPrefix=orderIDPrefix, postOnly=postOnly,
+                                 timeout=timeout, max_pending_messages=max_pending_messages,
+                                 rate_limiter=self.rate_limiter, order_transport=order_transport, base_url=base_url,
+                                 ws_api_url=ws_api_url, stream_url=stream_url, recorder=recorders.get(symbol),
+                                 session=self.client, ws_api=ws_api, user_data=user_data,
+                                 warm_reconnect=warm_reconnect, symbol_cache=symbol_cache)
+            ws_api = bot.ws_api
+            self.bots[symbol] = bot
+        # Account-wide requests (listen key, positions, exchange info) go through the first symbol's instance.
+        self.rest = self.bots[symbols[0]]
+        self.ws_api = ws_api
+        self.stream_url = self.rest.stream_url
+        # stream name -> instance
+        self.routes = {}
+        for symbol, bot in self.bots.items():
+            self.routes['%s@depth@0ms' % symbol] = bot
+            self.routes['%s@trade' % symbol] = bot
+        self.user_data = user_data
+        self.warm_reconnect = warm_reconnect
+        self.closed = False
+        self.ws = None
+        self.keep_alive = None
+        self.listen_key = None
+        self.connected = False
+        self.reconnects = 0
+        self.on_message_histogram = metrics.histogram('md.on_message')
+        self.event_latency_histogram = metrics.histogram('md.event_to_receive')
+        # As in BinanceFutures; the frames are recorded by symbol before they are conflated.
+        self.message_queue = None
+        if message_batch > 0:
+            record = self.__record if any(bot.recorder is not None for bot in self.bots.values()) else None
+            self.message_queue = MessageQueue('stream', self.__on_queued_message, message_batch, conflate_lag,
+                                              record, self.__drop_connection)
+
+    async def warm_up(self, connections=2):
+        await self.rest.warm_up(connections)
+
+    async def get_symbols_info(self, symbols, on_refresh=None):
+        return await self.rest.get_symbols_info(symbols, on_refresh)
+
+    def __route(self, stream, data):
+        """The instances an event is for."""
+        bot = self.routes.get(stream)
+        if bot is not None:
+            return (bot,)
+        event = data['e']
+        if event == 'ORDER_TRADE_UPDATE':
+            bot = self.bots.get(data['o']['s'].lower())
+            return (bot,) if bot is not None else ()
+        if event == 'ACCOUNT_UPDATE':
+            symbols = set(position['s'].lower() for position in data['a']['P'])
+            return tuple(bot for symbol, bot in self.bots.items() if symbol in symbols)
+        return ()
+
+    async def __on_message(self, message):
+        received = time.time()
+        start = time.perf_counter()
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug(message)
+        message_ = json_loads(message)
+        data = message_['data']
+        if data['e'] == 'listenKeyExpired':
+            self.__on_listen_key_expired()
+        for bot in self.__route(message_['stream'], data):
+            if bot.recorder is not None:
+                bot.recorder.record(FRAME, message)
+            handler = bot.handlers.get(data['e'])
+            if handler is not None:
+                handler(data)
+        self.on_message_histogram.record(time.perf_counter() - start)
+        if 'E' in data:
+            self.event_latency_histogram.record(received - data['E'] / 1000)
+
+    def __record(self, received, frame, message):
+        timestamp = int(received * 1e9)
+        for bot in self.__route(message['stream'], message['data']):
+            if bot.recorder is not None:
+                bot.recorder.record(FRAME, frame, timestamp)
+
+    def __on_queued_message(self, received, message):
+        """Route a message parsed, and possibly conflated, by the message queue."""
+        start = time.perf_counter()
+        data = message['data']
+        if data['e'] == 'listenKeyExpired':
+            self.__on_listen_key_expired()
+        for bot in self.__route(message['stream'], data):
+            handler = bot.handlers.get(data['e'])
+            if handler is not None:
+                handler(data)
+        self.on_message_histogram.record(time.perf_counter() - start)
+        if 'E' in data:
+            self.event_latency_histogram.record(received - data['E'] / 1000)
+
+    def __drop_connection(self):
+        """Close the stream after a queued message failed, so that connect reconnects."""
+        if self.ws is not None:
+            asyncio.create_task(self.ws.close())
+
+    def __on_listen_key_expired(self):
+        logging.warning('Listen key is expired.')
+        self.listen_key = None
+        if self.ws is not None:
+            asyncio.create_task(self.ws.close())
+
+    async def __keep_alive(self):
+        while not self.closed:
+            try:
+                await asyncio.sleep(5)
+                if self.user_data:
+                    await self.rest.keepalive_user_data_stream()
+                await self.ws.pong()
+            except Exception:
+                pass
+
+    async def __reconcile(self):
+        """One open orders and one position snapshot for all symbols after a warm reconnect."""
+        try:
+            since = int(time.time() * 1000)
+            orders, positions = await asyncio.gather(self.rest.open_orders(), self.rest.open_positions())
+            for symbol, bot in self.bots.items():
+                bot.running_qty = positions.get(symbol.upper(), '0')
+                bot.reconcile_orders(orders, since)
+                bot.update_event.set()
+        except Exception:
+            logging.exception('Reconciliation failed, reconnecting.')
+            if self.ws is not None:
+                await self.ws.close()
+
+    async def __renew_listen_key(self):
+        if self.listen_key is not None:
+            try:
+                await self.rest.keepalive_user_data_stream()
+                return self.listen_key
+            except Exception:
+                logging.warning('The listen key could not be kept alive, opening a new one.', exc_info=True)
+        return await self.rest.open_user_data_stream()
+
+    async def connect(self):
+        """As BinanceFutures.connect, for all symbols at once. After a warm reconnect the books resync on their first
+           buffered update."""
+        warm = self.warm_reconnect and self.connected
+        opened = False
+        if self.message_queue is not None:
+            self.message_queue.start()
+        try:
+            streams = list(self.routes)
+            if self.user_data:
+                if warm:
+                    self.listen_key = await self.__renew_listen_key()
+                else:
+                    # Independent requests, sent at once.
+                    positions, self.listen_key, *_ = await asyncio.gather(
+                        self.rest.open_positions(), self.rest.open_user_data_stream(),
+                        *(bot.cancel_all_orders() for bot in self.bots.values()))
+                    for symbol, bot in self.bots.items():
+                        bot.running_qty = positions.get(symbol.upper(), '0')
+                streams.insert(0, self.listen_key)
+            url = '%s?streams=%s' % (self.stream_url, '/'.join(streams))
+            async with self.client.ws_connect(url) as ws:
+                logging.info('WS Connected. symbols=%s' % ','.join(self.bots))
+                opened = True
+                if self.connected:
+                    self.reconnects += 1
+                self.connected = True
+                self.ws = ws
+                self.keep_alive = asyncio.create_task(self.__keep_alive())
+                if warm and self.user_data:
+                    asyncio.create_task(self.__reconcile())
+                queue = self.message_queue
+                async for msg in ws:
+                    if msg.type == WSMsgType.TEXT:
+                        if queue is not None:
+                            queue.put(msg.data)
+                            continue
+                        await self.__on_message(msg.data)
+                    elif msg.type == WSMsgType.BINARY:
+                        pass
+                    elif msg.type == WSMsgType.PING:
+                        await self.ws.pong()
+                    elif msg.type == WSMsgType.PONG:
+                        await self.ws.ping()
+                    elif msg.type == WSMsgType.ERROR:
+                        exc = ws.exception()
+                        raise exc if exc is not None else Exception
+        except:
+            logging.exception('WS Error')
+        finally:
+            logging.info('WS Disconnected.')
+            if self.keep_alive is not None:
+                self.keep_alive.cancel()
+                await asyncio.gather(self.keep_alive, return_exceptions=True)
+                self.keep_alive = None
+            self.ws = None
+            for bot in self.bots.values():
+                if bot.resync_task is not None:
+                    bot.resync_task.cancel()
+                    await asyncio.gather(bot.resync_task, return_exceptions=True)
+                bot.book_state = SYNCING
+                if not self.warm_reconnect:
+                    bot.depth.clear()
+            if not self.closed:
+                if not opened:
+                    await asyncio.sleep(1)
+                asyncio.create_task(self.connect())
+
+    async def close(self):
+        if self.user_data:
+            await asyncio.gather(*(bot.cancel_all_orders() for bot in self.bots.values()))
+        self.closed = True
+        if self.message_queue is not None:
+            await self.message_queue.close()
+        for bot in self.bots.values():
+            bot.closed = True
+            if bot.recorder is not None:
+                bot.recorder.close()
+        if self.ws is not None:
+            await self.ws.close()
+        if self.ws_api is not None:
+            await self.ws_api.close()
+        await self.client.close()
+        await asyncio.sleep(1)
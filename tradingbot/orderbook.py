@@ -0,0 +1,321 @@
+import logging
+import math
+
+import numpy as np
+
+
+class OrderBook:
+    """Tick-indexed order book.
+
+    Each side is a dense float64 array of quantities indexed by the price tick relative to `origin`, so a level update
+    is a single array write and the best bid/ask are tracked as indexes. The arrays are recentred and grown on demand
+    when a price falls outside the current window, up to `max_span` ticks: a level further than half of that from the
+    mid is dropped, so a stray price cannot blow up the arrays."""
+
+    def __init__(self, tick_size=None, capacity=1 << 16, max_span=1 << 20):
+        self.tick_size = tick_size
+        self.capacity = capacity
+        self.max_span = max(max_span, capacity)
+        self.features = None
+        self.clear()
+
+    def set_tick_size(self, tick_size):
+        self.tick_size = tick_size
+        self.clear()
+
+    def clear(self):
+        self.origin = None
+        self.bid_qty = np.zeros(self.capacity)
+        self.ask_qty = np.zeros(self.capacity)
+        self.bid_levels = 0
+        self.ask_levels = 0
+        self._best_bid = -1
+        self._best_ask = self.capacity
+        if self.features is not None:
+            self.features.reset()
+
+    def __len__(self):
+        return self.bid_levels + self.ask_levels
+
+    def price_to_tick(self, price):
+        return int(round(float(price) / self.tick_size))
+
+    def tick_to_price(self, tick):
+        return tick * self.tick_size
+
+    ###
+    # Top of book
+    ###
+
+    @property
+    def best_bid_tick(self):
+        if self._best_bid < 0:
+            return None
+        return self.origin + self._best_bid
+
+    @property
+    def best_ask_tick(self):
+        if self._best_ask >= len(self.ask_qty):
+            return None
+        return self.origin + self._best_ask
+
+    @property
+    def best_bid(self):
+        if self._best_bid < 0:
+            return math.nan
+        return (self.origin + self._best_bid) * self.tick_size
+
+    @property
+    def best_ask(self):
+        if self._best_ask >= len(self.ask_qty):
+            return math.nan
+        return (self.origin + self._best_ask) * self.tick_size
+
+    @property
+    def best_bid_qty(self):
+        if self._best_bid < 0:
+            return 0.0
+        return float(self.bid_qty[self._best_bid])
+
+    @property
+    def best_ask_qty(self):
+        if self._best_ask >= len(self.ask_qty):
+            return 0.0
+        return float(self.ask_qty[self._best_ask])
+
+    @property
+    def mid(self):
+        return (self.best_bid + self.best_ask) / 2.0
+
+    ###
+    # Level updates
+    ###
+
+    def update_bid(self, tick, qty):
+        """Set the quantity at a bid tick; a zero quantity removes the level. Returns the quantity change."""
+        i = tick - self.origin if self.origin is not None else -1
+        if not 0 <= i < len(self.bid_qty):
+            if qty == 0 or not self._ensure(tick):
+                return 0.0
+            i = tick - self.origin
+        prev = self.bid_qty[i]
+        self.bid_qty[i] = qty
+        if qty > 0:
+            if prev == 0:
+                self.bid_levels += 1
+            if i > self._best_bid:
+                self._best_bid = i
+        elif prev > 0:
+            self.bid_levels -= 1
+            if i == self._best_bid:
+                self._best_bid = self._next_bid(i)
+        return qty - prev
+
+    def update_ask(self, tick, qty):
+        """Set the quantity at an ask tick; a zero quantity removes the level. Returns the quantity change."""
+        i = tick - self.origin if self.origin is not None else -1
+        if not 0 <= i < len(self.ask_qty):
+            if qty == 0 or not self._ensure(tick):
+                return 0.0
+            i = tick - self.origin
+        prev = self.ask_qty[i]
+        self.ask_qty[i] = qty
+        if qty > 0:
+            if prev == 0:
+                self.ask_levels += 1
+            if i < self._best_ask:
+                self._best_ask = i
+        elif prev > 0:
+            self.ask_levels -= 1
+            if i == self._best_ask:
+                self._best_ask = self._next_ask(i)
+        return qty - prev
+
+    def decode(self, levels):
+        """Convert [price, qty] string pairs as received from the exchange to (tick, qty) pairs."""
+        tick_size = self.tick_size
+        return [(round(float(price) / tick_size), float(qty)) for price, qty in levels]
+
+    def apply(self, bids, asks):
+        """Apply decoded (tick, qty) pairs and notify the attached features."""
+        features = self.features
+        if features is None or not features.bands:
+            update_bid = self.update_bid
+            update_ask = self.update_ask
+            for tick, qty in bids:
+                update_bid(tick, qty)
+            for tick, qty in asks:
+                update_ask(tick, qty)
+            if features is not None:
+                features.on_update()
+            return
+        for tick, qty in bids:
+            delta = self.update_bid(tick, qty)
+            if delta:
+                features.on_bid(tick, delta)
+        for tick, qty in asks:
+            delta = self.update_ask(tick, qty)
+            if delta:
+                features.on_ask(tick, delta)
+        features.on_update()
+
+    def clear_inside(self, low_bid_tick, high_ask_tick):
+        """Remove bids at or above `low_bid_tick` and asks at or below `high_ask_tick`.
+
+        Used when merging a depth snapshot: levels beyond the snapshot's range are kept."""
+        if self.origin is None:
+            return
+        lo = min(max(low_bid_tick - self.origin, 0), len(self.bid_qty))
+        self.bid_qty[lo:] = 0
+        hi = min(max(high_ask_tick - self.origin + 1, 0), len(self.ask_qty))
+        self.ask_qty[:hi] = 0
+        self.bid_levels = int(np.count_nonzero(self.bid_qty))
+        self.ask_levels = int(np.count_nonzero(self.ask_qty))
+        self._best_bid = self._next_bid(len(self.bid_qty))
+        self._best_ask = self._next_ask(-1)
+        if self.features is not None:
+            self.features.reset()
+
+    ###
+    # Depth views
+    ###
+
+    def bid_depth(self, n):
+        """Zero-copy view of the bid quantities of `n` ticks from the best bid downwards."""
+        b = self._best_bid
+        if b < 0:
+            return self.bid_qty[:0]
+        return self.bid_qty[max(b - n + 1, 0):b + 1][::-1]
+
+    def ask_depth(self, n):
+        """Zero-copy view of the ask quantities of `n` ticks from the best ask upwards."""
+        return self.ask_qty[self._best_ask:self._best_ask + n]
+
+    def bids(self, n=None):
+        """Returns (prices, quantities) arrays of the `n` best non-empty bid levels, best first."""
+        if self._best_bid < 0:
+            return np.empty(0), np.empty(0)
+        end = self._best_bid + 1
+        if n is None:
+            idx = np.flatnonzero(self.bid_qty[:end])[::-1]
+        else:
+            window = max(n, 64)
+            while True:
+                start = max(end - window, 0)
+                idx = np.flatnonzero(self.bid_qty[start:end])[::-1][:n] + start
+                if len(idx) >= n or start == 0:
+                    break
+                window *= 4
+        return (idx + self.origin) * self.tick_size, self.bid_qty[idx]
+
+    def asks(self, n=None):
+        """Returns (prices, quantities) arrays of the `n` best non-empty ask levels, best first."""
+        start = self._best_ask
+        if start >= len(self.ask_qty):
+            return np.empty(0), np.empty(0)
+        if n is None:
+            idx = np.flatnonzero(self.ask_qty[start:]) + start
+        else:
+            window = max(n, 64)
+            while True:
+                end = min(start + window, len(self.ask_qty))
+                idx = np.flatnonzero(self.ask_qty[start:end])[:n] + start
+                if len(idx) >= n or end == len(self.ask_qty):
+                    break
+                window *= 4
+        return (idx + self.origin) * self.tick_size, self.ask_qty[idx]
+
+    ###
+    # Internals
+    ###
+
+    def _next_bid(self, i):
+        """Index of the highest non-empty bid below `i`, or -1."""
+        if self.bid_levels == 0:
+            return -1
+        window = 64
+        while i > 0:
+            start = max(i - window, 0)
+            nz = np.flatnonzero(self.bid_qty[start:i])
+            if len(nz) > 0:
+                return start + int(nz[-1])
+            i = start
+            window *= 4
+        return -1
+
+    def _next_ask(self, i):
+        """Index of the lowest non-empty ask above `i`, or the array length."""
+        size = len(self.ask_qty)
+        if self.ask_levels == 0:
+            return size
+        i += 1
+        window = 64
+        while i < size:
+            end = min(i + window, size)
+            nz = np.flatnonzero(self.ask_qty[i:end])
+            if len(nz) > 0:
+                return i + int(nz[0])
+            i = end
+            window *= 4
+        return size
+
+    def _centre(self):
+        """Tick in the middle of the best bid and ask, or of the side there is; None if the book is empty."""
+        bid = self._best_bid
+        ask = self._best_ask
+        if ask >= len(self.ask_qty):
+            return self.origin + bid if bid >= 0 else None
+        if bid < 0:
+            return self.origin + ask
+        return self.origin + (bid + ask) // 2
+
+    def _ensure(self, tick):
+        """Recentre and grow the arrays so that `tick` is addressable. Returns False, leaving the book as it is, if
+           `tick` is further than max_span // 2 from the mid.
+
+        The arrays never span more than max_span ticks: levels left outside that band around the mid as prices move
+        are dropped."""
+        size = len(self.bid_qty)
+        if self.origin is None or self.bid_levels + self.ask_levels == 0:
+            self.origin = tick - size // 2
+            self._best_bid = -1
+            self._best_ask = size
+            return True
+        centre = self._centre()
+        band_lo = centre - self.max_span // 2
+        band_hi = band_lo + self.max_span
+        if not band_lo <= tick < band_hi:
+            logging.warning('Dropped a level too far from the mid. tick=%d, mid_tick=%d' % (tick, centre))
+            return False
+        lo = max(min(tick, self.origin), band_lo)
+        hi = min(max(tick + 1, self.origin + size), band_hi)
+        new_size = size
+        while new_size < 2 * (hi - lo) and new_size < self.max_span:
+            new_size *= 2
+        new_origin = lo - (new_size - (hi - lo)) // 2
+        # The part of the current window that is kept.
+        keep_lo = max(self.origin, new_origin)
+        keep_hi = min(self.origin + size, new_origin + new_size)
+        bid_qty = np.zeros(new_size)
+        ask_qty = np.zeros(new_size)
+        bid_qty[keep_lo - new_origin:keep_hi - new_origin] = self.bid_qty[keep_lo - self.origin:keep_hi - self.origin]
+        ask_qty[keep_lo - new_origin:keep_hi - new_origin] = self.ask_qty[keep_lo - self.origin:keep_hi - self.origin]
+        shift = self.origin - new_origin
+        self.bid_qty = bid_qty
+        self.ask_qty = ask_qty
+        self.origin = new_origin
+        if keep_hi - keep_lo < size:
+            levels = self.bid_levels + self.ask_levels
+            self.bid_levels = int(np.count_nonzero(bid_qty))
+            self.ask_levels = int(np.count_nonzero(ask_qty))
+            self._best_bid = self._next_bid(new_size)
+            self._best_ask = self._next_ask(-1)
+            dropped = levels - self.bid_levels - self.ask_levels
+            if dropped:
+                logging.warning('Dropped %d levels too far from the mid. mid_tick=%d' % (dropped, centre))
+                if self.features is not None:
+                    self.features.reset()
+        else:
+            self._best_bid = self._best_bid + shift if self._best_bid >= 0 else -1
+            self._best_ask = self._best_ask + shift if self._best_ask < size else new_size
+        return True
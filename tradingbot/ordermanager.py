@@ -1,36 +1,87 @@
 import asyncio
+import bisect
+import importlib
 import logging
 import math
 import os
 import signal
 import sys
-from os.path import getmtime
+import time
 
 from tradingbot import settings
 from tradingbot.binancefutures import BinanceFutures
-
-# Used for reloading the bot - saves modified times of key files
-import os
-watched_files_mtimes = [(f, getmtime(f)) for f in settings.WATCHED_FILES]
+from tradingbot.hotreload import FileWatcher, load_module
+from tradingbot.instrument import Instrument
+from tradingbot.metrics import metrics
+from tradingbot.multisymbol import MultiSymbolBinanceFutures
+from tradingbot.recorder import Recorder
+from tradingbot.sharedfeed import SharedFeedBinanceFutures
+from tradingbot.symbolcache import SymbolInfoCache
 
 
-def round_down(n, decimals=0):
-    multiplier = 10 ** decimals
-    return math.floor(n * multiplier) / multiplier
+def nearest_orders(desired, ticks, tick, relist_interval):
+    """The desired orders left at the tick closest to `tick` within `relist_interval` of it, relatively, or None.
+       `ticks` are the ticks of `desired`, sorted."""
+    limit = abs(tick) * relist_interval
+    hi = bisect.bisect_left(ticks, tick)
+    lo = hi - 1
+    while lo >= 0 or hi < len(ticks):
+        if hi == len(ticks) or (lo >= 0 and tick - ticks[lo] <= ticks[hi] - tick):
+            nearest = ticks[lo]
+            lo -= 1
+        else:
+            nearest = ticks[hi]
+            hi += 1
+        if abs(nearest - tick) > limit:
+            return None
+        if desired[nearest]:
+            return desired[nearest]
+    return None
 
 
 class OrderManager:
-    def restart(self):
-        logging.info("Restarting the tradingbot...")
-        os.execv(sys.executable, [sys.executable] + sys.argv)
+    # Order manager class of reloaded strategy code, to take over at the start of the next cycle
+    next_class = None
 
     async def place_orders(self):
         raise NotImplementedError
 
-    async def converge_orders(self, buy_orders, sell_orders, cancel_first=False):
+    @property
+    def instrument(self):
+        """Price and quantity grid of the symbol, see tradingbot.instrument.Instrument."""
+        return self.binance_futures.instrument
+
+    async def run_place_orders(self):
+        """Run one place_orders cycle, recording its duration and the book change it acts on."""
+        if self.next_class is not None:
+            # Between two cycles: the instance, with its connection and state, carries on with the new code.
+            self.__class__, self.next_class = self.next_class, None
+            logging.info('Strategy code reloaded. class=%s.%s' % (self.__class__.__module__, self.__class__.__name__))
+        self.binance_futures.quote_trigger_time = self.binance_futures.last_update_time
+        start = time.perf_counter()
+        await self.place_orders()
+        metrics.record('strategy.place_orders', time.perf_counter() - start)
+
+    def material_change(self):
+        """Returns True if the market moved enough to call place_orders in event-driven mode.
+           By default this is any change of the best bid/ask or of the position."""
+        book = self.binance_futures.depth
+        state = (book.best_bid_tick, book.best_ask_tick, self.binance_futures.running_qty)
+        if state == self.quote_state:
+            return False
+        self.quote_state = state
+        return True
+
+    async def converge_orders(self, buy_orders, sell_orders, cancel_first=False, amend=None):
         """Converge the orders we currently have in the book with what we want to be in the book.
            This involves amending any open orders and creating new ones if any have filled completely.
-           We start from the closest orders outward."""
+           We start from the closest orders outward.
+           Orders are given as {'tick', 'lots', 'side'} in integer price ticks and quantity lots of self.instrument;
+           {'price', 'quantity', 'side'} is converted to those, rounding the quantity down to a whole lot.
+           If `amend` (settings.AMEND_ORDERS by default) is set, orders to cancel are paired with orders to create on
+           the same side and modified in place instead."""
+        if amend is None:
+            amend = settings.AMEND_ORDERS
 
         # existing_orders = await self.binance_futures.open_orders()
         # ws_existing_orders = self.binance_futures.open_orders_active().values()
@@ -42,58 +93,101 @@ class OrderManager:
         #             matched += 1
         #             break
         # assert matched == len(existing_orders)
-        existing_orders = self.binance_futures.open_orders_active().values()
-
-        for order in buy_orders:
-            order['price'] = str(order['price'])
-            order['quantity'] = str(round_down(order['quantity'], 3))
-        for order in sell_orders:
-            order['price'] = str(order['price'])
-            order['quantity'] = str(round_down(order['quantity'], 3))
-
-        # Check all existing orders and match them up with what we want to place.
-        for order in existing_orders:
-            order["keep"] = False
-            if order['side'] == 'BUY':
-                for i, buy_order in enumerate(buy_orders):
-                    if round(float(buy_order['price']) / self.tick_size) == round(float(order['price']) / self.tick_size) \
-                            and abs((float(buy_order['price']) / float(order['price'])) - 1) <= settings.RELIST_INTERVAL:
-                        # and buy_order['quantity'] == order['origQty']
-                        order["keep"] = True
-                        del buy_orders[i]
-                        break
-            else:
-                for i, sell_order in enumerate(sell_orders):
-                    if round(float(sell_order['price']) / self.tick_size) == round(float(order['price']) / self.tick_size) \
-                            and abs((float(sell_order['price']) / float(order['price'])) - 1) <= settings.RELIST_INTERVAL:
-                        # and sell_order['quantity'] == order['origQty']
-                        order["keep"] = True
-                        del sell_orders[i]
-                        break
-        to_cancel = [order for order in existing_orders if not order.get("keep")]
-        to_create = [{'price': order['price'], 'quantity': order['quantity'], 'side': 'BUY'} for order in buy_orders] + \
-            [{'price': order['price'], 'quantity': order['quantity'], 'side': 'SELL'} for order in sell_orders]
+
+        # Existing orders are indexed by price tick in the order store; index the desired orders the same way and
+        # match tick against tick, so the diff is linear in the number of orders. With a RELIST_INTERVAL an order
+        # without a desired order at its tick is still kept for the closest one left within the interval, found by
+        # bisection. Exact ticks are matched first, so a neighbour never takes the desired order of an exact match.
+        instrument = self.instrument
+        relist_interval = settings.RELIST_INTERVAL
+        by_tick = self.binance_futures.open_orders_ws.by_tick
+        to_cancel = []
+        to_create = []
+        for side, orders in (('BUY', buy_orders), ('SELL', sell_orders)):
+            desired = {}
+            for order in orders:
+                if 'tick' not in order:
+                    order['tick'] = instrument.price_to_tick(order.pop('price'))
+                    order['lots'] = instrument.qty_to_lots(order.pop('quantity'))
+                desired.setdefault(order['tick'], []).append(order)
+            kept = set()
+            unmatched = []
+            for tick, existing_orders in by_tick[side].items():
+                candidates = desired.get(tick)
+                for order in existing_orders.values():
+                    # and candidates[0]['lots'] == instrument.qty_to_lots(order['origQty'])
+                    if candidates:
+                        kept.add(id(candidates.pop(0)))
+                    else:
+                        unmatched.append((tick, order))
+            ticks = sorted(tick for tick, candidates in desired.items() if candidates) if relist_interval > 0 else None
+            for tick, order in unmatched:
+                candidates = nearest_orders(desired, ticks, tick, relist_interval) if ticks else None
+                if candidates:
+                    kept.add(id(candidates.pop(0)))
+                else:
+                    to_cancel.append(order)
+            to_create += [{'tick': order['tick'], 'lots': order['lots'], 'side': side}
+                          for order in orders if id(order) not in kept]
+
+        to_amend = []
+        if amend:
+            # Only acknowledged, unfilled orders can be modified. Every order to create takes the amendable order
+            # closest to it by tick, so an amendment moves an order as little as possible.
+            amendable = {'BUY': {}, 'SELL': {}}
+            cancel = []
+            for order in to_cancel:
+                if order['status'] == 'NEW':
+                    amendable[order['side']].setdefault(order['tick'], []).append(order)
+                else:
+                    cancel.append(order)
+            amendable_ticks = {side: sorted(orders) for side, orders in amendable.items()}
+            remaining = []
+            for order in to_create:
+                side = order['side']
+                candidates = nearest_orders(amendable[side], amendable_ticks[side], order['tick'], math.inf)
+                if candidates:
+                    existing_order = candidates.pop(0)
+                    to_amend.append({'clientOrderId': existing_order['clientOrderId'], 'side': side,
+                                     'tick': order['tick'], 'lots': order['lots'],
+                                     'origQty': existing_order['origQty'], 'origPrice': existing_order['price']})
+                else:
+                    remaining.append(order)
+            to_create = remaining
+            to_cancel = cancel + [order for side in ('BUY', 'SELL') for orders in amendable[side].values() for order in orders]
+
+        amend_task = []
+        if len(to_amend) > 0:
+            logging.info("Amending %d orders:" % (len(to_amend)))
+            if logging.root.isEnabledFor(logging.INFO):
+                for order in reversed(to_amend):
+                    logging.info("%4s %s @ %s -> %s @ %s" % (order['side'], order['origQty'], order['origPrice'],
+                                                             instrument.format_qty(order['lots']), instrument.format_price(order['tick'])))
+            for i in range(0, len(to_amend), 5):
+                to_amend_bulk = to_amend[i:i + 5]
+                if len(to_amend_bulk) < 5:
+                    for x in to_amend_bulk:
+                        amend_task.append(self.binance_futures.amend_orders(x))
+                else:
+                    amend_task.append(self.binance_futures.amend_bulk_orders(to_amend_bulk))
 
         cancel_task = []
         if len(to_cancel) > 0:
             logging.info("Canceling %d orders:" % (len(to_cancel)))
             for order in reversed(to_cancel):
                 logging.info("%4s %s @ %s" % (order['side'], order['origQty'], order['price']))
-            while to_cancel:
-                to_cancel_bulk = []
-                while to_cancel and len(to_cancel_bulk) < 10:
-                    to_cancel_bulk.append(to_cancel.pop(0))
+            for i in range(0, len(to_cancel), 10):
+                to_cancel_bulk = to_cancel[i:i + 10]
                 cancel_task.append(self.binance_futures.cancel_bulk_orders([x['clientOrderId'] for x in to_cancel_bulk]))
 
         create_task = []
         if len(to_create) > 0:
             logging.info("Creating %d orders:" % (len(to_create)))
-            for order in reversed(to_create):
-                logging.info("%4s %s @ %s" % (order['side'], order['quantity'], order['price']))
-            while to_create:
-                to_create_bulk = []
-                while to_create and len(to_create_bulk) < 5:
-                    to_create_bulk.append(to_create.pop(0))
+            if logging.root.isEnabledFor(logging.INFO):
+                for order in reversed(to_create):
+                    logging.info("%4s %s @ %s" % (order['side'], instrument.format_qty(order['lots']), instrument.format_price(order['tick'])))
+            for i in range(0, len(to_create), 5):
+                to_create_bulk = to_create[i:i + 5]
                 if len(to_create_bulk) < 5:
                     for x in to_create_bulk:
                         create_task.append(self.binance_futures.create_orders(x))
@@ -103,10 +197,10 @@ class OrderManager:
         if cancel_first:
             response = await asyncio.gather(*cancel_task)
             logging.debug(response)
-            response = await asyncio.gather(*create_task)
+            response = await asyncio.gather(*(amend_task + create_task))
             logging.debug(response)
         else:
-            response = await asyncio.gather(*(cancel_task + create_task))
+            response = await asyncio.gather(*(cancel_task + amend_task + create_task))
             logging.debug(response)
 
     ###
@@ -131,40 +225,183 @@ class OrderManager:
     # Running
     ###
 
-    def check_file_change(self):
-        """Restart if any files we're watching have changed."""
-        for f, mtime in watched_files_mtimes:
-            if getmtime(f) > mtime:
-                self.restart()
+    def update_instruments(self, symbols_info):
+        """Apply symbol information refreshed in the background, if a tick or lot size changed."""
+        for manager in self.managers:
+            bot = manager.binance_futures
+            symbol_info = symbols_info.get(bot.symbol.upper())
+            if symbol_info is None:
+                continue
+            instrument = Instrument.from_symbol_info(symbol_info)
+            if (instrument.tick_size, instrument.step_size) != (bot.instrument.tick_size, bot.instrument.step_size):
+                logging.warning('Instrument changed. symbol=%s, tick_size=%s, step_size=%s'
+                                % (bot.symbol, instrument.tick_size, instrument.step_size))
+                manager.tick_size = instrument.tick_size
+                bot.set_instrument(instrument)
+
+    def reload(self, paths):
+        """Reload the changed WATCHED_FILES in this process. settings and other modules are re-executed in place; the
+           strategy's module is loaded afresh and its order manager class takes over every manager at the start of
+           its next place_orders cycle. Code that fails to load is logged and the running version kept."""
+        strategy = sys.modules[type(self).__module__]
+        strategy_path = os.path.abspath(strategy.__file__)
+        reload_strategy = False
+        for path in sorted(paths):
+            if path == strategy_path:
+                reload_strategy = True
+                continue
+            for module in list(sys.modules.values()):
+                if os.path.abspath(getattr(module, '__file__', None) or '') == path:
+                    try:
+                        importlib.reload(module)
+                        logging.info('Reloaded %s' % module.__name__)
+                    except Exception:
+                        logging.exception('Reloading %s failed.' % module.__name__)
+                    # The strategy may hold names from it.
+                    reload_strategy = True
+        if not reload_strategy:
+            return
+        # A strategy run as a script is __main__; load it under its import name.
+        name = strategy.__spec__.name if strategy.__spec__ is not None else \
+            os.path.splitext(os.path.basename(strategy_path))[0]
+        try:
+            new_class = getattr(load_module(name, strategy_path), type(self).__name__)
+            if not (isinstance(new_class, type) and issubclass(new_class, OrderManager)):
+                raise TypeError('%s is not an OrderManager' % type(self).__name__)
+        except Exception:
+            logging.exception('Reloading the strategy failed, keeping the running code.')
+            return
+        for manager in self.managers:
+            manager.next_class = new_class
+
+    async def run_event_driven(self):
+        """Call place_orders when the market changes, coalescing bursts of updates.
+           At most one place_orders runs at a time and consecutive calls are at least MIN_ORDER_INTERVAL apart."""
+        loop = asyncio.get_running_loop()
+        update_event = self.binance_futures.update_event
+        last_run = 0
+        while self.run:
+            try:
+                await asyncio.wait_for(update_event.wait(), settings.LOOP_INTERVAL)
+                heartbeat = False
+            except asyncio.TimeoutError:
+                heartbeat = True
+            delay = last_run + settings.MIN_ORDER_INTERVAL - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            update_event.clear()
+            if not self.material_change() and not heartbeat:
+                continue
+            last_run = loop.time()
+            await self.run_place_orders()
+
+    async def trade(self):
+        """Run place_orders for self.binance_futures until self.run is cleared."""
+        if settings.EVENT_DRIVEN:
+            await self.run_event_driven()
+        while self.run:
+            # sys.stdout.write("-----\n")
+            # sys.stdout.flush()
+
+            await asyncio.sleep(settings.LOOP_INTERVAL)
+            await self.run_place_orders()
 
     def run_loop(self):
         logging.basicConfig(level=settings.LOG_LEVEL)
         ioloop = asyncio.get_event_loop()
 
         try:
-            self.binance_futures = BinanceFutures(settings.API_KEY, settings.API_SECRET, settings.SYMBOL, settings.TESTNET, postOnly=settings.POST_ONLY)
             self.run = True
             self.tick_size = None
+            self.quote_state = None
+            self.managers = [self]
+            self.watcher = None
 
             async def start():
-                symbol_info = await self.binance_futures.get_symbol_info(settings.SYMBOL)
-                for x in symbol_info['filters']:
-                    if 'tickSize' in x:
-                        self.tick_size = float(x['tickSize'])
-                if self.tick_size is None:
-                    raise Exception('No symbol information.')
-                asyncio.create_task(self.binance_futures.connect())
-                while self.run:
-                    # sys.stdout.write("-----\n")
-                    # sys.stdout.flush()
-                    # self.check_file_change()
-
-                    await asyncio.sleep(settings.LOOP_INTERVAL)
-                    await self.place_orders()
+                symbols = settings.SYMBOLS or [settings.SYMBOL]
+                recorders = {}
+                if settings.RECORD_DIR:
+                    recorders = {symbol.lower(): Recorder(settings.RECORD_DIR, prefix=symbol.lower(),
+                                                          compress=settings.RECORD_COMPRESS,
+                                                          max_file_size=settings.RECORD_MAX_FILE_SIZE)
+                                 for symbol in symbols}
+                symbol_cache = None
+                if settings.SYMBOL_INFO_CACHE:
+                    symbol_cache = SymbolInfoCache(settings.SYMBOL_INFO_CACHE, settings.SYMBOL_INFO_TTL)
+                # The HTTP session and its connector must be created inside the running loop.
+                if settings.SHARED_FEED:
+                    # The book comes from the feed handler process (python -m tradingbot.sharedfeed).
+                    self.connection = SharedFeedBinanceFutures(settings.API_KEY, settings.API_SECRET, settings.SYMBOL,
+                                                               testnet=settings.TESTNET, postOnly=settings.POST_ONLY,
+                                                               orderIDPrefix=settings.ORDERID_PREFIX,
+                                                               order_transport=settings.ORDER_TRANSPORT,
+                                                               base_url=settings.BASE_URL, ws_api_url=settings.WS_API_URL,
+                                                               stream_url=settings.STREAM_URL,
+                                                               warm_reconnect=settings.WARM_RECONNECT,
+                                                               symbol_cache=symbol_cache,
+                                                               message_batch=settings.MESSAGE_BATCH,
+                                                               conflate_lag=settings.CONFLATE_LAG)
+                    bots = {settings.SYMBOL: self.connection}
+                elif settings.SYMBOLS:
+                    self.connection = MultiSymbolBinanceFutures(settings.API_KEY, settings.API_SECRET, settings.SYMBOLS, settings.TESTNET,
+                                                                postOnly=settings.POST_ONLY, order_transport=settings.ORDER_TRANSPORT,
+                                                                base_url=settings.BASE_URL, ws_api_url=settings.WS_API_URL,
+                                                                stream_url=settings.STREAM_URL, recorders=recorders,
+                                                                warm_reconnect=settings.WARM_RECONNECT,
+                                                                symbol_cache=symbol_cache,
+                                                                message_batch=settings.MESSAGE_BATCH,
+                                                                conflate_lag=settings.CONFLATE_LAG)
+                    bots = self.connection.bots
+                else:
+                    self.connection = BinanceFutures(settings.API_KEY, settings.API_SECRET, settings.SYMBOL, settings.TESTNET, postOnly=settings.POST_ONLY,
+                                                     order_transport=settings.ORDER_TRANSPORT, base_url=settings.BASE_URL,
+                                                     ws_api_url=settings.WS_API_URL, stream_url=settings.STREAM_URL,
+                                                     recorder=recorders.get(settings.SYMBOL.lower()),
+                                                     warm_reconnect=settings.WARM_RECONNECT,
+                                                     market_data_connections=settings.MARKET_DATA_CONNECTIONS,
+                                                     symbol_cache=symbol_cache, message_batch=settings.MESSAGE_BATCH,
+                                                     conflate_lag=settings.CONFLATE_LAG)
+                    bots = {settings.SYMBOL: self.connection}
+                if settings.METRICS_PORT:
+                    await metrics.serve(port=settings.METRICS_PORT)
+                if settings.METRICS_DUMP_INTERVAL:
+                    asyncio.create_task(metrics.dump_periodically(settings.METRICS_DUMP_INTERVAL))
+                # Open the REST connections while the symbol information is read and the streams are connected.
+                if settings.WARM_UP_CONNECTIONS > 0:
+                    asyncio.create_task(self.connection.warm_up(settings.WARM_UP_CONNECTIONS))
+                symbols_info = await self.connection.get_symbols_info(bots, self.update_instruments)
+                # One strategy instance per symbol; this one trades the first symbol.
+                self.managers = []
+                for symbol, bot in bots.items():
+                    manager = self if not self.managers else type(self)()
+                    manager.run = True
+                    manager.quote_state = None
+                    manager.binance_futures = bot
+                    symbol_info = symbols_info.get(symbol.upper())
+                    if symbol_info is None:
+                        raise Exception('No symbol information. symbol=%s' % symbol)
+                    instrument = Instrument.from_symbol_info(symbol_info)
+                    manager.tick_size = instrument.tick_size
+                    bot.set_instrument(instrument)
+                    self.managers.append(manager)
+                if settings.HOT_RELOAD:
+                    # Relative paths are relative to the package, whatever the working directory.
+                    package = os.path.dirname(os.path.abspath(settings.__file__))
+                    paths = [os.path.join(package, path) for path in settings.WATCHED_FILES]
+                    for path in paths:
+                        if not os.path.exists(path):
+                            logging.warning('Watched file does not exist: %s' % path)
+                    self.watcher = FileWatcher(paths, self.reload)
+                    self.watcher.start()
+                asyncio.create_task(self.connection.connect())
+                await asyncio.gather(*(manager.trade() for manager in self.managers))
 
             async def stop():
-                await self.binance_futures.close()
-                self.run = False
+                if self.watcher is not None:
+                    self.watcher.close()
+                await self.connection.close()
+                for manager in self.managers:
+                    manager.run = False
                 ioloop.stop()
 
             def signal_handler():
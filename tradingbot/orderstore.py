@@ -0,0 +1,143 @@
+import heapq
+
+ACTIVE_STATUSES = frozenset(['PENDING_NEW', 'NEW', 'PARTIALLY_FILLED'])
+
+# Order lifecycle stage; an update with the same updateTime is only taken if it moves the order along.
+STATUS_RANK = {'PENDING_NEW': 0, 'NEW': 1, 'PARTIALLY_FILLED': 2}
+
+# Status of an order that left the book while the user data stream was down: it was filled, canceled or expired, and
+# which one is unknown because its event was missed.
+CLOSED = 'CLOSED'
+
+
+class OrderStore:
+    """Orders keyed by clientOrderId with live indexes.
+
+    `active` holds the live orders (PENDING_NEW, NEW, PARTIALLY_FILLED) and is kept up to date on every update, as are
+    the per-side and per-price-tick indexes. Terminal orders are pushed onto an expiry heap and purged once they are
+    older than `expiry` seconds. The index dicts are shared; do not modify them.
+
+    Every order carries its price as an integer `tick`: given by the caller for the orders we create, otherwise parsed
+    from the price string once per update."""
+
+    def __init__(self, tick_size=None, expiry=300):
+        self.tick_size = tick_size
+        self.expiry = expiry
+        self.orders = {}
+        self.active = {}
+        self.active_by_side = {'BUY': {}, 'SELL': {}}
+        self.by_tick = {'BUY': {}, 'SELL': {}}
+        self.expiry_heap = []
+        self._keys = {}
+
+    def set_tick_size(self, tick_size):
+        self.tick_size = tick_size
+        for order in self.orders.values():
+            if 'price' in order:
+                order['tick'] = round(float(order['price']) / tick_size)
+        for client_order_id in list(self._keys):
+            order = self.orders[client_order_id]
+            self._unindex(client_order_id)
+            self._index(client_order_id, order)
+
+    def __contains__(self, client_order_id):
+        return client_order_id in self.orders
+
+    def __getitem__(self, client_order_id):
+        return self.orders[client_order_id]
+
+    def __len__(self):
+        return len(self.orders)
+
+    def __iter__(self):
+        return iter(self.orders)
+
+    def get(self, client_order_id, default=None):
+        return self.orders.get(client_order_id, default)
+
+    def items(self):
+        return self.orders.items()
+
+    def values(self):
+        return self.orders.values()
+
+    def orders_at(self, side, tick):
+        """Active orders on `side` resting at the price tick `tick`."""
+        return self.by_tick[side].get(tick, {})
+
+    def update(self, order):
+        """Insert an order, or merge it into the stored one if it is newer, or as old but further along, e.g. a fill
+           in the same millisecond as the acknowledgement. Returns the stored order."""
+        client_order_id = order['clientOrderId']
+        existing = self.orders.get(client_order_id)
+        if 'tick' not in order and 'price' in order and self.tick_size:
+            # Parse the price once per update, not at all if it is unchanged.
+            if existing is not None and existing.get('price') == order['price'] and 'tick' in existing:
+                order['tick'] = existing['tick']
+            else:
+                order['tick'] = round(float(order['price']) / self.tick_size)
+        if existing is None:
+            self.orders[client_order_id] = order
+            self._index(client_order_id, order)
+            return order
+        if 'updateTime' not in existing or existing['updateTime'] < order['updateTime'] or (
+                existing['updateTime'] == order['updateTime']
+                and STATUS_RANK.get(existing['status'], 3) < STATUS_RANK.get(order['status'], 3)):
+            self._unindex(client_order_id)
+            existing.update(order)
+            self._index(client_order_id, existing)
+        return existing
+
+    def remove(self, client_order_id):
+        self._unindex(client_order_id)
+        return self.orders.pop(client_order_id, None)
+
+    def purge(self, now):
+        """Remove terminal orders whose last update is older than `expiry` seconds before `now` (in ms)."""
+        limit = now - self.expiry * 1000
+        heap = self.expiry_heap
+        while heap and heap[0][0] < limit:
+            update_time, client_order_id = heapq.heappop(heap)
+            order = self.orders.get(client_order_id)
+            # Skip stale heap entries: the order was purged already, became active again or has a newer update.
+            if order is not None and client_order_id not in self.active and order.get('updateTime') == update_time:
+                del self.orders[client_order_id]
+
+    def clear(self):
+        self.orders.clear()
+        self.active.clear()
+        for side in ('BUY', 'SELL'):
+            self.active_by_side[side].clear()
+            self.by_tick[side].clear()
+        self.expiry_heap.clear()
+        self._keys.clear()
+
+    ###
+    # Internals
+    ###
+
+    def _index(self, client_order_id, order):
+        if order['status'] not in ACTIVE_STATUSES:
+            if 'updateTime' in order:
+                heapq.heappush(self.expiry_heap, (order['updateTime'], client_order_id))
+            return
+        side = order['side']
+        tick = order.get('tick')
+        self.active[client_order_id] = order
+        self.active_by_side[side][client_order_id] = order
+        if tick is not None:
+            self.by_tick[side].setdefault(tick, {})[client_order_id] = order
+        self._keys[client_order_id] = (side, tick)
+
+    def _unindex(self, client_order_id):
+        keys = self._keys.pop(client_order_id, None)
+        if keys is None:
+            return
+        side, tick = keys
+        del self.active[client_order_id]
+        del self.active_by_side[side][client_order_id]
+        if tick is not None:
+            level = self.by_tick[side][tick]
+            del level[client_order_id]
+            if not level:
+                del self.by_tick[side][tick]
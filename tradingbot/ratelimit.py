@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import time
+
+
+class TokenBucket:
+    """Token bucket refilled continuously over `interval` seconds up to `limit` tokens."""
+
+    def __init__(self, limit, interval):
+        self.limit = limit
+        self.interval = interval
+        self.rate = limit / interval
+        self.tokens = limit
+        self.stamp = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.limit, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def delay(self, cost, now):
+        """Seconds until `cost` tokens are available."""
+        self.refill(now)
+        if self.tokens >= cost:
+            return 0
+        return (cost - self.tokens) / self.rate
+
+    def consume(self, cost):
+        self.tokens -= cost
+
+    def sync(self, used, now):
+        """Align the bucket with the usage the exchange reports for the current window."""
+        self.refill(now)
+        self.tokens = min(self.tokens, self.limit - used)
+
+
+class RateLimiter:
+    """Client-side governor for the Binance Futures request weight and order count limits.
+
+    Requests acquire their weight and order count before they are sent, waiting asynchronously if a bucket is short,
+    and the buckets are re-aligned with the X-MBX-USED-WEIGHT-* and X-MBX-ORDER-COUNT-* response headers.
+    `safety` keeps a fraction of every limit in reserve for manual intervention and clock skew."""
+
+    # Response header -> bucket name
+    HEADERS = {
+        'X-MBX-USED-WEIGHT-1M': 'REQUEST_WEIGHT_1M',
+        'X-MBX-ORDER-COUNT-1M': 'ORDERS_1M',
+        'X-MBX-ORDER-COUNT-10S': 'ORDERS_10S',
+    }
+
+    # WebSocket API rateLimits entry (rateLimitType, interval, intervalNum) -> bucket name
+    RATE_LIMITS = {
+        ('REQUEST_WEIGHT', 'MINUTE', 1): 'REQUEST_WEIGHT_1M',
+        ('ORDERS', 'MINUTE', 1): 'ORDERS_1M',
+        ('ORDERS', 'SECOND', 10): 'ORDERS_10S',
+    }
+
+    def __init__(self, weight_limit=2400, order_limit_1m=1200, order_limit_10s=300, safety=0.9):
+        self.buckets = {
+            'REQUEST_WEIGHT_1M': TokenBucket(weight_limit * safety, 60),
+            'ORDERS_1M': TokenBucket(order_limit_1m * safety, 60),
+            'ORDERS_10S': TokenBucket(order_limit_10s * safety, 10),
+        }
+        self.blocked_until = 0
+        self.waits = 0
+
+    async def acquire(self, weight=1, orders=0):
+        """Wait until the request fits in every bucket, then consume its weight and order count."""
+        weight_bucket = self.buckets['REQUEST_WEIGHT_1M']
+        order_buckets = (self.buckets['ORDERS_1M'], self.buckets['ORDERS_10S'])
+        while True:
+            now = time.monotonic()
+            delay = max(self.blocked_until - now, weight_bucket.delay(weight, now))
+            if orders:
+                for bucket in order_buckets:
+                    delay = max(delay, bucket.delay(orders, now))
+            if delay <= 0:
+                break
+            self.waits += 1
+            logging.info('Rate limit governor: delaying request by %.3fs.' % delay)
+            await asyncio.sleep(delay)
+        weight_bucket.consume(weight)
+        if orders:
+            for bucket in order_buckets:
+                bucket.consume(orders)
+
+    def update(self, headers):
+        """Re-align the buckets with the usage reported in the response headers."""
+        now = time.monotonic()
+        for header, name in self.HEADERS.items():
+            used = headers.get(header)
+            if used is not None:
+                self.buckets[name].sync(int(used), now)
+
+    def update_rate_limits(self, rate_limits):
+        """Re-align the buckets with the `rateLimits` usage reported in WebSocket API responses."""
+        now = time.monotonic()
+        for rate_limit in rate_limits:
+            name = self.RATE_LIMITS.get((rate_limit['rateLimitType'], rate_limit['interval'], rate_limit['intervalNum']))
+            if name is not None:
+                self.buckets[name].sync(rate_limit['count'], now)
+
+    def block(self, seconds):
+        """Hold every request for `seconds`, e.g. after a 429 with Retry-After."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def headroom(self):
+        """Fraction of each limit currently available."""
+        now = time.monotonic()
+        headroom = {}
+        for name, bucket in self.buckets.items():
+            bucket.refill(now)
+            headroom[name] = max(bucket.tokens, 0) / bucket.limit
+        return headroom
@@ -0,0 +1,224 @@
+import logging
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+
+# Record kinds
+FRAME = 0  # raw combined-stream frame
+SNAPSHOT = 1  # REST depth snapshot
+
+# A file is a sequence of blocks: header (magic, codec, stored length, raw length) followed by the stored bytes.
+# A block's raw bytes are a sequence of records: header (kind, local receive time in ns, payload length) and payload.
+BLOCK_HEADER = struct.Struct('<4sBII')
+RECORD_HEADER = struct.Struct('<BqI')
+MAGIC = b'BFR1'
+RAW = 0
+ZLIB = 1
+
+
+def pack_block(raw, compress):
+    """The header and the stored bytes of a block of encoded records."""
+    if compress:
+        data = zlib.compress(raw, 1)
+        return BLOCK_HEADER.pack(MAGIC, ZLIB, len(data), len(raw)), data
+    return BLOCK_HEADER.pack(MAGIC, RAW, len(raw), len(raw)), raw
+
+
+class Recorder:
+    """Append-only market data recorder.
+
+    `record` only timestamps the payload and appends it to an in-memory batch, taken by a writer thread that encodes
+    the records, compresses them in blocks and writes them to files rotated by size. The live path therefore never
+    touches the disk or the compressor. The writer is woken once `batch_size` records or `flush_interval` seconds have
+    accumulated, and takes the batch every `flush_interval` seconds in any case, so a quiet stream still reaches the
+    disk."""
+
+    def __init__(self, directory, prefix='md', compress=True, block_size=1 << 20, max_file_size=1 << 30,
+                 batch_size=1024, flush_interval=1.0):
+        self.directory = directory
+        self.prefix = prefix
+        self.compress = compress
+        self.block_size = block_size
+        self.max_file_size = max_file_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.flush_interval_ns = int(flush_interval * 1e9)
+        # Appended to by the recording thread and drained from the left by the writer thread only; both are atomic.
+        self.batch = deque()
+        self.last_flush = time.time_ns()
+        self.queue = queue.SimpleQueue()
+        self.file = None
+        os.makedirs(directory, exist_ok=True)
+        self.thread = threading.Thread(target=self.__write_loop, name='recorder', daemon=True)
+        self.thread.start()
+
+    def record(self, kind, payload, timestamp=None):
+        """Record a str or bytes payload with its local receive time in ns."""
+        if timestamp is None:
+            timestamp = time.time_ns()
+        batch = self.batch
+        batch.append((kind, timestamp, payload))
+        if len(batch) >= self.batch_size or timestamp - self.last_flush >= self.flush_interval_ns:
+            self.flush(timestamp)
+
+    def flush(self, now=None):
+        """Wake the writer thread to take the current batch."""
+        if self.batch:
+            self.queue.put(True)
+        self.last_flush = now if now is not None else time.time_ns()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    ###
+    # Writer thread
+    ###
+
+    def __open(self):
+        if self.file is not None:
+            self.file.close()
+        path = os.path.join(self.directory, '%s-%s.bfr' % (self.prefix, time.strftime('%Y%m%d-%H%M%S')))
+        # Several rotations within a second get a numeric suffix.
+        i = 0
+        while os.path.exists(path):
+            i += 1
+            path = os.path.join(self.directory, '%s-%s-%d.bfr' % (self.prefix, time.strftime('%Y%m%d-%H%M%S'), i))
+        self.file = open(path, 'ab')
+        self.file_size = 0
+        logging.info('Recording market data to %s' % path)
+
+    def __write_block(self, block):
+        if self.file is None or self.file_size >= self.max_file_size:
+            self.__open()
+        header, data = pack_block(bytes(block), self.compress)
+        self.file.write(header)
+        self.file.write(data)
+        self.file.flush()
+        self.file_size += len(header) + len(data)
+
+    def __write_loop(self):
+        batch = self.batch
+        block = bytearray()
+        pack = RECORD_HEADER.pack
+        while True:
+            try:
+                stop = self.queue.get(timeout=self.flush_interval) is None
+            except queue.Empty:
+                # Nothing woke us within the flush interval; take what has been recorded anyway.
+                stop = False
+            for _ in range(len(batch)):
+                kind, timestamp, payload = batch.popleft()
+                if isinstance(payload, str):
+                    payload = payload.encode('utf-8')
+                block += pack(kind, timestamp, len(payload))
+                block += payload
+                if len(block) >= self.block_size:
+                    self.__write_block(block)
+                    block = bytearray()
+            # Write out the partial block once the backlog is drained so that the files stay close to real time.
+            if block and (stop or self.queue.empty()):
+                self.__write_block(block)
+                block = bytearray()
+            if stop:
+                break
+        if self.file is not None:
+            self.file.close()
+
+
+class RecordReader:
+    """Memory-mapped reader for recorder files.
+
+    Iterating yields (kind, timestamp in ns, payload) with the payload as a memoryview; for uncompressed files the
+    views point straight into the mapping. A truncated trailing block, e.g. from a crash, is ignored."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+    def close(self):
+        if self.mm is not None:
+            try:
+                self.mm.close()
+            except BufferError:
+                # Payload views are still referenced; the mapping goes away once they are released.
+                pass
+            self.mm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def blocks(self):
+        """Yield the raw bytes of each block as a memoryview."""
+        if self.mm is None:
+            return
+        view = memoryview(self.mm)
+        offset = 0
+        size = len(view)
+        while offset + BLOCK_HEADER.size <= size:
+            magic, codec, stored, raw = BLOCK_HEADER.unpack_from(view, offset)
+            if magic != MAGIC:
+                raise ValueError('Bad block at offset %d in %s' % (offset, self.path))
+            start = offset + BLOCK_HEADER.size
+            if start + stored > size:
+                break
+            data = view[start:start + stored]
+            yield data if codec == RAW else memoryview(zlib.decompress(data))
+            offset = start + stored
+
+    def __iter__(self):
+        unpack = RECORD_HEADER.unpack_from
+        header_size = RECORD_HEADER.size
+        for block in self.blocks():
+            offset = 0
+            size = len(block)
+            while offset < size:
+                kind, timestamp, length = unpack(block, offset)
+                offset += header_size
+                yield kind, timestamp, block[offset:offset + length]
+                offset += length
+
+
+def recorded_files(directory, prefix='md'):
+    """The recorder files of `prefix` in `directory`, oldest first."""
+    paths = [os.path.join(directory, name) for name in os.listdir(directory)
+             if name.startswith(prefix + '-') and name.endswith('.bfr')]
+    return sorted(paths, key=os.path.getmtime)
+
+
+def read_records(paths):
+    """Iterate over the records of several files in order."""
+    for path in paths:
+        with RecordReader(path) as reader:
+            yield from reader
+
+
+def write_records(records, path, compress=False, block_size=1 << 20):
+    """Write (kind, timestamp, payload) records to a single file, e.g. to unpack a recording for repeated replays.
+       Returns the number of records written."""
+    pack = RECORD_HEADER.pack
+    block = bytearray()
+    count = 0
+    with open(path, 'wb') as f:
+        for kind, timestamp, payload in records:
+            if isinstance(payload, str):
+                payload = payload.encode('utf-8')
+            block += pack(kind, timestamp, len(payload))
+            block += payload
+            count += 1
+            if len(block) >= block_size:
+                f.write(b''.join(pack_block(bytes(block), compress)))
+                block = bytearray()
+        if block:
+            f.write(b''.join(pack_block(bytes(block), compress)))
+    return count
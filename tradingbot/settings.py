@@ -11,6 +11,15 @@ TESTNET = True
 API_KEY = ""
 API_SECRET = ""
 
+# Endpoint overrides, e.g. to run against the local mock exchange (python -m tradingbot.mockexchange):
+#   BASE_URL = 'http://127.0.0.1:8080/fapi'
+#   STREAM_URL = 'ws://127.0.0.1:8080/stream'
+#   WS_API_URL = 'ws://127.0.0.1:8080/ws-fapi/v1'
+# None uses the testnet or production endpoints according to TESTNET.
+BASE_URL = None
+STREAM_URL = None
+WS_API_URL = None
+
 
 ########################################################################################################################
 # Target
@@ -19,6 +28,17 @@ API_SECRET = ""
 # Instrument to trade on Binance Futures.
 SYMBOL = "btcusdt"
 
+# Instruments to trade at once, e.g. ["btcusdt", "ethusdt", "solusdt"]. They share one market data and user data
+# stream connection, one REST session and one rate limit budget, and each gets its own instance of the strategy.
+# None trades SYMBOL alone.
+SYMBOLS = None
+
+# Market data fan-out to several strategy processes. The feed handler (python -m tradingbot.sharedfeed) maintains the
+# books of SYMBOL, or of SYMBOLS, and publishes them into shared memory. With SHARED_FEED = True a strategy process
+# trades SYMBOL with the book read from there instead of opening its own market data stream; it only opens a user data
+# stream for its orders and position. Strategy processes trading the same symbol need distinct ORDERID_PREFIXes.
+SHARED_FEED = False
+
 
 ########################################################################################################################
 # Order Size & Spread
@@ -36,6 +56,11 @@ SYMBOL = "btcusdt"
 # 0.01 == 1%
 RELIST_INTERVAL = 0.0
 
+# If True, converge_orders modifies an order that is no longer wanted into a new order on the same side (PUT
+# /fapi/v1/order or /fapi/v1/batchOrders) instead of cancelling it and creating another one. This halves the requests
+# and request weight of a requote.
+AMEND_ORDERS = False
+
 
 ########################################################################################################################
 # Trading Behavior
@@ -58,6 +83,10 @@ POST_ONLY = True
 # Misc Behavior, Technicals
 ########################################################################################################################
 
+# Transport for order entry: 'rest' sends every order action as a signed HTTPS request, 'ws' sends them over a
+# persistent, signed WebSocket API connection. cancel_all_orders always uses REST.
+ORDER_TRANSPORT = 'rest'
+
 # If true, don't set up any orders, just say what we would do
 # DRY_RUN = True
 DRY_RUN = False
@@ -65,14 +94,64 @@ DRY_RUN = False
 # How often to re-check and replace orders.
 LOOP_INTERVAL = 5
 
+# If True, book, trade, order and position updates wake the strategy instead of polling every LOOP_INTERVAL.
+# Bursts of updates are coalesced into a single place_orders call, which runs only if the strategy's material_change()
+# reports a relevant change. LOOP_INTERVAL then acts as a heartbeat: orders are re-checked at least that often.
+EVENT_DRIVEN = False
+
+# Minimum time in seconds between two place_orders calls in event-driven mode.
+MIN_ORDER_INTERVAL = 0.1
+
 # Wait times between orders / errors
 API_REST_INTERVAL = 1
 API_ERROR_INTERVAL = 10
 TIMEOUT = 7
 
+# Number of keep-alive REST connections to open at startup so that the first orders don't pay for the TLS handshake.
+# Set to 0 to disable.
+WARM_UP_CONNECTIONS = 2
+
+# File caching the symbol information of exchangeInfo (tick size, lot size and other filters), so a restart does not
+# wait for its download, e.g. "/var/cache/tradingbot/exchangeInfo.json". Information older than SYMBOL_INFO_TTL
+# seconds is used all the same and refreshed in the background. None, the default, downloads it at every start.
+SYMBOL_INFO_CACHE = None
+SYMBOL_INFO_TTL = 3600
+
+# What to do when the stream connection drops. By default the bot restarts cold: all orders of the symbol are
+# cancelled, and the book and position are rebuilt from scratch. With WARM_RECONNECT it reconnects over the same HTTP
+# session, keeps the listen key, leaves its orders resting and reconciles them with one open orders snapshot, and
+# resumes the book from a depth snapshot plus the buffered updates.
+WARM_RECONNECT = False
+
+# Number of connections to receive the market data of SYMBOL over. With more than one, each depth update and trade is
+# taken from whichever connection delivers it first, so a slow or dead connection costs nothing as long as another one
+# is up. Lead/lag statistics per connection are in the metrics as <symbol>.md.link<n>.*.
+MARKET_DATA_CONNECTIONS = 1
+
+# With MESSAGE_BATCH > 0, stream frames are only timestamped and queued as they are read, and handled by another task up
+# to MESSAGE_BATCH at a time, so a slow handler does not hold up the socket. Off (0) by default: every frame is handled
+# as it is read. The queue's depth and lag are in the metrics as <symbol>.stream.queue.* (stream.queue.* with SYMBOLS).
+MESSAGE_BATCH = 0
+# Once the oldest queued frame has waited longer than CONFLATE_LAG seconds, the backlog is conflated: consecutive depth
+# updates are merged per price level and only the last trade of each symbol is kept. None never conflates.
+CONFLATE_LAG = None
+
 # Available levels: logging.(DEBUG|INFO|WARN|ERROR)
 LOG_LEVEL = logging.INFO
 
+# Latency and throughput metrics: market data receive lag and processing time, place_orders cycle time, REST/WS API
+# round trips per endpoint and tick-to-order time. They are served as JSON on http://127.0.0.1:METRICS_PORT/metrics
+# and/or logged every METRICS_DUMP_INTERVAL seconds. None disables either; both are off by default.
+METRICS_PORT = None
+METRICS_DUMP_INTERVAL = None
+
+# Directory to record the raw market data stream and the depth snapshots to, with local receive timestamps, for replay
+# and backtesting. Files are compressed in blocks unless RECORD_COMPRESS is False and are rotated every
+# RECORD_MAX_FILE_SIZE bytes. None disables recording.
+RECORD_DIR = None
+RECORD_COMPRESS = True
+RECORD_MAX_FILE_SIZE = 1 << 30
+
 # To uniquely identify orders placed by this bot, the bot sends a ClOrdID (Client order ID) that is attached
 # to each order so its source can be identified. This keeps the market maker from cancelling orders that are
 # manually placed, or orders placed by another bot.
@@ -82,5 +161,11 @@ LOG_LEVEL = logging.INFO
 # Max length is 13 characters.
 ORDERID_PREFIX = "bot_bf_"
 
-# If any of these files (and this file) changes, reload the bot.
-WATCHED_FILES = [join('tradingbot', 'custom_strategy.py'), join('tradingbot', 'settings.py')]
+# If any of these files changes, reload it in the running bot. settings.py is re-executed in place, the strategy's
+# module is loaded afresh and its order manager class replaces the running one between two place_orders cycles; the
+# connection, the book, the orders and the position are kept. Settings only read at startup, such as the endpoints
+# and the symbols, keep their values. A file that fails to load is logged and the running code kept.
+# Off by default: a live process should not change its code when a file is saved. Paths are relative to the tradingbot
+# package directory.
+HOT_RELOAD = False
+WATCHED_FILES = ['custom_strategy.py', 'settings.py']
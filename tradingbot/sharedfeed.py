@@ -0,0 +1,497 @@
+"""Shared-memory market data feed for running strategies in several processes.
+
+A feed handler process maintains the books and publishes each one into a shared memory block; strategy processes map
+the block and read the book in place, so strategy CPU spreads over cores without each process opening a market data
+stream.
+
+Layout of a block: an int64 header, a float64 header, then the bid and ask quantities of a window of `capacity` ticks
+starting at the header's origin tick, like the arrays of an OrderBook. Every publication increments the sequence
+number before and after writing (a seqlock): an odd number means a write is in progress, and a read is consistent if
+the number was even and unchanged across it. There is a single writer per block.
+
+Usage:
+    python -m tradingbot.sharedfeed      # feed handler for settings.SYMBOL or settings.SYMBOLS
+    SHARED_FEED = True                   # in the settings of each strategy process
+"""
+import asyncio
+import logging
+import os
+import signal
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from tradingbot import settings
+from tradingbot.binancefutures import LIVE, SYNCING, BinanceFutures
+from tradingbot.features import Band, BookFeatures
+from tradingbot.instrument import Instrument
+from tradingbot.multisymbol import MultiSymbolBinanceFutures
+from tradingbot.orderbook import OrderBook
+from tradingbot.symbolcache import SymbolInfoCache
+
+# int64 header
+SEQ = 0
+ORIGIN = 1
+BEST_BID = 2  # index into the bid array, -1 if there is no bid
+BEST_ASK = 3  # index into the ask array, capacity if there is no ask
+BID_LEVELS = 4
+ASK_LEVELS = 5
+UPDATE_ID = 6  # u of the last depth update applied
+STATE = 7  # 1 if the book is LIVE
+UPDATE_TIME = 8  # time.time_ns() of the last book change
+CAPACITY = 9
+INT_FIELDS = 16
+
+# float64 header
+TICK_SIZE = 0
+LAST_PRICE = 1
+LAST_QTY = 2
+FLOAT_FIELDS = 8
+
+HEADER_SIZE = 8 * (INT_FIELDS + FLOAT_FIELDS)
+
+
+def feed_name(symbol):
+    """Name of the shared memory block of a symbol."""
+    return 'tradingbot-%s' % symbol.lower()
+
+
+def tracker_name(shm):
+    """The name the resource tracker knows a block by: POSIX shared memory names carry a leading slash, which
+       SharedMemory.name leaves out."""
+    return shm.name if os.name == 'nt' else '/' + shm.name
+
+
+class StaleFeedError(Exception):
+    """The feed handler stopped in the middle of a publication, so no consistent read is possible."""
+
+
+def map_arrays(buf, capacity):
+    ints = np.ndarray(INT_FIELDS, np.int64, buf, 0)
+    floats = np.ndarray(FLOAT_FIELDS, np.float64, buf, 8 * INT_FIELDS)
+    bid_qty = np.ndarray(capacity, np.float64, buf, HEADER_SIZE)
+    ask_qty = np.ndarray(capacity, np.float64, buf, HEADER_SIZE + 8 * capacity)
+    return ints, floats, bid_qty, ask_qty
+
+
+class SharedBookWriter:
+    """Publishes the book, last trade and sync state of a BinanceFutures instance into shared memory.
+
+    After the initial copy only the levels of each depth update are written. The window is recentred, with a full
+    copy, when the best bid or ask leaves its middle half, and the book is copied again after every resync."""
+
+    def __init__(self, symbol, tick_size, capacity=1 << 16, name=None):
+        self.name = name if name is not None else feed_name(symbol)
+        self.capacity = capacity
+        size = HEADER_SIZE + 16 * capacity
+        try:
+            self.shm = SharedMemory(self.name, create=True, size=size)
+        except FileExistsError:
+            # Left over by a feed handler that did not exit cleanly.
+            stale = SharedMemory(self.name)
+            stale.close()
+            stale.unlink()
+            self.shm = SharedMemory(self.name, create=True, size=size)
+        self.ints, self.floats, self.bid_qty, self.ask_qty = map_arrays(self.shm.buf, capacity)
+        self.ints[:] = 0
+        self.ints[BEST_BID] = -1
+        self.ints[BEST_ASK] = capacity
+        self.ints[CAPACITY] = capacity
+        self.floats[:] = 0
+        self.floats[TICK_SIZE] = tick_size
+        self.origin = 0
+        self.synced = False
+        self.bot = None
+
+    def attach(self, bot):
+        """Publish after the bot's depth update and trade handlers."""
+        self.bot = bot
+        on_depth_update = bot.handlers['depthUpdate']
+        on_trade = bot.handlers['trade']
+
+        def depth_update(data):
+            on_depth_update(data)
+            self.on_depth_update(data)
+
+        def trade(data):
+            on_trade(data)
+            self.on_trade(data)
+
+        bot.handlers['depthUpdate'] = depth_update
+        bot.handlers['trade'] = bot.handlers['aggTrade'] = trade
+
+    def close(self):
+        del self.ints, self.floats, self.bid_qty, self.ask_qty
+        self.shm.close()
+        self.shm.unlink()
+
+    def on_depth_update(self, data):
+        bot = self.bot
+        book = bot.depth
+        ints = self.ints
+        ints[SEQ] += 1
+        if bot.book_state != LIVE:
+            ints[STATE] = 0
+            self.synced = False
+        else:
+            if not self.synced or not self.__in_window(book):
+                self.__copy(book)
+                self.synced = True
+            else:
+                # A LIVE book after the handler means the update was applied.
+                origin = self.origin
+                capacity = self.capacity
+                bid_qty = self.bid_qty
+                ask_qty = self.ask_qty
+                for tick, qty in data['b']:
+                    i = tick - origin
+                    if 0 <= i < capacity:
+                        bid_qty[i] = qty
+                for tick, qty in data['a']:
+                    i = tick - origin
+                    if 0 <= i < capacity:
+                        ask_qty[i] = qty
+            best_bid = book.best_bid_tick
+            best_ask = book.best_ask_tick
+            ints[BEST_BID] = best_bid - self.origin if best_bid is not None else -1
+            ints[BEST_ASK] = best_ask - self.origin if best_ask is not None else self.capacity
+            ints[BID_LEVELS] = book.bid_levels
+            ints[ASK_LEVELS] = book.ask_levels
+            ints[UPDATE_ID] = bot.prev_u
+            ints[STATE] = 1
+        ints[UPDATE_TIME] = time.time_ns()
+        ints[SEQ] += 1
+
+    def on_trade(self, data):
+        ints = self.ints
+        ints[SEQ] += 1
+        self.floats[LAST_PRICE] = float(data['p'])
+        self.floats[LAST_QTY] = float(data['q'])
+        ints[SEQ] += 1
+
+    def __in_window(self, book):
+        low = self.origin + self.capacity // 4
+        high = self.origin + 3 * self.capacity // 4
+        for tick in (book.best_bid_tick, book.best_ask_tick):
+            if tick is not None and not low <= tick < high:
+                return False
+        return True
+
+    def __copy(self, book):
+        """Copy the book's levels within a window centred on its best prices."""
+        ticks = [tick for tick in (book.best_bid_tick, book.best_ask_tick) if tick is not None]
+        if ticks:
+            centre = sum(ticks) // len(ticks)
+        else:
+            centre = book.origin + len(book.bid_qty) // 2 if book.origin is not None else 0
+        self.origin = centre - self.capacity // 2
+        self.ints[ORIGIN] = self.origin
+        self.bid_qty[:] = 0
+        self.ask_qty[:] = 0
+        if book.origin is None:
+            return
+        start = max(self.origin, book.origin)
+        end = min(self.origin + self.capacity, book.origin + len(book.bid_qty))
+        if start < end:
+            self.bid_qty[start - self.origin:end - self.origin] = book.bid_qty[start - book.origin:end - book.origin]
+            self.ask_qty[start - self.origin:end - self.origin] = book.ask_qty[start - book.origin:end - book.origin]
+
+
+class SharedOrderBook(OrderBook):
+    """Read-only OrderBook over the arrays of a shared memory block; its top of book is loaded by
+       SharedBookReader.refresh. The quantities change under it, so every read of them goes through the reader's
+       seqlock (SharedBookReader.read) and returns a copy."""
+
+    def __init__(self, tick_size, bid_qty, ask_qty):
+        self.reader = None
+        self.tick_size = tick_size
+        self.capacity = len(bid_qty)
+        self.features = None
+        self.bid_qty = bid_qty
+        self.ask_qty = ask_qty
+        self.origin = None
+        self.bid_levels = 0
+        self.ask_levels = 0
+        self._best_bid = -1
+        self._best_ask = self.capacity
+
+    def set_tick_size(self, tick_size):
+        self.tick_size = tick_size
+
+    def clear(self):
+        # The book is maintained by the feed handler process.
+        pass
+
+    @property
+    def best_bid_qty(self):
+        return self.reader.read(OrderBook.best_bid_qty.fget)
+
+    @property
+    def best_ask_qty(self):
+        return self.reader.read(OrderBook.best_ask_qty.fget)
+
+    def bid_depth(self, n):
+        return self.reader.read(lambda book: OrderBook.bid_depth(book, n).copy())
+
+    def ask_depth(self, n):
+        return self.reader.read(lambda book: OrderBook.ask_depth(book, n).copy())
+
+    def bids(self, n=None):
+        return self.reader.read(lambda book: OrderBook.bids(book, n))
+
+    def asks(self, n=None):
+        return self.reader.read(lambda book: OrderBook.asks(book, n))
+
+
+class SharedBookFeatures(BookFeatures):
+    """BookFeatures over a SharedOrderBook. The book changes in another process, so bands are summed on every read
+       instead of being maintained from the level deltas, each feature within one consistent read."""
+
+    def band_volume(self, depth):
+        def volume(book):
+            band = Band(depth)
+            self._move_band(band)
+            return band.bid_volume, band.ask_volume
+        return self.book.reader.read(volume)
+
+    @property
+    def imbalance(self):
+        return self.book.reader.read(lambda book: BookFeatures.imbalance.fget(self))
+
+    @property
+    def microprice(self):
+        return self.book.reader.read(lambda book: BookFeatures.microprice.fget(self))
+
+
+class SharedBookReader:
+    """Maps the shared memory block of a symbol and reads it in place.
+
+    A publication that stays in progress for longer than `stall_timeout` seconds means the feed handler died in the
+    middle of it: the feed is then stale, its state SYNCING, until the sequence number moves again."""
+
+    def __init__(self, name, stall_timeout=0.1):
+        self.shm = SharedMemory(name)
+        # Only the writer owns the block; keep the resource tracker from unlinking it when this process exits.
+        resource_tracker.unregister(tracker_name(self.shm), 'shared_memory')
+        capacity = int(np.ndarray(INT_FIELDS, np.int64, self.shm.buf, 0)[CAPACITY])
+        self.ints, self.floats, bid_qty, ask_qty = map_arrays(self.shm.buf, capacity)
+        self.book = SharedOrderBook(float(self.floats[TICK_SIZE]), bid_qty, ask_qty)
+        self.book.reader = self
+        self.features = SharedBookFeatures(self.book)
+        self.stall_timeout = stall_timeout
+        self.stalled = None
+        self.reading = False
+        self.version = None
+        self.state = SYNCING
+        self.update_id = None
+        self.update_time = 0
+        self.last_price = 0.0
+        self.last_qty = 0.0
+
+    def sequence(self):
+        return int(self.ints[SEQ])
+
+    def refresh(self):
+        """Load a consistent copy of the header into `book` and this reader; returns its version, or None if the feed
+           is stale."""
+        ints = self.ints
+        deadline = None
+        while True:
+            version = int(ints[SEQ])
+            if version & 1:
+                if version == self.stalled:
+                    return None
+                # The writer is in the middle of a publication; let it finish, for a while.
+                now = time.perf_counter()
+                if deadline is None:
+                    deadline = now + self.stall_timeout
+                elif now > deadline:
+                    logging.error('The feed handler stalled in the middle of a publication. seq=%d' % version)
+                    self.stalled = version
+                    self.state = SYNCING
+                    return None
+                time.sleep(0)
+                continue
+            header = ints.copy()
+            floats = self.floats.copy()
+            if int(ints[SEQ]) == version:
+                break
+        self.stalled = None
+        book = self.book
+        book.origin = int(header[ORIGIN])
+        book._best_bid = int(header[BEST_BID])
+        book._best_ask = int(header[BEST_ASK])
+        book.bid_levels = int(header[BID_LEVELS])
+        book.ask_levels = int(header[ASK_LEVELS])
+        book.tick_size = float(floats[TICK_SIZE])
+        self.state = LIVE if header[STATE] else SYNCING
+        self.update_id = int(header[UPDATE_ID])
+        self.update_time = int(header[UPDATE_TIME])
+        self.last_price = float(floats[LAST_PRICE])
+        self.last_qty = float(floats[LAST_QTY])
+        self.version = version
+        return version
+
+    def read(self, fn):
+        """Returns fn(book) computed on the zero-copy arrays, retried until no publication overlapped it; raises
+           StaleFeedError if the feed is stale. `fn` may run more than once and must not have side effects. A read
+           nested in another one runs as part of it."""
+        if self.reading:
+            return fn(self.book)
+        self.reading = True
+        try:
+            while True:
+                version = self.refresh()
+                if version is None:
+                    raise StaleFeedError('The feed handler stalled. seq=%d' % self.stalled)
+                try:
+                    result = fn(self.book)
+                except Exception:
+                    # A torn read may fail; only an error on a consistent one is real.
+                    if int(self.ints[SEQ]) == version:
+                        raise
+                    continue
+                if int(self.ints[SEQ]) == version:
+                    return result
+        finally:
+            self.reading = False
+
+    def close(self):
+        self.book.bid_qty = self.book.ask_qty = None
+        del self.ints, self.floats
+        self.shm.close()
+
+
+class SharedFeedBinanceFutures(BinanceFutures):
+    """BinanceFutures for a strategy process: the book and the last trade come from the feed handler's shared memory,
+       the orders and the position from this process's own user data stream.
+
+    The header is reloaded whenever the feed publishes, polled every `poll_interval` seconds, and a change sets
+    update_event as the stream handlers would. Several strategy processes may trade the same symbol, so only the orders
+    carrying this bot's orderIDPrefix are tracked, and connect and close only cancel those."""
+
+    def __init__(self, api_key, api_secret, symbol='btcusdt', feed=None, poll_interval=0.001, **kwargs):
+        super().__init__(api_key, api_secret, symbol, market_data=False, **kwargs)
+        self.feed = SharedBookReader(feed if feed is not None else feed_name(symbol))
+        self.depth = self.feed.book
+        self.features = self.feed.features
+        self.poll_interval = poll_interval
+        self.follower = None
+        self.feed_version = None
+        self.__refresh()
+        # The user data stream carries the orders of every process trading the account; track only this bot's.
+        on_order_trade_update = self.handlers['ORDER_TRADE_UPDATE']
+
+        def order_trade_update(data):
+            if data['o']['c'].startswith(self.orderIDPrefix):
+                on_order_trade_update(data)
+
+        self.handlers['ORDER_TRADE_UPDATE'] = order_trade_update
+
+    def set_instrument(self, instrument):
+        # The book is the feed's; leave it alone.
+        self.instrument = instrument
+        self.open_orders_ws.set_tick_size(instrument.tick_size)
+
+    def __refresh(self):
+        feed = self.feed
+        version = feed.refresh()
+        # The reads of the strategy refresh the feed too; follow the sequence number this instance last saw.
+        self.feed_version = version if version is not None else feed.sequence()
+        self.book_state = feed.state
+        self.prev_u = feed.update_id
+        self.last_price = feed.last_price
+        self.last_qty = feed.last_qty
+        # The feed's wall clock time of the change, as a local perf_counter time for the tick-to-order latency.
+        self.last_update_time = time.perf_counter() - max(time.time_ns() - feed.update_time, 0) / 1e9
+
+    async def __follow(self):
+        while not self.closed:
+            if self.feed.sequence() != self.feed_version:
+                self.__refresh()
+                self.update_event.set()
+            await asyncio.sleep(self.poll_interval)
+
+    async def connect(self):
+        if self.follower is None:
+            self.follower = asyncio.create_task(self.__follow())
+        await super().connect()
+
+    async def cancel_all_orders(self):
+        """Cancel this bot's open orders of the symbol, leaving those of other processes."""
+        orders = await self.open_orders()
+        client_order_ids = [order['clientOrderId'] for order in orders
+                            if order['symbol'].upper() == self.symbol.upper()
+                            and order['clientOrderId'].startswith(self.orderIDPrefix)]
+        resp = []
+        for i in range(0, len(client_order_ids), 10):
+            resp += await self.cancel_bulk_orders(client_order_ids[i:i + 10])
+        return resp
+
+    async def close(self):
+        await super().close()
+        if self.follower is not None:
+            await self.follower
+        self.feed.close()
+
+
+###
+# Feed handler process
+###
+
+def run_feed():
+    logging.basicConfig(level=settings.LOG_LEVEL)
+    symbols = [symbol.lower() for symbol in (settings.SYMBOLS or [settings.SYMBOL])]
+
+    async def start():
+        # Market data only: the feed handler neither opens a user data stream nor touches the orders.
+        symbol_cache = None
+        if settings.SYMBOL_INFO_CACHE:
+            symbol_cache = SymbolInfoCache(settings.SYMBOL_INFO_CACHE, settings.SYMBOL_INFO_TTL)
+        if settings.SYMBOLS:
+            connection = MultiSymbolBinanceFutures(settings.API_KEY, settings.API_SECRET, symbols, settings.TESTNET,
+                                                   base_url=settings.BASE_URL, stream_url=settings.STREAM_URL,
+                                                   user_data=False, warm_reconnect=settings.WARM_RECONNECT,
+                                                   symbol_cache=symbol_cache, message_batch=settings.MESSAGE_BATCH,
+                                                   conflate_lag=settings.CONFLATE_LAG)
+            bots = connection.bots
+        else:
+            connection = BinanceFutures(settings.API_KEY, settings.API_SECRET, symbols[0], settings.TESTNET,
+                                        base_url=settings.BASE_URL, stream_url=settings.STREAM_URL, user_data=False,
+                                        warm_reconnect=settings.WARM_RECONNECT,
+                                        market_data_connections=settings.MARKET_DATA_CONNECTIONS,
+                                        symbol_cache=symbol_cache, message_batch=settings.MESSAGE_BATCH,
+                                        conflate_lag=settings.CONFLATE_LAG)
+            bots = {symbols[0]: connection}
+        symbols_info = await connection.get_symbols_info(bots)
+        writers = []
+        for symbol, bot in bots.items():
+            symbol_info = symbols_info.get(symbol.upper())
+            if symbol_info is None:
+                raise Exception('No symbol information. symbol=%s' % symbol)
+            instrument = Instrument.from_symbol_info(symbol_info)
+            bot.set_instrument(instrument)
+            writer = SharedBookWriter(symbol, instrument.tick_size)
+            writer.attach(bot)
+            writers.append(writer)
+            logging.info('Publishing %s to shared memory %s' % (symbol, writer.name))
+        stopped = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, stopped.set)
+        loop.add_signal_handler(signal.SIGINT, stopped.set)
+        task = asyncio.create_task(connection.connect())
+        try:
+            await stopped.wait()
+        finally:
+            await connection.close()
+            await task
+            for writer in writers:
+                writer.close()
+
+    asyncio.run(start())
+
+
+if __name__ == '__main__':
+    run_feed()
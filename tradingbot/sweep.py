@@ -0,0 +1,189 @@
+import argparse
+import asyncio
+import csv
+import itertools
+import logging
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from tradingbot import settings
+from tradingbot.backtest import Backtest, ConstantLatency, ProbQueueModel, RiskAverseQueueModel, load_manager_class
+from tradingbot.recorder import read_records, recorded_files, write_records
+
+# Columns of the ranked table after the parameters
+COLUMNS = ['pnl', 'fees', 'fills', 'volume', 'max_drawdown', 'max_position', 'final_position', 'speedup']
+
+
+def grid(space):
+    """Every combination of the values listed in `space`, a dict of parameter name -> list of values."""
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def random_search(space, n, seed=None):
+    """`n` random parameter sets. A list in `space` is sampled from, a (low, high) tuple uniformly; with int bounds
+       the draw is an int."""
+    rng = random.Random(seed)
+    param_sets = []
+    for _ in range(n):
+        params = {}
+        for name, values in space.items():
+            if isinstance(values, tuple):
+                low, high = values
+                if isinstance(low, int) and isinstance(high, int):
+                    params[name] = rng.randint(low, high)
+                else:
+                    params[name] = rng.uniform(low, high)
+            else:
+                params[name] = rng.choice(values)
+        param_sets.append(params)
+    return param_sets
+
+
+def run_backtest(strategy, params, path, options):
+    """Backtest one parameter set in a worker process. The parameters override the strategy's class attributes."""
+    manager_class = load_manager_class(strategy)
+    manager_class = type(manager_class.__name__, (manager_class,), dict(params))
+    options = dict(options)
+    latency = ConstantLatency(*options.pop('latency'))
+    queue_model = ProbQueueModel() if options.pop('queue_model') == 'prob' else RiskAverseQueueModel()
+    backtest = Backtest(manager_class, [path], latency=latency, queue_model=queue_model, **options)
+    return asyncio.run(backtest.run()).summary()
+
+
+def init_worker(log_level):
+    logging.getLogger().setLevel(log_level)
+
+
+class Sweep:
+    """Backtest many parameter sets of a strategy in a process pool.
+
+    The recording is unpacked once into a single uncompressed file that every worker maps read-only, so the market
+    data is shared through the page cache instead of being decompressed or copied per worker."""
+
+    def __init__(self, strategy, paths, param_sets, workers=None, sort='pnl', log_level=logging.WARNING, **options):
+        self.strategy = strategy
+        self.paths = paths
+        self.param_sets = param_sets
+        self.workers = workers or os.cpu_count()
+        self.sort = sort
+        self.log_level = log_level
+        self.options = options
+        self.options.setdefault('latency', (0.005, 0.005))
+        self.options.setdefault('queue_model', 'risk-averse')
+
+    def run(self, path=None):
+        """Run every parameter set and return the results ranked by `sort`, best first. The unpacked recording is
+           written to `path`, or to a temporary file removed afterwards."""
+        if path is None:
+            fd, shared = tempfile.mkstemp(suffix='.bfr')
+            os.close(fd)
+        else:
+            shared = path
+        try:
+            start = time.perf_counter()
+            count = write_records(read_records(self.paths), shared)
+            logging.info('Unpacked %d records to %s in %.1fs' % (count, shared, time.perf_counter() - start))
+            results = []
+            with ProcessPoolExecutor(self.workers, initializer=init_worker, initargs=(self.log_level,)) as executor:
+                futures = {executor.submit(run_backtest, self.strategy, params, shared, self.options): params
+                           for params in self.param_sets}
+                for i, future in enumerate(as_completed(futures), 1):
+                    params = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception:
+                        logging.warning('Backtest failed: %s' % params, exc_info=True)
+                        continue
+                    results.append((params, result))
+                    logging.info('%d/%d %s: %s=%s' % (i, len(futures), params, self.sort, result[self.sort]))
+        finally:
+            if path is None:
+                os.remove(shared)
+        results.sort(key=lambda item: item[1][self.sort], reverse=True)
+        return results
+
+
+def format_table(results, limit=None):
+    if not results:
+        return ''
+    names = list(results[0][0])
+    header = ['rank'] + names + COLUMNS
+    rows = []
+    for rank, (params, result) in enumerate(results[:limit], 1):
+        values = [params[name] for name in names] + [result[column] for column in COLUMNS]
+        rows.append([str(rank)] + ['%.6g' % value if isinstance(value, float) else str(value) for value in values])
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    return '\n'.join('  '.join(cell.rjust(width) for cell, width in zip(row, widths)) for row in [header] + rows)
+
+
+def write_csv(results, path):
+    names = list(results[0][0]) if results else []
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['rank'] + names + COLUMNS)
+        for rank, (params, result) in enumerate(results, 1):
+            writer.writerow([rank] + [params[name] for name in names] + [result[column] for column in COLUMNS])
+
+
+def parse_value(value):
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def parse_param(text):
+    """name=v1,v2,... for a list of values, name=low:high for a range (random search only)."""
+    name, values = text.split('=', 1)
+    if ':' in values:
+        low, high = values.split(':', 1)
+        return name, (parse_value(low), parse_value(high))
+    return name, [parse_value(value) for value in values.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backtest a grid or a random sample of strategy parameters.')
+    parser.add_argument('strategy', help='strategy module, e.g. tradingbot.gridtrading')
+    parser.add_argument('directory', help='recorder directory')
+    parser.add_argument('--param', action='append', default=[], type=parse_param,
+                        help='name=v1,v2,... or, with --random, name=low:high')
+    parser.add_argument('--random', type=int, metavar='N', help='sample N parameter sets instead of the full grid')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--sort', default='pnl', choices=COLUMNS)
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--csv', help='write the full ranked table to this file')
+    parser.add_argument('--symbol', default=settings.SYMBOL)
+    parser.add_argument('--tick-size', type=float, default=0.1)
+    parser.add_argument('--step-size', type=float, default=0.001)
+    parser.add_argument('--entry-latency', type=float, default=0.005)
+    parser.add_argument('--response-latency', type=float, default=0.005)
+    parser.add_argument('--queue-model', choices=['risk-averse', 'prob'], default='risk-averse')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    space = dict(args.param)
+    if args.random:
+        param_sets = random_search(space, args.random, args.seed)
+    else:
+        ranges = [name for name, values in space.items() if isinstance(values, tuple)]
+        if ranges:
+            parser.error('ranges need --random: %s' % ', '.join(ranges))
+        param_sets = grid(space)
+    sweep = Sweep(args.strategy, recorded_files(args.directory, args.symbol), param_sets, workers=args.workers,
+                  sort=args.sort, symbol=args.symbol, tick_size=args.tick_size, step_size=args.step_size,
+                  latency=(args.entry_latency, args.response_latency), queue_model=args.queue_model)
+    start = time.perf_counter()
+    results = sweep.run()
+    logging.info('%d backtests in %.1fs' % (len(results), time.perf_counter() - start))
+    print(format_table(results, args.top))
+    if args.csv:
+        write_csv(results, args.csv)
+
+
+if __name__ == '__main__':
+    main()
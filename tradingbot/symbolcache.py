@@ -0,0 +1,43 @@
+import logging
+import os
+import time
+
+from tradingbot.codec import json_dumps, json_loads
+
+
+class SymbolInfoCache:
+    """exchangeInfo symbol entries on disk, by endpoint and upper case symbol, so a restart does not wait for the
+       download of every symbol's information. Entries older than `ttl` seconds are stale: still usable, but due for
+       a refresh."""
+
+    def __init__(self, path, ttl=3600):
+        self.path = path
+        self.ttl = ttl
+
+    def load(self, base_url):
+        """(symbols, age in seconds) of the endpoint's entry, or (None, None) if there is none."""
+        try:
+            with open(self.path, 'rb') as f:
+                entry = json_loads(f.read()).get(base_url)
+        except (OSError, ValueError):
+            return None, None
+        if entry is None:
+            return None, None
+        return entry['symbols'], time.time() - entry['time']
+
+    def save(self, base_url, symbols):
+        """Store the symbols of the endpoint, replacing the file atomically."""
+        try:
+            with open(self.path, 'rb') as f:
+                entries = json_loads(f.read())
+        except (OSError, ValueError):
+            entries = {}
+        entries[base_url] = {'time': time.time(), 'symbols': symbols}
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp = '%s.%d.tmp' % (self.path, os.getpid())
+            with open(tmp, 'w') as f:
+                f.write(json_dumps(entries))
+            os.replace(tmp, self.path)
+        except OSError:
+            logging.warning('Cannot write the symbol information cache %s' % self.path, exc_info=True)
@@ -0,0 +1,107 @@
+import asyncio
+import itertools
+import logging
+import time
+
+import aiohttp
+from aiohttp import WSMsgType
+
+from tradingbot.codec import json_dumps, json_loads
+
+
+class WebSocketAPIError(Exception):
+    """Error response to a WebSocket API request."""
+
+    def __init__(self, status, code, msg):
+        super().__init__('%s %s: %s' % (status, code, msg))
+        self.status = status
+        self.code = code
+        self.msg = msg
+
+
+class WebSocketOrderEntry:
+    """Persistent, signed connection to the Binance Futures WebSocket API.
+
+    Requests are correlated with their responses by id, so any number of them can be in flight on the one connection.
+    The connection is opened on first use and reopened on the next request after it drops; requests in flight when it
+    drops fail with aiohttp.ClientConnectionError."""
+
+    def __init__(self, url, api_key, hmac, session, timeout=10, rate_limiter=None):
+        self.url = url
+        self.api_key = api_key
+        self.hmac = hmac
+        self.session = session
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.ws = None
+        self.pending = {}
+        self.ids = itertools.count(1)
+        self.reader = None
+        self.lock = asyncio.Lock()
+
+    async def connect(self):
+        if self.ws is not None:
+            return
+        # Concurrent requests share the same connection attempt.
+        async with self.lock:
+            if self.ws is not None:
+                return
+            self.ws = await self.session.ws_connect(self.url, heartbeat=30)
+            self.reader = asyncio.create_task(self.__read(self.ws))
+            logging.info('WS API Connected.')
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+        if self.reader is not None:
+            await self.reader
+
+    def sign(self, params):
+        """Add the API key, timestamp and signature; the payload is the parameters sorted by name."""
+        params['apiKey'] = self.api_key
+        params['timestamp'] = int(time.time() * 1000) - 1000
+        payload = '&'.join('%s=%s' % (key, params[key]) for key in sorted(params))
+        signature = self.hmac.copy()
+        signature.update(payload.encode('utf-8'))
+        params['signature'] = signature.hexdigest()
+        return params
+
+    async def request(self, method, params, signed=True):
+        await self.connect()
+        request_id = str(next(self.ids))
+        params = dict(params)
+        if signed:
+            self.sign(params)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        try:
+            await self.ws.send_str(json_dumps({'id': request_id, 'method': method, 'params': params}))
+            return await asyncio.wait_for(future, self.timeout)
+        finally:
+            self.pending.pop(request_id, None)
+
+    async def __read(self, ws):
+        try:
+            async for msg in ws:
+                if msg.type == WSMsgType.TEXT:
+                    response = json_loads(msg.data)
+                    if self.rate_limiter is not None and 'rateLimits' in response:
+                        self.rate_limiter.update_rate_limits(response['rateLimits'])
+                    future = self.pending.get(response.get('id'))
+                    if future is None or future.done():
+                        continue
+                    if response['status'] == 200:
+                        future.set_result(response['result'])
+                    else:
+                        error = response.get('error', {})
+                        future.set_exception(WebSocketAPIError(response['status'], error.get('code'), error.get('msg')))
+                elif msg.type == WSMsgType.ERROR:
+                    logging.warning('WS API Error: %s' % ws.exception())
+                    break
+        finally:
+            logging.info('WS API Disconnected.')
+            if self.ws is ws:
+                self.ws = None
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(aiohttp.ClientConnectionError('WebSocket API connection closed'))